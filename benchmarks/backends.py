@@ -0,0 +1,58 @@
+#-------------------------------------------------------------------------------------------
+# Benchmark: pdfminer vs pdfium backend on template probing and placeholder resolution
+#-------------------------------------------------------------------------------------------
+# run from repository root: python -m benchmarks.backends <pdf file> [<pdf file> ...]
+import sys
+import time
+import logging
+
+from hsbcpdf.helpers import backends
+from hsbcpdf.scraper import ScraperFactory
+
+
+def run(pdfpath, backend):
+    start = time.perf_counter()
+    pdf = backends.open_document(pdfpath, backend)
+    st = ScraperFactory.get_scraper(pdfpath, pdf)
+    st.match_template()
+    elapsed = time.perf_counter() - start
+    # did the pdfium run still need a full pdfminer layout
+    fallback = backends.layout_loaded(pdf.__dict__.get('_pdfquery')) if backend == backends.PDFIUM else False
+    return st, elapsed, fallback
+
+
+def same_graphics(pdfpath):
+    # pdfium line and rect boxes against pdfminer's layout of the same pages
+    miner = backends.open_document(pdfpath, backends.PDFMINER)
+    pdfium = backends.open_document(pdfpath, backends.PDFIUM)
+    for page in miner.tree.getroot():
+        ref = sorted(tuple(round(v, 2) for v in e.layout.bbox) for e in page.iter('LTLine', 'LTRect', 'LTCurve'))
+        res = sorted(tuple(round(v, 2) for v in e.bbox) for e in pdfium.graphics(int(page.get('page_index'))) if e.kind)
+        if ref != res:
+            return False
+    return True
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.ERROR)
+    print("{:50} {:28} {:>10} {:>10} {:>8} {:>6} {}".format('file', 'template', 'pdfminer', 'pdfium', 'layout', 'lines', 'same'))
+    for pdfpath in sys.argv[1:]:
+        res = {}
+        for backend in (backends.PDFMINER, backends.PDFIUM):
+            try:
+                res[backend] = run(pdfpath, backend)
+            except Exception as e:
+                res[backend] = (None, None, repr(e))
+        st, ref_time, _ = res[backends.PDFMINER]
+        alt, alt_time, fallback = res[backends.PDFIUM]
+        same = alt is not None and st is not None and type(alt) is type(st) \
+            and (alt.account_number, alt.st_date) == (st.account_number, st.st_date)
+        print("{:50} {:28} {:>10} {:>10} {:>8} {:>6} {}".format(
+            pdfpath[-50:],
+            f'{st.st_bank}.{st.st_type}' if st else '?',
+            f'{ref_time:.3f}s' if ref_time is not None else 'error',
+            f'{alt_time:.3f}s' if alt_time is not None else 'error',
+            'pdfminer' if fallback is True else '-' if fallback is False else fallback,
+            str(same_graphics(pdfpath)),
+            same
+        ))
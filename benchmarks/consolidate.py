@@ -0,0 +1,48 @@
+#-------------------------------------------------------------------------------------------
+# Benchmark: consolidate many processed statements in one DataFrame
+#-------------------------------------------------------------------------------------------
+# run from repository root: python -m benchmarks.consolidate [nb statements] [nb entries]
+import sys
+import time
+import datetime
+
+import pandas as pd
+
+from hsbcpdf.helpers.accountstatement import BaseStatement, Entries
+from hsbcpdf.helpers.batch import concat_statements
+
+
+def fake_statement(i, nb_entries):
+    st = BaseStatement(f'/statements/{i % 12:02d}/statement-{i}.pdf', pdf=object())
+    st.st_type = 'BANK'
+    st.account_number = f'123-{i % 25:06d}-001'
+    st.st_date = datetime.datetime(2010 + (i // 12) % 10, i % 12 + 1, 25)
+    st.merge_all()
+    for j in range(nb_entries):
+        st.statement['entries'].append(
+            account='HKDSavings' if j % 3 else 'FCYSavings',
+            post_date=st.st_date - datetime.timedelta(days=j % 28),
+            transaction_date=st.st_date - datetime.timedelta(days=j % 28),
+            description=f'PAYMENT {j % 40}',
+            currency='HKD' if j % 3 else 'USD',
+            amount=(j * 37 % 10000) / 100
+        )
+    return st
+
+
+if __name__ == "__main__":
+    nb_statements = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    nb_entries = int(sys.argv[2]) if len(sys.argv) > 2 else 30
+    statements = [fake_statement(i, nb_entries) for i in range(nb_statements)]
+
+    start = time.perf_counter()
+    legacy = pd.concat([st.get_df() for st in statements], ignore_index=True)
+    legacy_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    batch = concat_statements(statements)
+    batch_time = time.perf_counter() - start
+
+    print(f'{nb_statements} statements x {nb_entries} entries')
+    print(f'get_df + pd.concat : {legacy_time:8.3f}s {legacy.memory_usage(deep=True).sum() / 2**20:8.1f} MiB')
+    print(f'concat_statements  : {batch_time:8.3f}s {batch.memory_usage(deep=True).sum() / 2**20:8.1f} MiB')
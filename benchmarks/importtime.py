@@ -0,0 +1,41 @@
+#-------------------------------------------------------------------------------------------
+# Benchmark: import cost of hsbcpdf.scraper and of a probe-only run (python -X importtime)
+#-------------------------------------------------------------------------------------------
+# run from repository root: python -m benchmarks.importtime [<pdf file>]
+import sys
+import subprocess
+
+HEAVY = ['camelot', 'pandas', 'numpy', 'cv2']
+
+PROBE = """
+import sys
+from hsbcpdf.scraper import ScraperFactory
+st = ScraperFactory.get_scraper(sys.argv[1])
+print('matched', type(st).__module__, type(st).__name__, file=sys.stderr)
+print('heavy', ','.join(m for m in %r if m in sys.modules), file=sys.stderr)
+""" % HEAVY
+
+
+def importtime(code, *args):
+    res = subprocess.run([sys.executable, '-X', 'importtime', '-c', code, *args], capture_output=True, text=True)
+    total = 0
+    loaded = set()
+    for line in res.stderr.splitlines():
+        if line.startswith(('matched', 'heavy')):
+            print('   ', line)
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line.split('|')
+        # top level imports are the least indented ones
+        if not name.startswith('  '):
+            total += int(cumulative)
+        loaded.add(name.strip())
+    return total / 1e6, loaded
+
+
+if __name__ == "__main__":
+    total, loaded = importtime('import hsbcpdf.scraper')
+    print(f'import hsbcpdf.scraper : {total:.3f}s, heavy modules: {[m for m in HEAVY if m in loaded]}')
+    if len(sys.argv) > 1:
+        total, loaded = importtime(PROBE, sys.argv[1])
+        print(f'probe {sys.argv[1]} : {total:.3f}s of imports, heavy modules: {[m for m in HEAVY if m in loaded]}')
@@ -0,0 +1,59 @@
+#-------------------------------------------------------------------------------------------
+# Benchmark: pdfquery's default layout parameters vs the template LAParams profile
+#-------------------------------------------------------------------------------------------
+# run from repository root: python -m benchmarks.laparams <pdf file> [<pdf file> ...]
+# the full document is laid out with each profile, then the template placeholders are
+# resolved on it: 'same' tells whether every placeholder query gave the same result
+import sys
+import time
+import logging
+
+from hsbcpdf.helpers import backends
+from hsbcpdf.helpers.utils import Section, query_cache, get_page, _layout
+from hsbcpdf.scraper import ScraperFactory
+
+
+def _value(res):
+    if isinstance(res, Section):
+        return ('Section', res.page, round(res.yup, 3), round(res.ybot, 3))
+    if isinstance(res, str) or res is None:
+        return res
+    if hasattr(res, '__iter__'):
+        return tuple(_value(r) for r in res)
+    return (get_page(res), tuple(round(v, 3) for v in _layout(res).bbox))
+
+
+def run(pdfpath, laparams):
+    pdf = backends.open_document(pdfpath, backends.PDFMINER, laparams)
+    start = time.perf_counter()
+    pdf.tree
+    layout = time.perf_counter() - start
+    st = ScraperFactory.get_scraper(pdfpath, pdf)
+    st.match_template()
+    placeholders = {k: _value(v) for k, v in query_cache(pdf).results.items()}
+    return st, layout, placeholders
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.ERROR)
+    print("{:50} {:28} {:>10} {:>10} {:>8} {:>6} {}".format(
+        'file', 'template', 'default', 'profile', 'speedup', 'ph', 'same'))
+    for pdfpath in sys.argv[1:]:
+        try:
+            st, ref_time, ref = run(pdfpath, backends.DEFAULT_LAPARAMS)
+            alt, alt_time, res = run(pdfpath, type(st)._LAPARAMS)
+        except Exception as e:
+            print("{:50} {}".format(pdfpath[-50:], repr(e)))
+            continue
+        print("{:50} {:28} {:>10} {:>10} {:>8} {:>6} {}".format(
+            pdfpath[-50:],
+            f'{st.st_bank}.{st.st_type}',
+            f'{ref_time:.3f}s',
+            f'{alt_time:.3f}s',
+            f'{ref_time / alt_time:.2f}x',
+            len(ref),
+            type(alt) is type(st) and res == ref
+        ))
+        for k in sorted(set(ref) | set(res), key=repr):
+            if ref.get(k) != res.get(k):
+                print("    {}: {!r} != {!r}".format(k[0], ref.get(k), res.get(k)))
@@ -0,0 +1,42 @@
+#-------------------------------------------------------------------------------------------
+# Benchmark: full processing vs summary only processing (balances without entries)
+#-------------------------------------------------------------------------------------------
+# run from repository root: python -m benchmarks.summary <pdf file> [<pdf file> ...]
+import sys
+import time
+import logging
+
+from hsbcpdf.scraper import ScraperFactory
+
+
+def run(pdfpath, summary_only):
+    start = time.perf_counter()
+    st = ScraperFactory.get_scraper(pdfpath).process(summary_only=summary_only)
+    return st, time.perf_counter() - start
+
+
+def balances(st):
+    return st.statement['previous_balance'], st.statement['new_balance']
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.ERROR)
+    print("{:50} {:28} {:>10} {:>6} {:>10} {:>6} {:>8} {}".format(
+        'file', 'template', 'full', 'jobs', 'summary', 'jobs', 'speedup', 'same'))
+    for pdfpath in sys.argv[1:]:
+        try:
+            full, full_time = run(pdfpath, False)
+            summary, summary_time = run(pdfpath, True)
+        except Exception as e:
+            print("{:50} {}".format(pdfpath[-50:], repr(e)))
+            continue
+        print("{:50} {:28} {:>10} {:>6} {:>10} {:>6} {:>8} {}".format(
+            pdfpath[-50:],
+            f'{full.st_bank}.{full.st_type}',
+            f'{full_time:.3f}s',
+            full.table_jobs,
+            f'{summary_time:.3f}s',
+            summary.table_jobs,
+            f'{full_time / summary_time:.1f}x',
+            balances(full) == balances(summary)
+        ))
@@ -5,19 +5,25 @@ import logging
 import datetime
 
 
-import camelot
-import pandas as pd
 import os
 import json
-
-from pdfquery.cache import FileCache
-import pdfquery
-import pdfminer
+import time
 
 from .utils import *
+from .entries import Entries
+from . import backends
+from .registry import probe_format, probe_signature
+from .tables import read_tables, skipped_jobs, table_job, page_jobs
+from .templates import QueryPlan
+from .geometry import geometry_cache
+from .sources import as_source
 
 logger = logging.getLogger("hsbcpdf.helpers.accountstatements")
 
+# table extraction stack, only imported once a template extracts tables
+camelot = LazyModule('camelot')
+pd = LazyModule('pandas')
+
 class EnumSumAccountTypes:
     HKDSAVINGS = 'HKD Savings'
     HKDCURRENT = 'HKD Current'
@@ -34,6 +40,9 @@ class AccountTypes:
 class TableZone:
     __doc__ = "Find table zone and columns positions"
 
+    # leading chunks holding the previous balances (None: all of them), see BaseStatement.summary_only
+    summary_chunks = None
+
     class Chunk:
         def __init__(self, page, yup, ybot):
             self.page = page
@@ -49,7 +58,7 @@ class TableZone:
         self.chunks = []
         self.columns = None
         self.table = None
-        self.statement = {'previous_balance': {self.account: {}}, 'new_balance': {self.account: {}}, 'entries': []}
+        self.statement = {'previous_balance': {self.account: {}}, 'new_balance': {self.account: {}}, 'entries': Entries()}
         begin_page = section.page
         begin_yup = section.ybot
         end_page = section.next.page
@@ -66,7 +75,8 @@ class TableZone:
                 self.chunks.append(TableZone.Chunk(end_page, self.page_height, end_ybot))
         logger.debug("Section of account '{}' has {} chuncks".format(account, len(self.chunks)))
 
-    def get_tables_format(self, pdf):
+    def get_tables_format(self, pdf, geometry=None):
+        # geometry: (name, discover) resolver of cached geometry, see BaseStatement.resolve_geometry
         logger.debug("search table hearder for account '{}'".format(self.account))
         for c in self.chunks:
             # seek table header
@@ -85,38 +95,54 @@ class TableZone:
             logger.debug("search table hearder columns for account '{}' in page[{}] bbob[0, {}, {}, {}]".format(self.account, c.page, lower, self.page_width, upper))
             if self.columns is None:
                 # do it once as table format is same in each chunks
-                self.columns = []
-                vls = pdf.pq(
-                    f'LTPage[page_index="{c.page-1}"] LTLine[width="0.0"]:in_bbox("0, {lower}, {self.page_width}, {upper}")'
-                ).filter(lambda i: float(this.get('linewidth', 0)) < 1)
-                if len(vls) == 0:
-                    raise TemplateException("could not find Vertical lines of table header (page {} in bbox 0,{}, {}, {})".format(c.page,c.ybot, self.page_width, c.yup))
-                for vl in vls:
-                    self.columns.append(vl.layout.x0)
-                self.columns.sort()
+                discover = lambda: self._find_columns(pdf, c, lower, upper)
+                if geometry is None:
+                    self.columns = discover()[0]
+                else:
+                    self.columns = geometry('columns/{}'.format(self.account), discover)
                 logger.debug("found these ({}) columns from hearder {}".format(len(self.columns), self.columns))
 
-    def extract_tables(self, pdfpath):
+    def _find_columns(self, pdf, c, lower, upper):
+        # x of the separator vertical lines in header, and these lines
+        vls = pdf.pq(
+            f'LTPage[page_index="{c.page-1}"] LTLine[width="0.0"]:in_bbox("0, {lower}, {self.page_width}, {upper}")'
+        ).filter(lambda i: float(this.get('linewidth', 0)) < 1)
+        if len(vls) == 0:
+            raise TemplateException("could not find Vertical lines of table header (page {} in bbox 0,{}, {}, {})".format(c.page,c.ybot, self.page_width, c.yup))
+        return sorted(vl.layout.x0 for vl in vls), list(vls)
+
+    def table_jobs(self):
         cols = ','.join(map(str, self.columns))
+        jobs = []
         for c in self.chunks:
             logger.debug("process table in page[{}] bbox[0,{},{},{}] with columns[{}]".format(c.page, c.ybot, self.page_width, c.yup, cols))
-            tables = camelot.read_pdf(
-                        pdfpath,
-                        pages=str(c.page),
-                        flavor="stream",
-                        table_areas=[f'0, {c.yup}, {self.page_width}, {c.ybot}'],
-                        columns=[cols],
-                        split_text=True)
-            logger.debug('found tables: {} - {}'.format(tables[0].parsing_report, tables[0].shape))
+            jobs.append(table_job(
+                c.page,
+                table_areas=[f'0, {c.yup}, {self.page_width}, {c.ybot}'],
+                columns=[cols],
+                split_text=True))
+        return jobs
+
+    def load_tables(self, results):
+        # results of table_jobs, in chunks order; skipped chunks found no table
+        for tables in results:
+            if not tables:
+                continue
+            logger.debug('found tables: {}'.format(tables[0].shape))
             if self.table is None:
-                self.table = tables[0].df[1:]
+                self.table = tables[0][1:]
             else:
-                self.table = pd.concat([self.table, tables[0].df[1:]])
+                self.table = pd.concat([self.table, tables[0][1:]])
+        if self.table is None:
+            raise TemplateException("no table found in any of the {} chunks of section '{}'".format(len(results), self.account))
         logger.debug("the table:\n{}".format(self.table.to_string()))
         #camelot.plot(tables[0], kind='grid')
         #plt.show()
         self.clean_table()
 
+    def extract_tables(self, pdfpath):
+        self.load_tables(read_tables(pdfpath, self.table_jobs()))
+
     def clean_table(self):
         pass
 
@@ -151,6 +177,9 @@ class TableZone:
 
 
 class TableZoneHkd(TableZone):
+    # previous balance on the first row, new balance from the portfolio summary
+    summary_chunks = 1
+
     def clean_table(self):
         shape = self.table.shape
         logger.debug(shape)
@@ -186,14 +215,14 @@ class TableZoneHkd(TableZone):
             else:
                 continue
             new_balance += amount
-            self.statement['entries'].append({
-                'account': self.account,
-                'post_date': dt,
-                'transaction_date': dt,
-                'description': desc,
-                'currency': "HKD",
-                'amount': amount
-            })
+            self.statement['entries'].append(
+                account=self.account,
+                post_date=dt,
+                transaction_date=dt,
+                description=desc,
+                currency="HKD",
+                amount=amount
+            )
             desc = ""
         self.statement['new_balance'][self.account]['HKD'] = new_balance
         logger.debug(self.statement)
@@ -248,14 +277,14 @@ class TableZoneFcy(TableZone):
                 continue
 
             new_balance += amount
-            self.statement['entries'].append({
-                'post_date': dt,
-                'transaction_date': dt,
-                'account': self.account,
-                'description': desc,
-                'currency': ccy,
-                'amount': amount
-            })
+            self.statement['entries'].append(
+                post_date=dt,
+                transaction_date=dt,
+                account=self.account,
+                description=desc,
+                currency=ccy,
+                amount=amount
+            )
             desc = ""
         self.statement['new_balance'][self.account][ccy] = new_balance
         logger.debug(self.statement)
@@ -331,20 +360,29 @@ class BaseFactory:
 
     _scrapers = []
 
+    @classmethod
+    def pdf_backend(cls):
+        # a factory uses pdfium only when all its templates opted in
+        choices = {s._PDF_BACKEND for s in cls._scrapers}
+        return choices.pop() if len(choices) == 1 else backends.PDFMINER
+
+    @classmethod
+    def laparams(cls):
+        return backends.common_laparams(s._LAPARAMS for s in cls._scrapers)
+
     @classmethod
     def get_scraper(cls, pdfpath, pdf=None):
-        if not os.path.exists(pdfpath):
-            raise ScraperException(f'"{pdfpath}" file not found')
-        if not os.path.isfile(pdfpath):
-            raise ScraperException(f'"{pdfpath}" not a file')
-        pdf = pdfquery.PDFQuery(pdfpath)
-        #pdf = pdfquery.PDFQuery(pdfpath, laparams={'all_texts':True, 'detect_vertical':True, 'char_margin': 20})
-        pdf.load()
+        source = as_source(pdfpath)
+        opened = pdf is None
+        if opened:
+            pdf = backends.open_document(source, cls.pdf_backend(), cls.laparams())
 
         for s in cls._scrapers:
             if s.probe_bank(pdf) and s.probe_type(pdf):
                 logger.debug("pdf file matches {}.{}".format(s.st_bank, s.st_type))
-                return s(pdfpath, pdf)
+                if opened and s._PDF_BACKEND != backends.backend_name(pdf):
+                    pdf = backends.open_document(source, s._PDF_BACKEND, s._LAPARAMS, fallback=pdf)
+                return s(source, pdf)
 
 
 class BaseStatement:
@@ -352,47 +390,46 @@ class BaseStatement:
     _STATEMENT_FORMAT = None
     _BANK_SIGNATURE = []
     _TYPE_SIGNATURE = []
+    # 'pdfium' once placeholders are checked to resolve the same as with pdfminer
+    _PDF_BACKEND = backends.PDFMINER
+    # pdfminer layout parameters (LAParams keywords), None: pdfquery's defaults; see benchmarks/laparams.py
+    _LAPARAMS = None
 
     st_bank = None
     st_type = None
+    # boilerplate pages (1-based) left out of layout and table extraction
+    skip_pages = frozenset()
+    # camelot jobs run and skipped, and time spent in the ones run
+    table_jobs = 0
+    tables_skipped = 0
+    table_seconds = 0.
+    # balances only: table jobs not holding them are skipped, entries are left empty
+    summary_only = False
 
     @classmethod
     def probe_bank(cls, pdf):
-        if cls._STATEMENT_FORMAT:
-            twidth, theight = cls._STATEMENT_FORMAT
-            page = pdf.get_page(0)
-            dwidth, dheight = page.mediabox[2:]
-            if round(dwidth, 0) !=  twidth or round(dheight, 0) !=  theight:
-                logger.debug("document size do not fit: [{},{}] vs [{}, {}]".format(
-                    round(dwidth, 0),
-                    round(dheight, 0),
-                    twidth,
-                    theight
-                ))
-                return False
-        for elem in cls._BANK_SIGNATURE:
-            if len(elem.querys(pdf)) == 0:
-                logger.debug("pdf file does not matches bank {}".format(cls.st_bank))
-                return False
+        if not probe_format(pdf, cls._STATEMENT_FORMAT) or not probe_signature(pdf, cls._BANK_SIGNATURE):
+            logger.debug("pdf file does not matches bank {}".format(cls.st_bank))
+            return False
         logger.debug("pdf file matches bank {}".format(cls.st_bank))
         return True
 
     @classmethod
     def probe_type(cls, pdf):
-        for elem in cls._TYPE_SIGNATURE:
-            if len(elem.querys(pdf)) == 0:
-                logger.debug("pdf file does not matches type {}".format(cls.st_type))
-                return False
+        if not probe_signature(pdf, cls._TYPE_SIGNATURE):
+            logger.debug("pdf file does not matches type {}".format(cls.st_type))
+            return False
         logger.debug("pdf file matches type {}".format(cls.st_type))
         return True
 
     def __init__(self, pdfpath, pdf = None):
         self.logger = logging.getLogger("hsbcpdf.helpers.basestatement")
-        self.pdfpath = pdfpath
+        self.source = as_source(pdfpath)
+        # file path, or name of the archive member / stream the statement was read from
+        self.pdfpath = self.source.name
         self.pdf = pdf
         if self.pdf is None:
-            self.pdf = pdfquery.PDFQuery(pdfpath)
-            self.pdf.load()
+            self.pdf = backends.open_document(self.source, self._PDF_BACKEND, self._LAPARAMS)
 
         self.page_height = None
         self.page_width = None
@@ -400,12 +437,59 @@ class BaseStatement:
         self.account_number = None
         self.st_date = None
 
+    # only the results cross process boundaries: document and layout objects are dropped
+    _PICKLED = ('pdfpath', 'page_height', 'page_width', 'nb_pages', 'account_number', 'st_date', 'statement',
+                'summary_only')
+
+    def __getstate__(self):
+        return {k: v for k, v in self.__dict__.items() if k in self._PICKLED}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.logger = logging.getLogger("hsbcpdf.helpers.basestatement")
+        self.pdf = None
+        self.source = None
+
+    def filepath(self):
+        # for the tools only reading from disk (camelot): in memory sources are spooled once
+        return self.source.path()
+
+    def read_tables(self, jobs, summary=None):
+        # summary: indexes of the jobs holding the balances in summary only mode, first and last by default
+        jobs = list(jobs)
+        if not self.summary_only:
+            return self._read_tables(jobs)
+        keep = {0, len(jobs) - 1} if summary is None else set(summary)
+        done = iter(self._read_tables([j for i, j in enumerate(jobs) if i in keep]))
+        return [next(done) if i in keep else [] for i in range(len(jobs))]
+
+    def _read_tables(self, jobs):
+        skipped = sum(skipped_jobs(jobs, self.skip_pages))
+        start = time.perf_counter()
+        res = read_tables(self.filepath(), jobs, skip_pages=self.skip_pages)
+        self.table_seconds += time.perf_counter() - start
+        self.table_jobs += len(jobs) - skipped
+        self.tables_skipped += skipped
+        return res
+
+    def resolve_geometry(self, name, discover):
+        # table geometry cached per account, discover() -> (value, lines it was found from)
+        cache = geometry_cache()
+        if cache is None:
+            return discover()[0]
+        return cache.resolve(self, name, discover)
+
+    @classmethod
+    def query_plan(cls):
+        if '_query_plan' not in cls.__dict__:
+            cls._query_plan = QueryPlan.of(cls)
+        return cls._query_plan
+
     def match_template(self):
+        # resolve the template placeholders in one pass per page, header boxes first without layout
+        self.query_plan().resolve(self.pdf)
         # get file pages format
-        p = self.pdf.pq('LTPage[page_index="0"]')[0]
-        self.page_height = p.layout.height
-        self.page_width = p.layout.width
-        self.nb_pages = self.pdf.doc.catalog['Pages'].resolve()['Count']
+        self.page_width, self.page_height, self.nb_pages = backends.page_format(self.pdf)
         self.logger.debug("page format: WxH = {}x{}".format(
             self.page_width,
             self.page_height
@@ -424,18 +508,38 @@ class BaseStatement:
             'statement_date': self.st_date,
             'previous_balance': {},
             'new_balance': {},
-            'entries': []
+            'entries': Entries()
         }
 
-    def process(self):
+    def process(self, known=None, progress=None, summary_only=False):
+        # known(st): tells from the header fields whether the statement was already ingested
+        # progress(st, stage): called before each stage, for the supervisor of a batch
+        # summary_only: balances without the entries, from the fewest tables the template allows
+        progress = progress or (lambda st, stage: None)
+        progress(self, 'match_template')
         self.match_template()
+        if known is not None and known(self):
+            raise DuplicateException("statement {} of {} already ingested".format(
+                self.account_number,
+                self.st_date.strftime('%Y-%m-%d') if self.st_date is not None else None
+            ))
+        self.summary_only = summary_only
+        progress(self, 'extract_tables')
         self.extract_tables()
-        self.check_consistency()
+        if not summary_only:
+            # entries are incomplete otherwise
+            progress(self, 'check_consistency')
+            self.check_consistency()
+        progress(self, 'merge_all')
         self.merge_all()
+        if summary_only:
+            self.statement['entries'] = Entries()
+        self.logger.debug("placeholder queries (hits, misses): {}".format(query_cache(self.pdf).stats()))
         return self
 
     def get_df(self):
-        df = pd.DataFrame(self.statement['entries'])
+        # same dtypes as a frame of entry records: object strings, datetime64[ns] dates
+        df = self.statement['entries'].to_df(compact=False)
         df['st_date'] = self.st_date
         df['main_account'] = self.account_number
         df['file_path'] = self.pdfpath
@@ -445,5 +549,7 @@ class BaseStatement:
         def myconverter(o):
             if isinstance(o, datetime.datetime):
                 return o.strftime("%d/%m/%Y")
+            if isinstance(o, Entries):
+                return list(o.records())
 
         return json.dumps(self.statement, default = myconverter)
@@ -0,0 +1,373 @@
+# -----------------------------------------------------------------------------
+# PDF backends feeding the placeholder queries
+#
+# pdfminer (through pdfquery) remains the reference backend. A template can
+# opt into pdfium (_PDF_BACKEND = 'pdfium') which provides text lines and
+# graphic primitives natively; pdfquery is then only loaded for the features
+# pdfium can't provide (pyquery selectors used directly by templates, camelot
+# still parses the file on its own).
+
+import abc
+import logging
+import ctypes
+import time
+
+import pdfquery
+from pdfminer.converter import PDFPageAggregator
+from pdfminer.layout import LAParams, LTChar, LTFigure, LTTextLineHorizontal
+from pdfminer.pdfinterp import PDFPageInterpreter, PDFResourceManager
+from pdfminer.pdftypes import resolve1
+
+from .sources import FileSource, as_source
+
+logger = logging.getLogger("hsbcpdf.helpers.backends")
+
+PDFMINER = 'pdfminer'
+PDFIUM = 'pdfium'
+
+# pdfquery's default layout parameters (LAParams keywords)
+DEFAULT_LAPARAMS = {'all_texts': True, 'detect_vertical': True}
+# text lines and graphics only: text boxes are not grouped in a hierarchy (boxes_flow), no query uses it
+LINES_LAPARAMS = dict(DEFAULT_LAPARAMS, boxes_flow=None)
+
+
+class Element:
+    __doc__ = "Backend neutral layout element, shaped like a pdfquery element's layout"
+
+    def __init__(self, page_number, x0, y0, x1, y1, text=None, kind=None, linewidth=0.):
+        self.page_number = page_number
+        self.x0 = x0
+        self.y0 = y0
+        self.x1 = x1
+        self.y1 = y1
+        self.text = text
+        self.kind = kind
+        self.linewidth = linewidth
+
+    @property
+    def layout(self):
+        return self
+
+    @property
+    def width(self):
+        return self.x1 - self.x0
+
+    @property
+    def height(self):
+        return self.y1 - self.y0
+
+    @property
+    def bbox(self):
+        return self.x0, self.y0, self.x1, self.y1
+
+    def get_text(self):
+        return self.text
+
+    def in_bbox(self, xleft, ybot, xright, ytop):
+        return self.x0 >= xleft and self.y0 >= ybot and self.x1 <= xright and self.y1 <= ytop
+
+    def __repr__(self):
+        return "<{} p{} {:.3f},{:.3f},{:.3f},{:.3f}{}>".format(
+            self.kind or 'text',
+            self.page_number,
+            self.x0, self.y0, self.x1, self.y1,
+            f' {self.text!r}' if self.text is not None else ''
+        )
+
+
+class LazyPDFQuery(pdfquery.PDFQuery):
+    __doc__ = "PDFQuery document laid out on first access to its tree"
+
+    # pages (1-based) left out of the layout, see boilerplate.BoilerplateFilter
+    skip_pages = frozenset()
+    layout_pages = 0
+    layout_seconds = 0.
+
+    @property
+    def tree(self):
+        if self._tree is None:
+            self._layout()
+        return self._tree
+
+    @tree.setter
+    def tree(self, value):
+        self._tree = value
+
+    @property
+    def pq(self):
+        if self._pq is None:
+            self._layout()
+        return self._pq
+
+    @pq.setter
+    def pq(self, value):
+        self._pq = value
+
+    def _layout(self):
+        start = time.perf_counter()
+        count = page_count(self)
+        pages = [n for n in range(count) if n + 1 not in self.skip_pages]
+        if self.skip_pages and pages:
+            logger.debug("layout of {} pages out of {}".format(len(pages), count))
+            self.load(pages)
+        else:
+            logger.debug("layout of full document")
+            self.load()
+        self.layout_pages = len(pages) if pages else count
+        self.layout_seconds = time.perf_counter() - start
+
+
+def layout_loaded(pdf):
+    if isinstance(pdf, LazyPDFQuery):
+        return bool(pdf.__dict__.get('_tree') is not None)
+    return getattr(pdf, 'tree', None) is not None
+
+
+class PageText:
+    __doc__ = "Text lines of single pages grouped from characters, without document layout"
+
+    def __init__(self, pdf, laparams=None):
+        self.pdf = pdf
+        # same grouping parameters as pdfquery's default layout
+        self.laparams = laparams or LAParams(all_texts=True, detect_vertical=True)
+        rsrcmgr = PDFResourceManager()
+        self.device = PDFPageAggregator(rsrcmgr, laparams=None)
+        self.interpreter = PDFPageInterpreter(rsrcmgr, self.device)
+        self._lines = {}
+
+    def _group(self, container):
+        chars = [o for o in container if isinstance(o, LTChar)]
+        lines = [l for l in container.group_objects(self.laparams, chars)
+                 if isinstance(l, LTTextLineHorizontal) and not l.is_empty()]
+        if self.laparams.all_texts:
+            for o in container:
+                if isinstance(o, LTFigure):
+                    lines += self._group(o)
+        return lines
+
+    def text_lines(self, page_index):
+        if page_index not in self._lines:
+            self.interpreter.process_page(self.pdf.get_page(page_index))
+            self._lines[page_index] = self._group(self.device.get_result())
+        return self._lines[page_index]
+
+
+def bbox_text_lines(pdf, page, bbox):
+    """
+    Text lines of a page fully inside bbox (xleft, ybot, xright, ytop), page is 1 based.
+    Uses the native backend or the already built layout when available, otherwise
+    groups characters of that single page only.
+    """
+    backend = native_backend(pdf)
+    if backend is not None:
+        return [l for l in backend.text_lines(page - 1) if l.in_bbox(*bbox)]
+    if layout_loaded(pdf):
+        lines = []
+        for p in pdf.tree.getroot():
+            if p.get('page_index') == str(page - 1):
+                lines = [e.layout for e in p.iter('LTTextLineHorizontal')]
+                break
+    else:
+        if '_hsbcpdf_page_text' not in pdf.__dict__:
+            pdf._hsbcpdf_page_text = PageText(pdf)
+        lines = pdf._hsbcpdf_page_text.text_lines(page - 1)
+    # pdfquery compares rounded coordinates in its in_bbox selector
+    xleft, ybot, xright, ytop = bbox
+    return [
+        l for l in lines
+        if round(l.x0, 3) >= xleft and round(l.y0, 3) >= ybot and round(l.x1, 3) <= xright and round(l.y1, 3) <= ytop
+    ]
+
+
+class PdfBackend(abc.ABC):
+    __doc__ = "Native document access used by the placeholder queries"
+
+    name = None
+
+    @abc.abstractmethod
+    def page_count(self):
+        """number of pages"""
+
+    @abc.abstractmethod
+    def page_size(self, page_index):
+        """(width, height) of a page"""
+
+    @abc.abstractmethod
+    def text_lines(self, page_index):
+        """Elements of the text lines of a page"""
+
+    @staticmethod
+    def _path_bbox(obj, segments):
+        # bounds of the path points as pdfminer gives them: pdfium's object bounds
+        # are padded with the stroke (unscaled by the matrix), flat rules would not be flat
+        import pypdfium2.raw as pdfium_c
+
+        if segments <= 0:
+            return obj.get_pos()
+        m = pdfium_c.FS_MATRIX()
+        pdfium_c.FPDFPageObj_GetMatrix(obj.raw, ctypes.byref(m))
+        x, y = ctypes.c_float(), ctypes.c_float()
+        xs, ys = [], []
+        bezier = 0
+        for i in range(segments):
+            segment = pdfium_c.FPDFPath_GetPathSegment(obj.raw, i)
+            if pdfium_c.FPDFPathSegment_GetType(segment) == pdfium_c.FPDF_SEGMENT_BEZIERTO:
+                # control points, then the end point of the curve: pdfminer only keeps the latter
+                bezier += 1
+                if bezier % 3:
+                    continue
+            pdfium_c.FPDFPathSegment_GetPoint(segment, ctypes.byref(x), ctypes.byref(y))
+            xs.append(m.a * x.value + m.c * y.value + m.e)
+            ys.append(m.b * x.value + m.d * y.value + m.f)
+        return min(xs), min(ys), max(xs), max(ys)
+
+    @abc.abstractmethod
+    def graphics(self, page_index):
+        """Elements of the lines, rects and curves of a page"""
+
+    def pages(self, page=None):
+        # page is 1 based as in templates, None means every pages
+        return [page - 1] if page else range(self.page_count())
+
+
+class PdfiumDocument(PdfBackend):
+    __doc__ = "pdfium backend, pdfquery document loaded on demand for anything else"
+
+    name = PDFIUM
+    # horizontal gap (in line heights) under which pdfium text runs are merged in a line
+    CHAR_MARGIN = 2.0
+
+    def __init__(self, source, pdf=None, laparams=None):
+        import pypdfium2
+
+        self.source = source
+        # of the pdfquery document loaded on demand
+        self.laparams = laparams or DEFAULT_LAPARAMS
+        self._doc = pypdfium2.PdfDocument(source.path() if isinstance(source, FileSource) else source.data())
+        self._pdfquery = pdf
+        self._lines = {}
+        self._graphics = {}
+
+    def __getattr__(self, name):
+        # only reached for attributes pdfium does not provide: fall back on pdfquery
+        if name.startswith('_'):
+            raise AttributeError(name)
+        pdf = self.__dict__.get('_pdfquery')
+        if pdf is None:
+            logger.debug("fallback on pdfminer for '{}'".format(name))
+            pdf = self._pdfquery = LazyPDFQuery(self.source.open(), laparams=self.laparams)
+        return getattr(pdf, name)
+
+    def page_count(self):
+        return len(self._doc)
+
+    def page_size(self, page_index):
+        return self._doc[page_index].get_size()
+
+    def text_lines(self, page_index):
+        if page_index not in self._lines:
+            textpage = self._doc[page_index].get_textpage()
+            runs = []
+            for i in range(textpage.count_rects()):
+                x0, y0, x1, y1 = textpage.get_rect(i)
+                runs.append([x0, y0, x1, y1, textpage.get_text_bounded(x0, y0, x1, y1)])
+            self._lines[page_index] = [
+                Element(page_index + 1, x0, y0, x1, y1, text=text.strip())
+                for x0, y0, x1, y1, text in self._merge_runs(runs)
+            ]
+        return self._lines[page_index]
+
+    def _merge_runs(self, runs):
+        # pdfium splits lines on font changes, group runs the way pdfminer builds text lines
+        runs.sort(key=lambda r: (-r[3], r[0]))
+        lines = []
+        for run in runs:
+            for line in lines:
+                overlap = min(line[3], run[3]) - max(line[1], run[1])
+                height = max(line[3] - line[1], run[3] - run[1])
+                if overlap > height / 2 and 0 <= run[0] - line[2] <= self.CHAR_MARGIN * height:
+                    line[2] = max(line[2], run[2])
+                    line[1] = min(line[1], run[1])
+                    line[3] = max(line[3], run[3])
+                    line[4] = line[4].rstrip() + ' ' + run[4]
+                    break
+            else:
+                lines.append(run)
+        return lines
+
+    def graphics(self, page_index):
+        if page_index not in self._graphics:
+            import pypdfium2.raw as pdfium_c
+
+            res = []
+            for obj in self._doc[page_index].get_objects(filter=[pdfium_c.FPDF_PAGEOBJ_PATH]):
+                width = ctypes.c_float()
+                pdfium_c.FPDFPageObj_GetStrokeWidth(obj.raw, ctypes.byref(width))
+                fillmode, stroke = ctypes.c_int(), ctypes.c_int()
+                pdfium_c.FPDFPath_GetDrawMode(obj.raw, ctypes.byref(fillmode), ctypes.byref(stroke))
+                linewidth = width.value if stroke.value else 0.
+                segments = pdfium_c.FPDFPath_CountSegments(obj.raw)
+                x0, y0, x1, y1 = self._path_bbox(obj, segments)
+                kind = 'line' if segments == 2 else 'rect' if segments in (4, 5) else 'curve'
+                res.append(Element(page_index + 1, x0, y0, x1, y1, kind=kind, linewidth=linewidth))
+            self._graphics[page_index] = res
+        return self._graphics[page_index]
+
+
+def pdfminer_document(pdf):
+    # pdfquery document of pdf, also behind the pdfium backend
+    backend = native_backend(pdf)
+    if backend is not None:
+        backend.doc
+        return backend._pdfquery
+    return pdf
+
+
+def native_backend(pdf):
+    return pdf if isinstance(pdf, PdfBackend) else None
+
+
+def open_document(pdfpath, backend=PDFMINER, laparams=None, fallback=None):
+    # path or any statement source (bytes, stream, archive member), laparams: pdfquery's defaults if None
+    # fallback: pdfquery document of the source already opened (for probing), reused by pdfium
+    source = as_source(pdfpath)
+    if backend == PDFIUM:
+        return PdfiumDocument(source, fallback, laparams=laparams)
+    # laid out on first query needing it
+    return LazyPDFQuery(source.open(), laparams=laparams or DEFAULT_LAPARAMS)
+
+
+def common_laparams(profiles):
+    # layout parameters all templates agree on, None (pdfquery's defaults) otherwise
+    profiles = list(profiles)
+    keys = {tuple(sorted((p or DEFAULT_LAPARAMS).items())) for p in profiles}
+    return dict(keys.pop()) if len(keys) == 1 else None
+
+
+def backend_name(pdf):
+    backend = native_backend(pdf)
+    return backend.name if backend is not None else PDFMINER
+
+
+def page_count(pdf):
+    backend = native_backend(pdf)
+    if backend is not None:
+        return backend.page_count()
+    return resolve1(resolve1(pdf.doc.catalog['Pages'])['Count'])
+
+
+def page_format(pdf):
+    # (width, height, nb pages) of the document
+    backend = native_backend(pdf)
+    if backend is not None:
+        width, height = backend.page_size(0)
+        return width, height, backend.page_count()
+    nb_pages = page_count(pdf)
+    if layout_loaded(pdf):
+        p = pdf.pq('LTPage[page_index="0"]')[0]
+        return p.layout.width, p.layout.height, nb_pages
+    page = pdf.get_page(0)
+    x0, y0, x1, y1 = page.mediabox
+    if page.rotate % 180:
+        return abs(y1 - y0), abs(x1 - x0), nb_pages
+    return abs(x1 - x0), abs(y1 - y0), nb_pages
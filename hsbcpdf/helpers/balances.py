@@ -0,0 +1,191 @@
+# -----------------------------------------------------------------------------
+# Balance chain across statements
+#
+# check_consistency validates a statement on its own. A BalanceChain keeps,
+# in a SQLite file, the previous and new balance of each account and currency
+# by statement date, so that a new statement is checked against its
+# neighbours only: its previous balance must be the new balance of the
+# statement before it, its new balance the previous balance of the one after
+# it (statements can arrive in any order, they are spliced in the chain).
+#
+#   chain = BalanceChain("balances.db")
+#   for issue in chain.add(st):
+#       print(issue)
+#   print(chain.report())     # mismatches and missing months of the archive
+
+import logging
+import sqlite3
+from decimal import Decimal
+
+from .entries import Entries
+
+logger = logging.getLogger("hsbcpdf.helpers.balances")
+
+MISMATCH = 'mismatch'
+GAP = 'gap'
+
+# balances are stored in millionths whatever the decimals of their currency
+SCALE = Entries.MAX_SCALE
+CENT = Decimal('0.01')
+
+
+def _minor(amount):
+    # exact decimal value of the scraped float, not its binary one
+    return None if amount is None else int((Decimal(str(amount)) * SCALE).to_integral_value())
+
+
+def _format(minor):
+    if minor is None:
+        return '-'
+    amount = Decimal(minor) / SCALE
+    return '{:.2f}'.format(amount) if amount == amount.quantize(CENT) else str(amount.normalize())
+
+
+def _month(st_date):
+    year, month = int(st_date[:4]), int(st_date[5:7])
+    return year * 12 + month
+
+
+class ChainIssue:
+    __doc__ = "Break in the balance chain of an account and currency between two statement dates"
+
+    def __init__(self, kind, main_account, account, currency, before, after, expected=None, found=None):
+        self.kind = kind
+        self.main_account = main_account
+        self.account = account
+        self.currency = currency
+        # statement dates (YYYY-MM-DD) on both sides of the break
+        self.before = before
+        self.after = after
+        # in millionths (SCALE): new balance before, previous balance after
+        self.expected = expected
+        self.found = found
+
+    def __repr__(self):
+        if self.kind == GAP:
+            return "<ChainIssue gap {} {} {}: {} -> {}>".format(
+                self.main_account, self.account, self.currency, self.before, self.after)
+        return "<ChainIssue mismatch {} {} {}: {} -> {} expected {} found {}>".format(
+            self.main_account, self.account, self.currency, self.before, self.after,
+            _format(self.expected), _format(self.found))
+
+
+class BalanceChain:
+    __doc__ = "Persistent per account and currency chain of statement balances"
+
+    SCHEMA = """CREATE TABLE IF NOT EXISTS balances (
+        main_account TEXT NOT NULL,
+        account TEXT NOT NULL,
+        currency TEXT NOT NULL,
+        st_date TEXT NOT NULL,
+        previous_balance INTEGER,
+        new_balance INTEGER,
+        file_path TEXT,
+        PRIMARY KEY (main_account, account, currency, st_date)
+    ) WITHOUT ROWID"""
+    PREVIOUS = """SELECT st_date, new_balance FROM balances
+        WHERE main_account = ? AND account = ? AND currency = ? AND st_date < ? ORDER BY st_date DESC LIMIT 1"""
+    NEXT = """SELECT st_date, previous_balance FROM balances
+        WHERE main_account = ? AND account = ? AND currency = ? AND st_date > ? ORDER BY st_date LIMIT 1"""
+    # consecutive statements of each chain
+    LINKS = """SELECT main_account, account, currency,
+            LAG(st_date) OVER chain, LAG(new_balance) OVER chain, st_date, previous_balance
+        FROM balances {}
+        WINDOW chain AS (PARTITION BY main_account, account, currency ORDER BY st_date)"""
+
+    def __init__(self, path=':memory:', period_months=1):
+        self.path = str(path)
+        # months between two statements of an account, more is reported as a gap
+        self.period_months = period_months
+        self.connection = sqlite3.connect(self.path)
+        if self.path != ':memory:':
+            self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute(BalanceChain.SCHEMA)
+        self.connection.commit()
+
+    @staticmethod
+    def links(st):
+        # (account, currency) -> (previous, new) balance in millionths
+        res = {}
+        for which, balances in enumerate((st.statement['previous_balance'], st.statement['new_balance'])):
+            for account, amounts in balances.items():
+                for currency, amount in amounts.items():
+                    res.setdefault((account, currency), [None, None])[which] = _minor(amount)
+        return res
+
+    def _check(self, kind, main_account, account, currency, before, after, expected, found):
+        if kind == GAP:
+            if _month(after) - _month(before) > self.period_months:
+                return ChainIssue(GAP, main_account, account, currency, before, after)
+        elif expected is not None and found is not None and expected != found:
+            return ChainIssue(MISMATCH, main_account, account, currency, before, after, expected, found)
+        return None
+
+    def add(self, st):
+        """
+        Splice the balances of a processed statement in the chain and give
+        back the issues with its neighbours (two indexed lookups per account
+        and currency, history is never loaded).
+        """
+        main_account = st.statement.get('main_account')
+        st_date = st.statement.get('statement_date')
+        if main_account is None or st_date is None:
+            # nowhere in a chain, the rest of the batch is still added
+            logger.warning("{}: not added to the balance chain, no {}".format(
+                st.pdfpath, 'statement date' if main_account is not None else 'main account'))
+            return []
+        st_date = st_date.strftime('%Y-%m-%d')
+        issues = []
+        rows = []
+        for (account, currency), (previous, new) in BalanceChain.links(st).items():
+            key = (main_account, account, currency)
+            before = self.connection.execute(BalanceChain.PREVIOUS, key + (st_date,)).fetchone()
+            if before is not None:
+                issues.append(self._check(MISMATCH, *key, before[0], st_date, before[1], previous))
+                issues.append(self._check(GAP, *key, before[0], st_date, None, None))
+            after = self.connection.execute(BalanceChain.NEXT, key + (st_date,)).fetchone()
+            if after is not None:
+                issues.append(self._check(MISMATCH, *key, st_date, after[0], new, after[1]))
+                issues.append(self._check(GAP, *key, st_date, after[0], None, None))
+            rows.append(key + (st_date, previous, new, str(st.pdfpath)))
+        with self.connection:
+            self.connection.executemany('INSERT OR REPLACE INTO balances VALUES (?, ?, ?, ?, ?, ?, ?)', rows)
+        issues = [i for i in issues if i is not None]
+        for i in issues:
+            logger.info("{}: {}".format(st.pdfpath, i))
+        return issues
+
+    def issues(self, main_account=None):
+        # every break of the stored chains, in account and date order
+        where, params = ('WHERE main_account = ?', (main_account,)) if main_account is not None else ('', ())
+        res = []
+        for acc, account, currency, before, expected, after, found in self.connection.execute(
+                BalanceChain.LINKS.format(where), params):
+            if before is None:
+                continue
+            for kind in (MISMATCH, GAP):
+                issue = self._check(kind, acc, account, currency, before, after, expected, found)
+                if issue is not None:
+                    res.append(issue)
+        return res
+
+    def report(self, main_account=None):
+        issues = self.issues(main_account)
+        lines = ['{:<9} {:<24} {:<14} {:<4} {:<10} {:<10} {:>14} {:>14}'.format(
+            'issue', 'main account', 'account', 'ccy', 'before', 'after', 'expected', 'found')]
+        for i in issues:
+            lines.append('{:<9} {:<24} {:<14} {:<4} {:<10} {:<10} {:>14} {:>14}'.format(
+                i.kind, i.main_account, i.account, i.currency, i.before, i.after,
+                _format(i.expected),
+                _format(i.found)
+            ))
+        return '\n'.join(lines) + '\n'
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -0,0 +1,64 @@
+# -----------------------------------------------------------------------------
+# Batch helpers working on many processed statements
+
+import logging
+
+from .utils import LazyModule
+from .entries import Entries
+
+logger = logging.getLogger("hsbcpdf.helpers.batch")
+
+np = LazyModule('numpy')
+pd = LazyModule('pandas')
+pa = LazyModule('pyarrow', extra='parquet')
+
+
+def concat_statements(statements):
+    """
+    Build one DataFrame holding the entries of all given processed statements,
+    same columns as BaseStatement.get_df but allocated once, with categorical
+    account, currency and statement columns and datetime64[s] dates.
+    """
+    statements = list(statements)
+    entries = Entries.concat([st.statement['entries'] for st in statements])
+    counts = np.array([len(st.statement['entries']) for st in statements], dtype=np.int64)
+    # statement level values are repeated through codes instead of copied per row
+    stidx = np.repeat(np.arange(len(statements), dtype=np.int32), counts)
+
+    df = entries.to_df()
+    st_dates = np.array([st.st_date for st in statements], dtype='datetime64[s]')
+    df['st_date'] = st_dates[stidx]
+    for col, values in (
+            ('main_account', [st.account_number for st in statements]),
+            ('file_path', [str(st.pdfpath) for st in statements])):
+        cat = pd.Categorical(values)
+        df[col] = pd.Categorical.from_codes(cat.codes[stidx], categories=cat.categories)
+    logger.debug("consolidated {} statements in {} rows ({} bytes)".format(
+        len(statements),
+        len(df),
+        df.memory_usage(deep=True).sum()
+    ))
+    return df
+
+
+def concat_arrow(statements):
+    """
+    Arrow counterpart of concat_statements: the entries tables of the
+    statements (Entries.to_arrow) become the chunks of one table, without
+    concatenating their buffers. Statement level columns are dictionary
+    encoded.
+    """
+    tables = []
+    for st in statements:
+        table = st.statement['entries'].to_arrow()
+        n = table.num_rows
+        zeros = pa.array(np.zeros(n, dtype=np.int32))
+        table = table.append_column('st_date', pa.array(np.full(n, st.st_date, dtype='datetime64[s]'), from_pandas=True))
+        for col, value in (('main_account', st.account_number), ('file_path', str(st.pdfpath))):
+            table = table.append_column(col, pa.DictionaryArray.from_arrays(zeros, pa.array([value], type=pa.string())))
+        tables.append(table)
+    if not tables:
+        return None
+    res = pa.concat_tables(tables)
+    logger.debug("consolidated {} statements in {} rows, {} chunks".format(len(tables), res.num_rows, res.column(0).num_chunks))
+    return res
@@ -0,0 +1,191 @@
+# -----------------------------------------------------------------------------
+# Boilerplate pages
+#
+# Legal notices and fixed informational pages come back identical in every
+# statement of a template but are laid out (and given to camelot) each time.
+# Pages are fingerprinted from their raw content streams, which costs a
+# decompression, not a layout. A BoilerplateStore learns, per template, the
+# fingerprints of pages found in several statements without any placeholder
+# resolving on them; a BoilerplateFilter then leaves those pages out of the
+# layout and of the table extraction of the next statements.
+#
+#   bp = BoilerplateFilter("boilerplate.json")
+#   st = ScraperFactory.get_scraper(path)
+#   bp.prepare(st)
+#   st.process()
+#   bp.learn(bp.observe(st))
+#   bp.save()
+#   print(bp.report())
+
+import hashlib
+import json
+import logging
+import os
+import pathlib
+
+from pdfminer.pdfpage import PDFPage
+from pdfminer.pdftypes import resolve1
+
+from .utils import *
+from . import backends
+
+logger = logging.getLogger("hsbcpdf.helpers.boilerplate")
+
+
+def page_fingerprints(pdf):
+    # digest of the content streams of each page, in page order
+    res = []
+    for page in PDFPage.create_pages(backends.pdfminer_document(pdf).doc):
+        digest = hashlib.blake2b(digest_size=16)
+        for stream in page.contents:
+            stream = resolve1(stream)
+            if stream is not None:
+                digest.update(stream.get_data())
+        res.append(digest.hexdigest())
+    return res
+
+
+def _pages(value, found):
+    # pages referenced by query cache keys and results
+    if isinstance(value, Section):
+        found.add(value.page)
+    elif isinstance(value, (list, tuple)):
+        if len(value) == 2 and value[0] == 'page' and isinstance(value[1], int):
+            found.add(value[1])
+        else:
+            for v in value:
+                _pages(v, found)
+    elif hasattr(value, 'layout') or hasattr(value, 'page_number'):
+        found.add(get_page(value))
+
+
+def used_pages(pdf):
+    found = set()
+    for key, res in query_cache(pdf).results.items():
+        if res is not None and res != []:
+            _pages(key, found)
+            _pages(res, found)
+    return found
+
+
+class BoilerplateStore:
+    __doc__ = "Page fingerprints seen per template, persisted as JSON"
+
+    def __init__(self, path=None, min_count=3):
+        self.path = pathlib.Path(path) if path is not None else None
+        # statements a page must be found unused in before it is skipped
+        self.min_count = min_count
+        self.templates = {}
+        if self.path is not None and self.path.exists():
+            self.templates = json.loads(self.path.read_text(encoding='utf-8')).get('templates', {})
+
+    def _template(self, template):
+        return self.templates.setdefault(template, {'counts': {}, 'used': []})
+
+    def boilerplate(self, template):
+        t = self.templates.get(template)
+        if t is None:
+            return set()
+        used = set(t['used'])
+        return {fp for fp, n in t['counts'].items() if n >= self.min_count and fp not in used}
+
+    def learn(self, template, fingerprints, used):
+        t = self._template(template)
+        used_fps = {fingerprints[p - 1] for p in used if 0 < p <= len(fingerprints)}
+        t['used'] = sorted(set(t['used']) | used_fps)
+        for fp in set(fingerprints) - used_fps:
+            t['counts'][fp] = t['counts'].get(fp, 0) + 1
+
+    def save(self):
+        if self.path is None:
+            return
+        tmp = self.path.with_suffix(self.path.suffix + '.tmp')
+        tmp.write_text(json.dumps({'templates': self.templates}, indent=1, sort_keys=True), encoding='utf-8')
+        os.replace(tmp, self.path)
+
+
+class BoilerplateFilter:
+    __doc__ = "Skips the learned boilerplate pages of statements and reports the pages and time saved"
+
+    def __init__(self, path=None, min_count=3):
+        self.path = str(path) if path is not None else None
+        self.min_count = min_count
+        self._store = None
+        self.statements = 0
+        self.pages = 0
+        self.skipped = 0
+        self.jobs_skipped = 0
+        self.saved_seconds = 0.
+
+    def __getstate__(self):
+        # sent to pool workers: they load the store themselves
+        return {'path': self.path, 'min_count': self.min_count}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    @property
+    def store(self):
+        if self._store is None:
+            self._store = BoilerplateStore(self.path, self.min_count)
+        return self._store
+
+    @staticmethod
+    def template(st):
+        return '{}.{}'.format(type(st).__module__, type(st).__name__)
+
+    def prepare(self, st):
+        # before processing: fingerprint the pages and mark the known boilerplate ones
+        st.page_fingerprints = page_fingerprints(st.pdf)
+        boilerplate = self.store.boilerplate(self.template(st))
+        # page 1 and fixed page placeholders are always laid out
+        keep = {1} | set(st.query_plan().boxes)
+        skip = frozenset(
+            p for p, fp in enumerate(st.page_fingerprints, 1) if fp in boilerplate and p not in keep
+        )
+        if skip:
+            st.skip_pages = skip
+            backends.pdfminer_document(st.pdf).skip_pages = skip
+            logger.debug("{}: skip boilerplate pages {}".format(st.pdfpath, sorted(skip)))
+        return skip
+
+    def observe(self, st):
+        # after processing: what the statement tells the store, small enough to come back from a worker
+        # signatures are probed page by page, their occurrences mark used pages as well
+        for elem in list(st._BANK_SIGNATURE) + list(st._TYPE_SIGNATURE):
+            elem.querys(st.pdf)
+        pdf = backends.pdfminer_document(st.pdf)
+        return {
+            'template': self.template(st),
+            'fingerprints': st.page_fingerprints,
+            'used': sorted(used_pages(st.pdf)),
+            'skipped': sorted(st.skip_pages),
+            'layout_pages': pdf.layout_pages,
+            'layout_seconds': pdf.layout_seconds,
+            'table_jobs': st.table_jobs,
+            'table_seconds': st.table_seconds,
+            'tables_skipped': st.tables_skipped,
+        }
+
+    def learn(self, observation):
+        o = observation
+        self.store.learn(o['template'], o['fingerprints'], o['used'])
+        self.statements += 1
+        self.pages += len(o['fingerprints'])
+        self.skipped += len(o['skipped'])
+        self.jobs_skipped += o['tables_skipped']
+        # skipped work estimated at the mean cost of the work done
+        if o['skipped'] and o['layout_pages']:
+            self.saved_seconds += len(o['skipped']) * o['layout_seconds'] / o['layout_pages']
+        if o['tables_skipped'] and o['table_jobs']:
+            self.saved_seconds += o['tables_skipped'] * o['table_seconds'] / o['table_jobs']
+
+    def save(self):
+        self.store.save()
+
+    def report(self):
+        lines = ['{} statements, {} pages: {} boilerplate pages skipped, {} table jobs skipped, ~{:.1f}s saved'.format(
+            self.statements, self.pages, self.skipped, self.jobs_skipped, self.saved_seconds)]
+        for template, t in sorted(self.store.templates.items()):
+            lines.append('  {:<50} {:>4} boilerplate pages learned'.format(template, len(self.store.boilerplate(template))))
+        return '\n'.join(lines) + '\n'
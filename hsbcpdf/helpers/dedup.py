@@ -0,0 +1,173 @@
+# -----------------------------------------------------------------------------
+# Cross statement deduplication
+#
+# The same transactions come in through overlapping statements (downloaded
+# again, fetched by woob and scanned by hand, ...). A DedupIndex keeps, in a
+# SQLite file, the fingerprint of every ingested entry and the header of every
+# ingested statement:
+#   - an entry fingerprint hashes main account, account, currency, post date,
+#     amount, normalized description and its ordinal among identical entries
+#     of the statement, so that genuine same day repeats are kept
+#   - a statement is a duplicate when its account number, date and balances
+#     were all ingested; a corrected re-issue (same account and date, other
+#     balances) is not, its changed entries are ingested
+#
+# has_statement only looks at the account number and date, so that a known
+# statement can be skipped right after the template matched, before any
+# table is extracted: opt-in, as corrected re-issues are skipped as well.
+#
+#   index = DedupIndex("dedup.db")
+#   st = ScraperFactory.get_scraper(path).process()
+#   if not index.is_duplicate(st):
+#       new = index.ingest(st)   # boolean mask of the entries not seen before
+
+import hashlib
+import logging
+import re
+import sqlite3
+
+from .utils import LazyModule
+from .entries import Entries
+
+logger = logging.getLogger("hsbcpdf.helpers.dedup")
+
+np = LazyModule('numpy')
+
+_SPACES = re.compile(r'\s+')
+
+
+def normalize_description(description):
+    if description is None:
+        return ''
+    return _SPACES.sub(' ', str(description)).strip().casefold()
+
+
+def _digest(*fields):
+    return hashlib.blake2b('\x1f'.join(map(str, fields)).encode('utf-8'), digest_size=16).digest()
+
+
+def statement_key(st):
+    st_date = st.st_date.strftime('%Y-%m-%d') if st.st_date is not None else None
+    return _digest(st.account_number, st_date)
+
+
+def balances_key(st):
+    balances = [
+        (which, account, currency, round(amount, 2))
+        for which in ('previous_balance', 'new_balance')
+        for account, amounts in st.statement[which].items()
+        for currency, amount in amounts.items()
+    ]
+    return _digest(*sorted(balances, key=str))
+
+
+def entry_fingerprints(st):
+    entries = st.statement['entries']
+    # descriptions are normalized and hashed once per distinct value
+    descriptions = entries.column('description').tolist()
+    digests = {d: _digest(normalize_description(d)).hex() for d in set(descriptions)}
+    accounts = list(entries.categories('account')) + [None]
+    currencies = list(entries.categories('currency')) + [None]
+    codes = {c: entries.codes(c).tolist() for c in Entries.CATEGORIES}
+    days = entries.column('post_date').astype('datetime64[D]').astype(str).tolist()
+    # cents whatever the scale of the entries, finer amounts as decimals
+    factor = entries.scale // Entries.SCALE
+    amounts = [a // factor if a % factor == 0 else a / entries.scale for a in entries.minor_amounts.tolist()]
+    ordinals = {}
+    res = []
+    for i in range(len(amounts)):
+        key = (
+            st.account_number,
+            accounts[codes['account'][i]],
+            currencies[codes['currency'][i]],
+            days[i],
+            amounts[i],
+            digests[descriptions[i]]
+        )
+        ordinal = ordinals[key] = ordinals.get(key, -1) + 1
+        res.append(_digest(*key, ordinal))
+    return res
+
+
+class DedupIndex:
+    __doc__ = "Persistent index of ingested statements and entry fingerprints"
+
+    SCHEMA = (
+        """CREATE TABLE IF NOT EXISTS statements (
+            key BLOB PRIMARY KEY,
+            balances BLOB,
+            file_path TEXT
+        )""",
+        """CREATE TABLE IF NOT EXISTS entries (
+            fingerprint BLOB PRIMARY KEY
+        ) WITHOUT ROWID""",
+    )
+
+    # fingerprints looked up per query, below the SQLite bound parameters limit
+    CHUNK = 500
+
+    def __init__(self, path=':memory:'):
+        self.path = str(path)
+        self.connection = sqlite3.connect(self.path, check_same_thread=False)
+        if self.path != ':memory:':
+            # workers check statements while the parent ingests
+            self.connection.execute('PRAGMA journal_mode=WAL')
+            self.connection.execute('PRAGMA synchronous=NORMAL')
+        for ddl in DedupIndex.SCHEMA:
+            self.connection.execute(ddl)
+        self.connection.commit()
+
+    def _known(self, fingerprints):
+        # fingerprints of the list already in the index
+        known = set()
+        for i in range(0, len(fingerprints), DedupIndex.CHUNK):
+            chunk = fingerprints[i:i + DedupIndex.CHUNK]
+            known.update(r[0] for r in self.connection.execute(
+                'SELECT fingerprint FROM entries WHERE fingerprint IN ({})'.format(', '.join('?' * len(chunk))), chunk
+            ))
+        return known
+
+    def has_statement(self, st):
+        # header only: usable between match_template and extract_tables, a corrected re-issue is known too
+        return self.connection.execute(
+            'SELECT 1 FROM statements WHERE key = ?', (statement_key(st),)
+        ).fetchone() is not None
+
+    def is_duplicate(self, st):
+        # same header and same balances than an ingested statement
+        row = self.connection.execute(
+            'SELECT balances FROM statements WHERE key = ?', (statement_key(st),)
+        ).fetchone()
+        return row is not None and row[0] == balances_key(st)
+
+    def new_entries(self, st):
+        fingerprints = entry_fingerprints(st)
+        known = self._known(fingerprints)
+        return np.array([fp not in known for fp in fingerprints], dtype=bool)
+
+    def ingest(self, st):
+        """
+        Record the statement and its entries, give back the boolean mask of
+        the entries which were not in the index yet.
+        """
+        fingerprints = entry_fingerprints(st)
+        known = self._known(fingerprints)
+        mask = np.array([fp not in known for fp in fingerprints], dtype=bool)
+        new = [(fp,) for fp, m in zip(fingerprints, mask) if m]
+        with self.connection:
+            self.connection.execute(
+                'INSERT OR REPLACE INTO statements VALUES (?, ?, ?)',
+                (statement_key(st), balances_key(st), str(st.pdfpath))
+            )
+            self.connection.executemany('INSERT OR IGNORE INTO entries VALUES (?)', new)
+        logger.debug("{}: {} new entries out of {}".format(st.pdfpath, len(new), len(fingerprints)))
+        return mask
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
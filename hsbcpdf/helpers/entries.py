@@ -0,0 +1,315 @@
+# -----------------------------------------------------------------------------
+# Columnar container for statement entries
+
+import json
+import logging
+
+from .utils import LazyModule
+
+logger = logging.getLogger("hsbcpdf.helpers.entries")
+
+np = LazyModule('numpy')
+pd = LazyModule('pandas')
+# optional, only needed for Arrow/Parquet output
+pa = LazyModule('pyarrow', extra='parquet')
+
+# schema metadata of the tables written by Entries.to_arrow(raw=True)
+RAW_METADATA = b'hsbcpdf.entries'
+
+
+def _chunk(column):
+    # single chunk columns are used as they are, combine_chunks would copy them
+    return column.chunk(0) if column.num_chunks == 1 else column.combine_chunks()
+
+
+class Entries:
+    __doc__ = "Columnar, compact holder of statement entries"
+
+    COLUMNS = ['account', 'post_date', 'transaction_date', 'description', 'currency', 'amount']
+    DATES = ('post_date', 'transaction_date')
+    # few distinct values per statement: dictionary encoded (descriptions are plain strings)
+    CATEGORIES = ('account', 'currency')
+    # amounts are held as int64 number of minor units: cents, or a finer power
+    # of ten when the source has more decimals (3 decimal currencies, FX rates)
+    SCALE = 100
+    MAX_SCALE = 10 ** 6
+
+    def __init__(self):
+        self._size = 0
+        self.scale = Entries.SCALE
+        self._dates = {c: np.empty(0, dtype='datetime64[s]') for c in Entries.DATES}
+        self._amounts = np.empty(0, dtype=np.int64)
+        self._descriptions = np.empty(0, dtype=object)
+        self._codes = {c: np.empty(0, dtype=np.int32) for c in Entries.CATEGORIES}
+        self._categories = {c: [] for c in Entries.CATEGORIES}
+        self._lookup = {c: {} for c in Entries.CATEGORIES}
+        # rows appended one by one are buffered then frozen into arrays on read
+        self._pending = []
+        # (raw, Arrow table) the arrays are views of, given back as is by to_arrow
+        self._arrow = None
+
+    def __len__(self):
+        return self._size + len(self._pending)
+
+    def _code(self, column, value):
+        lookup = self._lookup[column]
+        code = lookup.get(value)
+        if code is None:
+            code = lookup[value] = len(self._categories[column])
+            self._categories[column].append(value)
+        return code
+
+    def append(self, account, post_date, transaction_date, description, currency, amount):
+        self._pending.append((
+            self._code('account', account),
+            post_date,
+            transaction_date,
+            description,
+            self._code('currency', currency),
+            amount
+        ))
+
+    def _rescale(self, scale):
+        if scale > self.scale:
+            self._amounts = self._amounts * (scale // self.scale)
+            self.scale = scale
+
+    def _freeze(self):
+        if not self._pending:
+            return
+        self._arrow = None
+        acc, post, trans, desc, ccy, amount = zip(*self._pending)
+        self._codes['account'] = np.concatenate([self._codes['account'], np.array(acc, dtype=np.int32)])
+        self._codes['currency'] = np.concatenate([self._codes['currency'], np.array(ccy, dtype=np.int32)])
+        descriptions = np.empty(len(desc), dtype=object)
+        descriptions[:] = desc
+        self._descriptions = np.concatenate([self._descriptions, descriptions])
+        self._dates['post_date'] = np.concatenate([self._dates['post_date'], np.array(post, dtype='datetime64[s]')])
+        self._dates['transaction_date'] = np.concatenate([self._dates['transaction_date'], np.array(trans, dtype='datetime64[s]')])
+        amount = np.array(amount, dtype=np.float64)
+        self._rescale(Entries.minor_scale(amount, self.scale))
+        self._amounts = np.concatenate([self._amounts, Entries.to_minor(amount, self.scale)])
+        self._size += len(self._pending)
+        self._pending = []
+
+    @staticmethod
+    def minor_scale(amounts, scale=SCALE):
+        # smallest power of ten from scale making whole numbers of all the amounts
+        amounts = amounts[np.isfinite(amounts)]
+        while True:
+            scaled = amounts * scale
+            if np.allclose(scaled, np.rint(scaled), rtol=1e-14, atol=1e-6):
+                return scale
+            if scale >= Entries.MAX_SCALE:
+                raise ValueError("amounts with more than {} decimals".format(len(str(Entries.MAX_SCALE)) - 1))
+            scale *= 10
+
+    @staticmethod
+    def to_minor(amounts, scale=SCALE):
+        return np.rint(amounts * scale).astype(np.int64)
+
+    @classmethod
+    def from_df(cls, df):
+        res = cls()
+        if df is None or df.empty:
+            return res
+        for c in Entries.CATEGORIES:
+            cat = pd.Categorical(df[c])
+            res._codes[c] = cat.codes.astype(np.int32)
+            res._categories[c] = list(cat.categories)
+            res._lookup[c] = {v: i for i, v in enumerate(res._categories[c])}
+        description = df['description'].astype(object)
+        res._descriptions = description.where(description.notna(), None).to_numpy(dtype=object)
+        for c in Entries.DATES:
+            res._dates[c] = pd.to_datetime(df[c]).to_numpy(dtype='datetime64[s]')
+        amounts = df['amount'].to_numpy(dtype=np.float64)
+        res.scale = Entries.minor_scale(amounts)
+        res._amounts = Entries.to_minor(amounts, res.scale)
+        res._size = len(df)
+        return res
+
+    @classmethod
+    def concat(cls, others):
+        res = cls()
+        others = [o for o in others if o is not None]
+        for o in others:
+            o._freeze()
+        for c in Entries.CATEGORIES:
+            codes = []
+            for o in others:
+                # remap each part's category codes on the merged dictionary (-1 stays missing)
+                remap = np.array([res._code(c, v) for v in o._categories[c]] + [-1], dtype=np.int32)
+                codes.append(remap[o._codes[c]])
+            if codes:
+                res._codes[c] = np.concatenate(codes)
+        for c in Entries.DATES:
+            if others:
+                res._dates[c] = np.concatenate([o._dates[c] for o in others])
+        if others:
+            res._descriptions = np.concatenate([o._descriptions for o in others])
+            res.scale = max(o.scale for o in others)
+            res._amounts = np.concatenate([o._amounts * (res.scale // o.scale) for o in others])
+        res._size = sum(o._size for o in others)
+        return res
+
+    def take(self, rows):
+        # subset of the rows (boolean mask or indices), categories are kept as they are
+        self._freeze()
+        res = Entries()
+        for c in Entries.CATEGORIES:
+            res._codes[c] = self._codes[c][rows]
+            res._categories[c] = list(self._categories[c])
+            res._lookup[c] = dict(self._lookup[c])
+        for c in Entries.DATES:
+            res._dates[c] = self._dates[c][rows]
+        res._descriptions = self._descriptions[rows]
+        res.scale = self.scale
+        res._amounts = self._amounts[rows]
+        res._size = len(res._amounts)
+        return res
+
+    def column(self, name):
+        self._freeze()
+        if name in Entries.DATES:
+            return self._dates[name]
+        if name == 'amount':
+            return self._amounts / self.scale
+        if name == 'description':
+            return self._descriptions
+        return pd.Categorical.from_codes(self._codes[name], categories=self._categories[name])
+
+    def codes(self, name):
+        self._freeze()
+        return self._codes[name]
+
+    def categories(self, name):
+        return self._categories[name]
+
+    def strings(self, name):
+        # object array of the values of a category column, None where missing
+        self._freeze()
+        if name == 'description':
+            return self._descriptions
+        return np.array(self._categories[name] + [None], dtype=object)[self._codes[name]]
+
+    @property
+    def minor_amounts(self):
+        # amounts in 1/scale units
+        self._freeze()
+        return self._amounts
+
+    def to_df(self, compact=True):
+        # compact: categorical account/currency and datetime64[s] dates, otherwise
+        # object strings and datetime64[ns] dates, as a frame built from records
+        self._freeze()
+        if compact:
+            return pd.DataFrame({c: self.column(c) for c in Entries.COLUMNS})
+        return pd.DataFrame({
+            c: self._dates[c].astype('datetime64[ns]') if c in Entries.DATES
+            else self.column(c) if c == 'amount'
+            else self.strings(c)
+            for c in Entries.COLUMNS
+        })
+
+    @classmethod
+    def from_arrow(cls, table):
+        """
+        Entries of a table written by to_arrow. Raw tables are wrapped as they
+        are: codes, dates and minor amounts are numpy views of the Arrow
+        buffers. Only descriptions are copied (to Python strings). Tables of
+        the typed form have their float amounts converted back to minor units,
+        which copies that column.
+        """
+        res = cls()
+        meta = (table.schema.metadata or {}).get(RAW_METADATA)
+        if meta is not None:
+            meta = json.loads(meta)
+            for c in Entries.CATEGORIES:
+                res._codes[c] = _chunk(table.column(c)).to_numpy()
+                res._categories[c] = meta['categories'][c]
+                res._lookup[c] = {v: i for i, v in enumerate(res._categories[c])}
+            for c in Entries.DATES:
+                res._dates[c] = _chunk(table.column(c)).to_numpy().view('datetime64[s]')
+            res.scale = meta['scale']
+            res._amounts = _chunk(table.column('amount')).to_numpy()
+        else:
+            for c in Entries.CATEGORIES:
+                column = _chunk(table.column(c))
+                indices = column.indices
+                res._codes[c] = indices.fill_null(-1).to_numpy() if indices.null_count else indices.to_numpy()
+                res._categories[c] = column.dictionary.to_pylist()
+                res._lookup[c] = {v: i for i, v in enumerate(res._categories[c])}
+            for c in Entries.DATES:
+                res._dates[c] = _chunk(table.column(c)).to_numpy(zero_copy_only=False).astype('datetime64[s]', copy=False)
+            amounts = table.column('amount').to_numpy()
+            res.scale = Entries.minor_scale(amounts)
+            res._amounts = Entries.to_minor(amounts, res.scale)
+        res._descriptions = table.column('description').to_numpy()
+        res._size = table.num_rows
+        res._arrow = (meta is not None, table)
+        return res
+
+    def to_arrow(self, raw=False):
+        """
+        Arrow table of the entries: dictionary encoded account and currency,
+        timestamps and float amounts. raw: the arrays as they are held (int32
+        codes, int64 seconds, int64 minor units) with the categories and
+        scale in the schema metadata, wrapped without conversion.
+        """
+        self._freeze()
+        if self._arrow is not None and self._arrow[0] == raw:
+            return self._arrow[1]
+        columns = {}
+        for c in Entries.COLUMNS:
+            if c == 'description':
+                columns[c] = pa.array(self._descriptions, type=pa.string())
+            elif raw:
+                columns[c] = pa.array(self._dates[c].view(np.int64) if c in Entries.DATES
+                                      else self._amounts if c == 'amount' else self._codes[c])
+            elif c in Entries.CATEGORIES:
+                codes = self._codes[c]
+                columns[c] = pa.DictionaryArray.from_arrays(
+                    pa.array(codes, mask=codes < 0),
+                    pa.array(self._categories[c], type=pa.string())
+                )
+            elif c in Entries.DATES:
+                columns[c] = pa.array(self._dates[c], from_pandas=True)
+            else:
+                columns[c] = pa.array(self._amounts / self.scale)
+        if not raw:
+            return pa.table(columns)
+        meta = {'scale': self.scale, 'categories': {c: self._categories[c] for c in Entries.CATEGORIES}}
+        return pa.table(columns, metadata={RAW_METADATA: json.dumps(meta)})
+
+    def records(self):
+        self._freeze()
+        dates = {c: self._dates[c].tolist() for c in Entries.DATES}
+        # missing categorical values have code -1 and map on the trailing None
+        cats = {c: self._categories[c] + [None] for c in Entries.CATEGORIES}
+        codes = {c: self._codes[c].tolist() for c in Entries.CATEGORIES}
+        descriptions = self._descriptions.tolist()
+        amounts = self._amounts.tolist()
+        for i in range(self._size):
+            yield {
+                'account': cats['account'][codes['account'][i]],
+                'post_date': dates['post_date'][i],
+                'transaction_date': dates['transaction_date'][i],
+                'description': descriptions[i],
+                'currency': cats['currency'][codes['currency'][i]],
+                'amount': amounts[i] / self.scale
+            }
+
+    def __iter__(self):
+        # rows as dicts, as statement['entries'] used to be a list of them
+        return iter(self.records())
+
+    @property
+    def nbytes(self):
+        self._freeze()
+        return sum(a.nbytes for a in self._dates.values()) \
+            + sum(a.nbytes for a in self._codes.values()) \
+            + self._descriptions.nbytes \
+            + self._amounts.nbytes
+
+    def __repr__(self):
+        return "<Entries {} rows>".format(len(self))
@@ -0,0 +1,399 @@
+# -----------------------------------------------------------------------------
+# Statement exporters
+
+import logging
+import datetime
+import json
+import gzip
+import sqlite3
+import pathlib
+import urllib.parse
+import uuid
+
+from .utils import LazyModule
+from .entries import Entries
+
+logger = logging.getLogger("hsbcpdf.helpers.exporters")
+
+np = LazyModule('numpy')
+# optional, only needed for Parquet output
+pa = LazyModule('pyarrow', extra='parquet')
+pq = LazyModule('pyarrow.parquet', extra='parquet')
+
+DATE_FORMAT = "%d/%m/%Y"
+
+
+def _json_default(o):
+    if isinstance(o, (datetime.datetime, datetime.date)):
+        return o.strftime(DATE_FORMAT)
+    raise TypeError(f'Object of type {type(o).__name__} is not JSON serializable')
+
+
+class JsonlExporter:
+    __doc__ = "Stream statements as NDJSON: one header record then one line per entry"
+
+    def __init__(self, sink, chunk_size=1024):
+        self.sink = sink
+        self.chunk_size = chunk_size
+        self.statements = 0
+        self.lines = 0
+        self._owned = False
+
+    @classmethod
+    def open(cls, path, compress=None, chunk_size=1024):
+        path = str(path)
+        if compress is None:
+            compress = path.endswith('.gz')
+        if compress:
+            sink = gzip.open(path, 'wt', encoding='utf-8')
+        else:
+            sink = open(path, 'w', encoding='utf-8')
+        exporter = cls(sink, chunk_size)
+        exporter._owned = True
+        return exporter
+
+    @staticmethod
+    def _encode_dates(dates):
+        # statements hold few distinct dates: format each one only once
+        uniques, inverse = np.unique(dates, return_inverse=True)
+        encoded = [
+            'null' if np.isnat(d) else '"' + d.astype('datetime64[s]').item().strftime(DATE_FORMAT) + '"'
+            for d in uniques
+        ]
+        return encoded, inverse.tolist()
+
+    @staticmethod
+    def _encode_amount(minor, scale=Entries.SCALE):
+        # exact decimal rendering of minor units, no float round trip
+        sign = '-' if minor < 0 else ''
+        units, fraction = divmod(abs(minor), scale)
+        return '{}{}.{:0{}d}'.format(sign, units, fraction, len(str(scale)) - 1)
+
+    def write(self, st):
+        entries = st.statement['entries']
+        header = {
+            'record': 'statement',
+            'bank': st.st_bank,
+            'type': st.statement['type'],
+            'main_account': st.statement['main_account'],
+            'statement_date': st.statement['statement_date'],
+            'file_path': str(st.pdfpath),
+            'previous_balance': st.statement['previous_balance'],
+            'new_balance': st.statement['new_balance'],
+            'entries': len(entries)
+        }
+        self.sink.write(json.dumps(header, default=_json_default) + '\n')
+        self.statements += 1
+        self.lines += 1
+
+        prefix = '{"record": "entry", "main_account": ' + json.dumps(st.statement['main_account']) \
+            + ', "statement_date": ' + json.dumps(st.statement['statement_date'], default=_json_default)
+        cats = {c: [json.dumps(v) for v in entries.categories(c)] + ['null'] for c in Entries.CATEGORIES}
+        for start in range(0, len(entries), self.chunk_size):
+            stop = start + self.chunk_size
+            post, post_idx = self._encode_dates(entries.column('post_date')[start:stop])
+            trans, trans_idx = self._encode_dates(entries.column('transaction_date')[start:stop])
+            codes = {c: entries.codes(c)[start:stop].tolist() for c in Entries.CATEGORIES}
+            descriptions = entries.column('description')[start:stop].tolist()
+            amounts = entries.minor_amounts[start:stop].tolist()
+            self.sink.writelines(
+                prefix
+                + ', "account": ' + cats['account'][codes['account'][i]]
+                + ', "post_date": ' + post[post_idx[i]]
+                + ', "transaction_date": ' + trans[trans_idx[i]]
+                + ', "description": ' + json.dumps(descriptions[i])
+                + ', "currency": ' + cats['currency'][codes['currency'][i]]
+                + ', "amount": ' + self._encode_amount(amounts[i], entries.scale)
+                + '}\n'
+                for i in range(len(amounts))
+            )
+            self.lines += len(amounts)
+        return len(entries) + 1
+
+    def close(self):
+        if self._owned:
+            self.sink.close()
+        else:
+            self.sink.flush()
+        logger.debug("exported {} statements in {} lines".format(self.statements, self.lines))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class SqliteExporter:
+    __doc__ = "Write statements, balances and entries to a SQLite database, re-ingesting a statement replaces it"
+
+    # natural keys: a statement is identified by its main account and date
+    SCHEMA = (
+        """CREATE TABLE IF NOT EXISTS statements (
+            main_account TEXT NOT NULL,
+            st_date TEXT NOT NULL,
+            bank TEXT,
+            type TEXT,
+            file_path TEXT,
+            entries INTEGER,
+            PRIMARY KEY (main_account, st_date)
+        )""",
+        """CREATE TABLE IF NOT EXISTS balances (
+            main_account TEXT NOT NULL,
+            st_date TEXT NOT NULL,
+            account TEXT NOT NULL,
+            currency TEXT NOT NULL,
+            previous_balance REAL,
+            new_balance REAL,
+            PRIMARY KEY (main_account, st_date, account, currency)
+        )""",
+        """CREATE TABLE IF NOT EXISTS entries (
+            main_account TEXT NOT NULL,
+            st_date TEXT NOT NULL,
+            row INTEGER NOT NULL,
+            account TEXT,
+            post_date TEXT,
+            transaction_date TEXT,
+            description TEXT,
+            currency TEXT,
+            amount REAL,
+            PRIMARY KEY (main_account, st_date, row)
+        ) WITHOUT ROWID""",
+    )
+    UPSERT_STATEMENT = """INSERT INTO statements VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT (main_account, st_date) DO UPDATE SET
+        bank = excluded.bank, type = excluded.type, file_path = excluded.file_path, entries = excluded.entries"""
+    # summary only statement: the entries and their count stored by a full ingestion are kept
+    UPSERT_SUMMARY = """INSERT INTO statements VALUES (?, ?, ?, ?, ?, NULL)
+        ON CONFLICT (main_account, st_date) DO UPDATE SET
+        bank = excluded.bank, type = excluded.type, file_path = excluded.file_path"""
+    UPSERT_BALANCE = """INSERT INTO balances VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT (main_account, st_date, account, currency) DO UPDATE SET
+        previous_balance = excluded.previous_balance, new_balance = excluded.new_balance"""
+    UPSERT_ENTRY = """INSERT INTO entries VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (main_account, st_date, row) DO UPDATE SET
+        account = excluded.account, post_date = excluded.post_date, transaction_date = excluded.transaction_date,
+        description = excluded.description, currency = excluded.currency, amount = excluded.amount"""
+    # rows left over from a previous ingestion of the statement
+    DELETE_ENTRIES = "DELETE FROM entries WHERE main_account = ? AND st_date = ? AND row >= ?"
+    DELETE_BALANCES = "DELETE FROM balances WHERE main_account = ? AND st_date = ?"
+
+    def __init__(self, connection, batch_size=50):
+        self.connection = connection
+        # statements written per transaction
+        self.batch_size = batch_size
+        self.statements = 0
+        self.rows = 0
+        self._owned = False
+        self._pending = []
+        for ddl in SqliteExporter.SCHEMA:
+            self.connection.execute(ddl)
+
+    @classmethod
+    def open(cls, path, batch_size=50):
+        connection = sqlite3.connect(str(path))
+        # readers are not blocked by the writer, a commit is a WAL append
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('PRAGMA synchronous=NORMAL')
+        exporter = cls(connection, batch_size)
+        exporter._owned = True
+        return exporter
+
+    @staticmethod
+    def _encode_dates(dates):
+        text = np.datetime_as_string(dates, unit='D').tolist()
+        return [None if t == 'NaT' else t for t in text]
+
+    @staticmethod
+    def _key(st):
+        st_date = st.statement['statement_date']
+        return st.statement['main_account'], st_date.strftime('%Y-%m-%d') if st_date is not None else None
+
+    def _balances(self, st):
+        main_account, st_date = self._key(st)
+        previous, new = st.statement['previous_balance'], st.statement['new_balance']
+        rows = {}
+        for which, balances in ((0, previous), (1, new)):
+            for account, amounts in balances.items():
+                for currency, amount in amounts.items():
+                    rows.setdefault((account, currency), [None, None])[which] = amount
+        return [(main_account, st_date, a, c, p, n) for (a, c), (p, n) in rows.items()]
+
+    def _entries(self, st):
+        main_account, st_date = self._key(st)
+        entries = st.statement['entries']
+        cats = {c: list(entries.categories(c)) + [None] for c in Entries.CATEGORIES}
+        codes = {c: entries.codes(c).tolist() for c in Entries.CATEGORIES}
+        post = self._encode_dates(entries.column('post_date'))
+        trans = self._encode_dates(entries.column('transaction_date'))
+        descriptions = entries.column('description').tolist()
+        amounts = entries.column('amount').tolist()
+        return [
+            (main_account, st_date, i,
+             cats['account'][codes['account'][i]],
+             post[i],
+             trans[i],
+             descriptions[i],
+             cats['currency'][codes['currency'][i]],
+             amounts[i])
+            for i in range(len(amounts))
+        ]
+
+    def write(self, st):
+        if self._key(st)[1] is None:
+            # statement date is part of the key
+            logger.warning("{}: statement without date not exported".format(st.pdfpath))
+            return 0
+        self._pending.append(st)
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+        return len(st.statement['entries']) + 1
+
+    def flush(self):
+        if not self._pending:
+            return
+        # a statement written again in the same batch: its last copy wins
+        pending = {self._key(st): st for st in self._pending}
+        statements, summaries, balances, entries = [], [], [], []
+        for st in pending.values():
+            main_account, st_date = self._key(st)
+            row = (main_account, st_date, st.st_bank, st.statement['type'], str(st.pdfpath))
+            if getattr(st, 'summary_only', False):
+                # processed without its entries, not with none
+                summaries.append(row)
+            else:
+                statements.append(row + (len(st.statement['entries']),))
+                entries += self._entries(st)
+            balances.append(self._balances(st))
+        cursor = self.connection.cursor()
+        # a savepoint commits the batch at once, or nests in a transaction the caller has open
+        cursor.execute('SAVEPOINT hsbcpdf_export')
+        try:
+            cursor.executemany(SqliteExporter.UPSERT_STATEMENT, statements)
+            cursor.executemany(SqliteExporter.UPSERT_SUMMARY, summaries)
+            cursor.executemany(SqliteExporter.UPSERT_BALANCE, [b for rows in balances for b in rows])
+            cursor.executemany(SqliteExporter.UPSERT_ENTRY, entries)
+            cursor.executemany(SqliteExporter.DELETE_ENTRIES, [s[:2] + (s[5],) for s in statements])
+            for key, rows in zip(pending, balances):
+                query = SqliteExporter.DELETE_BALANCES
+                if rows:
+                    query += " AND (account, currency) NOT IN (VALUES {})".format(', '.join(['(?, ?)'] * len(rows)))
+                cursor.execute(query, key + tuple(v for r in rows for v in r[2:4]))
+            cursor.execute('RELEASE hsbcpdf_export')
+        except BaseException:
+            cursor.execute('ROLLBACK TO hsbcpdf_export')
+            cursor.execute('RELEASE hsbcpdf_export')
+            raise
+        self.statements += len(statements) + len(summaries)
+        self.rows += len(entries)
+        logger.debug("upserted {} statements, {} entries".format(len(statements), len(entries)))
+        self._pending = []
+
+    def close(self):
+        self.flush()
+        if self._owned:
+            self.connection.close()
+        logger.debug("exported {} statements, {} entries".format(self.statements, self.rows))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class ParquetDatasetWriter:
+    __doc__ = "Append statement entries to a hive partitioned Parquet dataset (bank/type/account/month)"
+
+    PARTITIONS = ('st_bank', 'st_type', 'main_account', 'st_month')
+    # dictionary encoded columns (descriptions are nearly unique per row)
+    STRINGS = ('file_path', 'account', 'currency')
+
+    def __init__(self, root, row_group_size=128 * 1024, buffer_rows=1024 * 1024, compression='zstd'):
+        self.root = pathlib.Path(root)
+        self.row_group_size = row_group_size
+        # entries kept in memory across statements before files are written
+        self.buffer_rows = buffer_rows
+        self.compression = compression
+        self.statements = 0
+        self.rows = 0
+        self.files = []
+        self._token = uuid.uuid4().hex[:12]
+        self._buffers = {}
+        self._buffered = 0
+
+    @classmethod
+    def open(cls, root, **kwargs):
+        return cls(root, **kwargs)
+
+    @staticmethod
+    def schema():
+        dictionary = pa.dictionary(pa.int32(), pa.string())
+        return pa.schema([
+            ('st_date', pa.timestamp('s')),
+            ('file_path', dictionary),
+            ('account', dictionary),
+            ('post_date', pa.timestamp('s')),
+            ('transaction_date', pa.timestamp('s')),
+            ('description', pa.string()),
+            ('currency', dictionary),
+            ('amount', pa.float64()),
+        ])
+
+    def partition(self, st):
+        st_date = st.statement['statement_date']
+        values = (st.st_bank, st.statement['type'], st.statement['main_account'],
+                  st_date.strftime('%Y-%m') if st_date is not None else None)
+        return tuple(
+            '{}={}'.format(k, urllib.parse.quote(str(v), safe='') if v is not None else '__HIVE_DEFAULT_PARTITION__')
+            for k, v in zip(ParquetDatasetWriter.PARTITIONS, values)
+        )
+
+    def write(self, st):
+        entries = st.statement['entries']
+        if not len(entries):
+            self.statements += 1
+            return 0
+        table = entries.to_arrow()
+        n = table.num_rows
+        table = table.add_column(0, 'st_date', pa.array(
+            np.full(n, st.statement['statement_date'], dtype='datetime64[s]'), from_pandas=True))
+        table = table.add_column(1, 'file_path', pa.DictionaryArray.from_arrays(
+            pa.array(np.zeros(n, dtype=np.int32)), pa.array([str(st.pdfpath)])))
+        self._buffers.setdefault(self.partition(st), []).append(table.select(self.schema().names))
+        self._buffered += n
+        self.statements += 1
+        if self._buffered >= self.buffer_rows:
+            self.flush()
+        return n
+
+    def flush(self):
+        schema = self.schema()
+        for key, tables in self._buffers.items():
+            directory = self.root.joinpath(*key)
+            directory.mkdir(parents=True, exist_ok=True)
+            path = directory / 'part-{}-{}.parquet'.format(self._token, len(self.files))
+            # one dictionary per column and row group instead of one per statement
+            table = pa.concat_tables(tables).cast(schema).unify_dictionaries().combine_chunks()
+            pq.write_table(
+                table,
+                path,
+                row_group_size=self.row_group_size,
+                compression=self.compression,
+                use_dictionary=list(ParquetDatasetWriter.STRINGS)
+            )
+            self.files.append(path)
+            self.rows += table.num_rows
+        logger.debug("wrote {} rows in {} partitions".format(self._buffered, len(self._buffers)))
+        self._buffers = {}
+        self._buffered = 0
+
+    def close(self):
+        self.flush()
+        logger.debug("exported {} statements, {} rows in {} files".format(self.statements, self.rows, len(self.files)))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
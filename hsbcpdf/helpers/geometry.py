@@ -0,0 +1,157 @@
+# -----------------------------------------------------------------------------
+# Table geometry cache
+#
+# Templates find their table columns and boxes from the ruling of the
+# statement (header lines, column separators), which only changes with the
+# template version. A GeometryCache keeps, per scraper class, account and page
+# format, the geometry resolved by the discovery queries along with the bbox
+# of the lines it was derived from. The next statement of the account gets the
+# cached geometry as long as these lines are still found at the same place on
+# its pages (one pass on the page graphics); otherwise discovery runs again
+# and replaces the entry.
+#
+#   set_geometry_cache(GeometryCache("geometry.db"))   # shared by processes
+#   st = ScraperFactory.get_scraper(path).process()   # templates go through
+#                                                     # st.resolve_geometry
+
+import json
+import logging
+import sqlite3
+import threading
+from collections import Counter
+
+from .utils import *
+from .utils import _layout
+
+logger = logging.getLogger("hsbcpdf.helpers.geometry")
+
+# points a cached line can move and still validate the geometry
+TOLERANCE = 1.0
+
+_LINE_TAGS = ('LTLine', 'LTRect', 'LTCurve')
+
+
+def line_probe(line):
+    # (page, x0, y0, x1, y1) of a Section or line element
+    obj = line.obj if isinstance(line, Section) else line
+    return [get_page(obj)] + [round(v, 3) for v in _layout(obj).bbox]
+
+
+def _page_lines(pdf, page):
+    backend = native_backend(pdf)
+    if backend is not None:
+        return [e.bbox for e in backend.graphics(page - 1) if e.kind is not None]
+    for p in pdf.tree.getroot():
+        if p.get('page_index') == str(page - 1):
+            return [e.layout.bbox for e in p.iter(*_LINE_TAGS)]
+    return []
+
+
+def probes_found(pdf, probes):
+    lines = {}
+    for page, *bbox in probes:
+        if page not in lines:
+            lines[page] = _page_lines(pdf, page)
+        if not any(all(abs(a - b) <= TOLERANCE for a, b in zip(bbox, l)) for l in lines[page]):
+            return False
+    return True
+
+
+class GeometryCache:
+    __doc__ = "Table geometry resolved per scraper class, account and page format, validated against each document"
+
+    SCHEMA = """CREATE TABLE IF NOT EXISTS geometry (
+        template TEXT NOT NULL,
+        account TEXT NOT NULL,
+        page_format TEXT NOT NULL,
+        name TEXT NOT NULL,
+        value TEXT NOT NULL,
+        probes TEXT NOT NULL,
+        PRIMARY KEY (template, account, page_format, name)
+    ) WITHOUT ROWID"""
+
+    def __init__(self, path=':memory:'):
+        self.path = str(path)
+        self.connection = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        if self.path != ':memory:':
+            # pool workers share the file
+            self.connection.execute('PRAGMA journal_mode=WAL')
+            self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.execute(GeometryCache.SCHEMA)
+        self.connection.commit()
+        self._lock = threading.Lock()
+        # hit, miss (nothing cached), mismatch (cached but not validated) counts
+        self.counts = Counter()
+
+    @staticmethod
+    def key(st, name):
+        width, height = page_size(st.pdf)
+        return (
+            '{}.{}'.format(type(st).__module__, type(st).__name__),
+            str(st.account_number),
+            '{:.0f}x{:.0f}'.format(width, height),
+            name
+        )
+
+    def get(self, st, name):
+        key = GeometryCache.key(st, name)
+        with self._lock:
+            row = self.connection.execute(
+                'SELECT value, probes FROM geometry WHERE template = ? AND account = ? AND page_format = ? AND name = ?',
+                key
+            ).fetchone()
+        if row is None:
+            self.counts['miss'] += 1
+            return None
+        if not probes_found(st.pdf, json.loads(row[1])):
+            self.counts['mismatch'] += 1
+            logger.debug("{}: cached {} geometry does not match, discover it again".format(st.pdfpath, name))
+            return None
+        self.counts['hit'] += 1
+        return json.loads(row[0])
+
+    def put(self, st, name, value, lines):
+        probes = [line_probe(l) for l in lines]
+        with self._lock, self.connection:
+            self.connection.execute(
+                'INSERT OR REPLACE INTO geometry VALUES (?, ?, ?, ?, ?, ?)',
+                GeometryCache.key(st, name) + (json.dumps(value), json.dumps(probes))
+            )
+
+    def resolve(self, st, name, discover):
+        """
+        Cached geometry `name` of the statement, or the one found by
+        discover(), which gives back (value, lines the value was derived
+        from). Values must be JSON serializable.
+        """
+        value = self.get(st, name)
+        if value is None:
+            value, lines = discover()
+            self.put(st, name, value, lines)
+        return value
+
+    def stats(self):
+        return dict(self.counts)
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+# process wide cache, none unless set by set_geometry_cache: geometry is discovered on each statement
+_cache = None
+
+
+def geometry_cache():
+    return _cache
+
+
+def set_geometry_cache(cache):
+    global _cache
+    previous, _cache = _cache, cache
+    return previous
@@ -0,0 +1,590 @@
+# -----------------------------------------------------------------------------
+# Pool of warm scraping processes
+#
+# Workers are started from a forkserver which imported the table extraction
+# stack and every registered template once, so a new worker costs a fork
+# instead of a fresh interpreter. Each worker processes files one at a time
+# and is replaced after a number of files or once its resident memory grows
+# over a threshold (pdfminer layouts are not always released between files).
+# Each file gives back a FileResult, scraping failures never stop the pool.
+#
+# With the 'arrow' transport, the entries of a processed statement don't go
+# through the pipe: the worker writes them in their raw Arrow form (codes,
+# seconds, minor units) as an IPC stream in a shared memory block and only
+# sends the statement without its entries. The parent maps the block and
+# rebuilds Entries as views of the mapped buffers, descriptions apart. The
+# block name is announced before it is created: the parent unlinks it when
+# the worker is killed or dies before handing it over.
+
+import argparse
+import importlib
+import logging
+import pathlib
+import sys
+import multiprocessing
+import os
+import queue
+import secrets
+import threading
+import time
+from concurrent.futures import Future
+from multiprocessing import resource_tracker, shared_memory
+
+from .utils import *
+from .entries import Entries
+from .sources import as_source, is_archive, iter_archive, source_name
+
+logger = logging.getLogger("hsbcpdf.helpers.pool")
+
+pa = LazyModule('pyarrow', extra='parquet')
+
+# result status of a file: 'ok' or the failure category
+OK = 'ok'
+# killed over its time or memory budget
+BUDGET = 'budget'
+FAILURES = (
+    (UnrecognizedException, 'unrecognized'),
+    (TemplateException, 'template'),
+    (ConsistencyException, 'consistency'),
+    (DuplicateException, 'duplicate'),
+)
+
+
+# how processed statements come back from the workers
+PICKLE = 'pickle'
+ARROW = 'arrow'
+
+
+def failure_status(exc):
+    for cls, status in FAILURES:
+        if isinstance(exc, cls):
+            return status
+    return 'error'
+
+
+def preload_modules():
+    from .registry import registry
+
+    modules = ['camelot', 'pandas', 'hsbcpdf.scraper']
+    for m in registry.manifests():
+        module = m.target.split(':')[0]
+        if module not in modules:
+            modules.append(module)
+    return modules
+
+
+def rss(pid=None):
+    # current resident set size in bytes, of this process or of a child (None when unknown)
+    try:
+        with open('/proc/{}/statm'.format(pid or 'self')) as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        if pid is not None:
+            return None
+        import resource
+        # peak value, the closest available without /proc (KiB on Linux, bytes on macOS)
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class FileResult:
+    __doc__ = "Outcome of scraping one file: processed statement or failure category and message"
+
+    def __init__(self, path, status, scraper=None, statement=None, error=None, elapsed=0., pid=None,
+                 peak_memory=None, captures=None, shared=None, stage=None, pages=None):
+        self.path = path
+        self.status = status
+        # "<module>.<class>" of the matching template, None when unrecognized
+        self.scraper = scraper
+        self.statement = statement
+        self.error = error
+        self.elapsed = elapsed
+        self.pid = pid
+        # set when profiled by a CaptureHook: traced allocations peak, dumps kept for the file
+        self.peak_memory = peak_memory
+        self.captures = captures
+        # (shared memory name, size) of the entries while in transit, 'arrow' transport
+        self.shared = shared
+        # processing stage reached when the file was killed over budget
+        self.stage = stage
+        # BoilerplateFilter.observe of the statement, learned from by the parent
+        self.pages = pages
+
+    @property
+    def ok(self):
+        return self.status == OK
+
+    def __repr__(self):
+        return "<FileResult {} {}{} {:.3f}s>".format(
+            self.path,
+            self.status,
+            f' {self.error!r}' if self.error else '',
+            self.elapsed
+        )
+
+
+def _scraper_name(st):
+    return '{}.{}'.format(type(st).__module__, type(st).__name__) if st is not None else None
+
+
+def process_file(pdfpath, capture=None, known=None, progress=None, boilerplate=None, summary_only=False):
+    from ..scraper import ScraperFactory
+
+    probe = capture.start(pdfpath) if capture is not None else None
+    start = time.perf_counter()
+    st = None
+    try:
+        if progress is not None:
+            progress(None, 'probe')
+        st = ScraperFactory.get_scraper(pdfpath)
+        if boilerplate is not None:
+            boilerplate.prepare(st)
+        st.process(known, progress, summary_only)
+        status, error = OK, None
+    except Exception as e:
+        status, error = failure_status(e), '{}: {}'.format(type(e).__name__, e)
+        if not isinstance(e, ScraperException):
+            logger.exception("failed processing {}".format(pdfpath))
+    res = FileResult(
+        source_name(pdfpath),
+        status,
+        scraper=_scraper_name(st),
+        statement=st if status == OK else None,
+        error=error,
+        elapsed=time.perf_counter() - start,
+        pid=os.getpid(),
+        pages=boilerplate.observe(st) if boilerplate is not None and status == OK else None
+    )
+    if probe is not None:
+        probe.stop(res, st)
+    return res
+
+
+def share_entries(res, announce=None):
+    # worker side: entries to a shared memory block owned by the receiving process from now on
+    entries = res.statement.statement['entries']
+    table = entries.to_arrow(raw=True)
+    sizer = pa.MockOutputStream()
+    with pa.ipc.new_stream(sizer, table.schema) as writer:
+        writer.write_table(table)
+    size = sizer.size()
+    name = 'hsbcpdf-{}'.format(secrets.token_hex(8))
+    if announce is not None:
+        announce(name)
+    shm = shared_memory.SharedMemory(name, create=True, size=size)
+    try:
+        buffer = pa.py_buffer(shm.buf)
+        with pa.ipc.new_stream(pa.FixedSizeBufferWriter(buffer), table.schema) as writer:
+            writer.write_table(table)
+        del buffer, writer
+    finally:
+        resource_tracker.unregister(shm._name, 'shared_memory')
+        shm.close()
+    res.statement.statement = dict(res.statement.statement, entries=None)
+    res.shared = (shm.name, size)
+    return res
+
+
+def attach_entries(res):
+    # parent side: map the block, release its name at once (the mapping stays valid)
+    name, size = res.shared
+    path = os.path.join('/dev/shm', name.lstrip('/'))
+    if os.path.exists(path):
+        table = pa.ipc.open_stream(pa.memory_map(path)).read_all()
+        os.unlink(path)
+    else:
+        # no shared memory file system: copy out of the block
+        shm = shared_memory.SharedMemory(name)
+        try:
+            table = pa.ipc.open_stream(pa.py_buffer(bytes(shm.buf[:size]))).read_all()
+        finally:
+            shm.close()
+            shm.unlink()
+    res.statement.statement['entries'] = Entries.from_arrow(table)
+    res.shared = None
+    return res
+
+
+def release_shared(name):
+    # parent side: block of a worker that never handed it over, if it was created
+    try:
+        shm = shared_memory.SharedMemory(name)
+    except FileNotFoundError:
+        return
+    shm.close()
+    shm.unlink()
+    logger.debug("released shared memory block {}".format(name))
+
+
+def _worker(conn, max_files, max_rss, capture, transport, dedup, boilerplate, geometry, summary_only):
+    from .dedup import DedupIndex
+    from .boilerplate import BoilerplateFilter
+    from .geometry import GeometryCache, set_geometry_cache
+
+    # already imported when started from the preloaded forkserver
+    for module in preload_modules():
+        importlib.import_module(module)
+    known = DedupIndex(dedup).has_statement if dedup is not None else None
+    # pages learned up to the worker start, the parent learns and saves
+    pages = BoilerplateFilter(boilerplate) if boilerplate is not None else None
+    if geometry is not None:
+        set_geometry_cache(GeometryCache(geometry))
+
+    def progress(st, stage):
+        conn.send(('progress', _scraper_name(st), stage))
+
+    done = 0
+    while True:
+        try:
+            pdfpath = conn.recv()
+        except EOFError:
+            break
+        if pdfpath is None:
+            break
+        res = process_file(pdfpath, capture, known, progress, pages, summary_only)
+        # temporary copy spooled for camelot
+        pdfpath.close()
+        if transport == ARROW and res.ok:
+            share_entries(res, lambda name: conn.send(('shared', name)))
+        done += 1
+        recycle = done >= max_files or bool(max_rss and rss() > max_rss)
+        conn.send(('result', res, recycle))
+        if recycle:
+            break
+    conn.close()
+
+
+class WorkerPool:
+    __doc__ = "Pool of preloaded scraping processes recycled after max_files files or max_rss bytes"
+
+    # seconds between two budget checks of a busy worker
+    BUDGET_INTERVAL = 0.2
+
+    def __init__(self, workers=None, max_files=100, max_rss=None, start_method='forkserver', capture=None,
+                 transport=PICKLE, dedup=None, time_budget=None, memory_budget=None, boilerplate=None,
+                 geometry=None, summary_only=False, prestart=False):
+        self.workers = workers or os.cpu_count() or 1
+        self.max_files = max_files
+        self.max_rss = max_rss
+        # profiling.CaptureHook run around each file
+        self.capture = capture
+        if transport not in (PICKLE, ARROW):
+            raise ValueError("unknown transport '{}'".format(transport))
+        self.transport = transport
+        # DedupIndex file: statements of an ingested account and date are skipped before their tables
+        # are extracted (corrected re-issues as well, see DedupIndex.has_statement)
+        self.dedup = str(dedup) if dedup is not None else None
+        # BoilerplateStore file: learned boilerplate pages are skipped by the workers
+        self.boilerplate = str(boilerplate) if boilerplate is not None else None
+        # GeometryCache file shared by the workers, each keeps its own in memory cache otherwise
+        self.geometry = str(geometry) if geometry is not None else None
+        # balances only, statements come back without entries
+        self.summary_only = summary_only
+        # per file wall clock (seconds) and worker RSS (bytes) over which the worker is killed
+        self.time_budget = time_budget
+        self.memory_budget = memory_budget
+        # workers started with the pool rather than on their first file
+        self.prestart = prestart
+        self.killed = 0
+        if start_method not in multiprocessing.get_all_start_methods():
+            start_method = 'spawn'
+        self._ctx = multiprocessing.get_context(start_method)
+        if start_method == 'forkserver':
+            self._ctx.set_forkserver_preload(preload_modules())
+        self.started = 0
+        self.recycled = 0
+        self._lock = threading.Lock()
+        self._tasks = queue.Queue()
+        self._closed = False
+        self._threads = [
+            threading.Thread(target=self._slot, name=f'hsbcpdf-pool-{i}', daemon=True)
+            for i in range(self.workers)
+        ]
+        for t in self._threads:
+            t.start()
+
+    def _spawn(self):
+        parent, child = self._ctx.Pipe()
+        proc = self._ctx.Process(target=_worker, args=(
+            child, self.max_files, self.max_rss, self.capture, self.transport, self.dedup, self.boilerplate, self.geometry,
+            self.summary_only
+        ), daemon=True)
+        proc.start()
+        child.close()
+        with self._lock:
+            self.started += 1
+        logger.debug("started worker {}".format(proc.pid))
+        return proc, parent
+
+    def _retire(self, proc, conn, reason):
+        conn.close()
+        proc.join(5)
+        if proc.is_alive():
+            proc.kill()
+            proc.join()
+        if reason != 'shutdown':
+            with self._lock:
+                self.recycled += 1
+        logger.debug("worker {} retired: {}".format(proc.pid, reason))
+
+    def _slot(self):
+        # one thread per worker: feeds its process and restarts it when needed
+        proc, conn = self._spawn() if self.prestart else (None, None)
+        while True:
+            item = self._tasks.get()
+            if item is None:
+                break
+            future, pdfpath = item
+            if not future.set_running_or_notify_cancel():
+                continue
+            if proc is None:
+                proc, conn = self._spawn()
+            try:
+                # archive members are sent as references, read by the worker
+                conn.send(pdfpath)
+                res, recycle, reason = self._wait(proc, conn, pdfpath)
+                if res.shared is not None:
+                    try:
+                        attach_entries(res)
+                    except Exception as e:
+                        logger.exception("failed receiving entries of {}".format(pdfpath))
+                        res = FileResult(source_name(pdfpath), 'error', error='{}: {}'.format(type(e).__name__, e), pid=proc.pid)
+            except (EOFError, OSError):
+                proc.join(5)
+                res = FileResult(source_name(pdfpath), 'error',
+                                 error='worker {} died with exit code {}'.format(proc.pid, proc.exitcode),
+                                 pid=proc.pid)
+                recycle, reason = True, 'died'
+            future.set_result(res)
+            if recycle:
+                self._retire(proc, conn, reason)
+                proc = conn = None
+        if proc is not None:
+            conn.send(None)
+            self._retire(proc, conn, 'shutdown')
+
+    def _wait(self, proc, conn, pdfpath):
+        # result of the file being processed, unless the worker goes over a budget first
+        start = time.perf_counter()
+        budgeted = self.time_budget is not None or self.memory_budget is not None
+        scraper, stage = None, 'queued'
+        # shared memory block announced by the worker and not handed over yet
+        shared = None
+
+        def receive():
+            nonlocal scraper, stage, shared
+            msg = conn.recv()
+            if msg[0] == 'progress':
+                scraper, stage = msg[1] or scraper, msg[2]
+            elif msg[0] == 'shared':
+                shared = msg[1]
+            return msg
+
+        while True:
+            try:
+                msg = receive() if conn.poll(self.BUDGET_INTERVAL if budgeted else None) else None
+            except (EOFError, OSError):
+                if shared is not None:
+                    release_shared(shared)
+                raise
+            if msg is not None:
+                if msg[0] == 'result':
+                    return msg[1], msg[2], 'recycled'
+                continue
+            elapsed = time.perf_counter() - start
+            over = None
+            if self.time_budget is not None and elapsed > self.time_budget:
+                over = 'time budget of {}s exceeded'.format(self.time_budget)
+            elif self.memory_budget is not None:
+                used = rss(proc.pid)
+                if used is not None and used > self.memory_budget:
+                    over = 'memory budget exceeded ({} MiB)'.format(used >> 20)
+            if over is not None:
+                proc.kill()
+                proc.join()
+                # messages sent before the kill, the block name among them
+                try:
+                    while conn.poll():
+                        receive()
+                except (EOFError, OSError):
+                    pass
+                if shared is not None:
+                    release_shared(shared)
+                with self._lock:
+                    self.killed += 1
+                logger.warning("{}: killed worker {} in {}{}: {}".format(
+                    source_name(pdfpath), proc.pid, stage, f' of {scraper}' if scraper else '', over))
+                return FileResult(source_name(pdfpath), BUDGET, scraper=scraper, error='{} in {}'.format(over, stage),
+                                  elapsed=elapsed, pid=proc.pid, stage=stage), True, 'killed'
+
+    def submit(self, pdfpath):
+        if self._closed:
+            raise RuntimeError('cannot submit to a closed WorkerPool')
+        future = Future()
+        try:
+            # TypeError for what can't be read as a statement
+            source = as_source(pdfpath)
+        except ScraperException as e:
+            # missing file: reported as the result of the file, like other failures
+            future.set_result(FileResult(source_name(pdfpath), failure_status(e), error='{}: {}'.format(type(e).__name__, e)))
+            return future
+        self._tasks.put((future, source))
+        return future
+
+    def map(self, pdfpaths):
+        # FileResult of each path, in submission order
+        futures = [self.submit(p) for p in pdfpaths]
+        for f in futures:
+            yield f.result()
+
+    def shutdown(self, wait=True):
+        if self._closed:
+            return
+        self._closed = True
+        for _ in self._threads:
+            self._tasks.put(None)
+        if wait:
+            for t in self._threads:
+                t.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.shutdown()
+
+
+def _pdf_paths(paths):
+    for p in map(pathlib.Path, paths):
+        if p.is_dir():
+            for f in sorted(p.rglob('*')):
+                if f.suffix.lower() == '.pdf':
+                    yield f
+                elif is_archive(f):
+                    yield from iter_archive(f)
+        elif is_archive(p):
+            yield from iter_archive(p)
+        else:
+            yield p
+
+
+def main(argv=None):
+    from .exporters import JsonlExporter, ParquetDatasetWriter, SqliteExporter
+    from .profiling import CaptureHook, outliers_table
+    from .dedup import DedupIndex
+    from .balances import BalanceChain
+    from .boilerplate import BoilerplateFilter
+
+    parser = argparse.ArgumentParser(prog='python -m hsbcpdf.helpers.pool', description='Scrape statements in batch')
+    parser.add_argument('paths', nargs='+', help='pdf files, zip/tar archives or directories')
+    parser.add_argument('-o', '--output', help='NDJSON export of the statements (.gz to compress)')
+    parser.add_argument('--sqlite', help='SQLite database the statements are upserted into')
+    parser.add_argument('--parquet', help='root of a partitioned Parquet dataset the entries are appended to')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--max-files', type=int, default=100, help='files processed by a worker before it is replaced')
+    parser.add_argument('--max-rss', type=int, default=None, help='worker RSS (MiB) over which it is replaced')
+    parser.add_argument('--transport', choices=(PICKLE, ARROW), default=PICKLE,
+                        help='arrow: entries come back from the workers through shared memory (needs the parquet extra)')
+    parser.add_argument('--dedup', help='deduplication index: duplicate statements and known entries are dropped')
+    parser.add_argument('--skip-known', action='store_true',
+                        help='with --dedup: statements of a known account and date are skipped before their tables '
+                             'are extracted, corrected re-issues included')
+    parser.add_argument('--balances', help='balance chain index the statements are reconciled against')
+    parser.add_argument('--boilerplate', help='boilerplate page store: pages learned as boilerplate are not laid out')
+    parser.add_argument('--geometry', help='table geometry cache shared by the workers and kept between runs')
+    parser.add_argument('--summary-only', action='store_true',
+                        help='balances only: transaction tables are not extracted, statements have no entries')
+    parser.add_argument('--time-budget', type=float, default=None, help='seconds after which a file is killed')
+    parser.add_argument('--memory-budget', type=int, default=None, help='worker RSS (MiB) over which a file is killed')
+    parser.add_argument('--profile-dir', help='keep cProfile/tracemalloc captures of outliers in this directory')
+    parser.add_argument('--profile-seconds', type=float, default=None, help='capture files slower than this')
+    parser.add_argument('--profile-memory', type=int, default=None, help='capture files allocating more MiB than this')
+    parser.add_argument('--top', type=int, default=20, help='outliers listed in the summary')
+    args = parser.parse_args(argv)
+    if args.summary_only and args.dedup:
+        # statements would be recorded as ingested without their entries
+        parser.error('--summary-only cannot be used with --dedup')
+    if args.summary_only and args.sqlite:
+        # statements stored with their entries would be rewritten without them
+        parser.error('--summary-only cannot be used with --sqlite')
+    if args.skip_known and not args.dedup:
+        parser.error('--skip-known needs --dedup')
+
+    capture = None
+    if args.profile_dir:
+        capture = CaptureHook(
+            args.profile_dir,
+            max_seconds=args.profile_seconds,
+            max_memory=args.profile_memory * 2 ** 20 if args.profile_memory is not None else None
+        )
+    exporters = []
+    if args.output:
+        exporters.append(JsonlExporter.open(args.output))
+    if args.sqlite:
+        exporters.append(SqliteExporter.open(args.sqlite))
+    if args.parquet:
+        exporters.append(ParquetDatasetWriter.open(args.parquet))
+    index = DedupIndex(args.dedup) if args.dedup else None
+    chain = BalanceChain(args.balances) if args.balances else None
+    pages = BoilerplateFilter(args.boilerplate) if args.boilerplate else None
+    results = []
+    with WorkerPool(args.workers, args.max_files, args.max_rss and args.max_rss * 2 ** 20, capture=capture,
+                    transport=args.transport, dedup=args.dedup if args.skip_known else None, time_budget=args.time_budget,
+                    memory_budget=args.memory_budget and args.memory_budget * 2 ** 20,
+                    boilerplate=args.boilerplate, geometry=args.geometry, summary_only=args.summary_only) as pool:
+        for res in pool.map(_pdf_paths(args.paths)):
+            results.append(res)
+            if res.pages is not None and pages is not None:
+                pages.learn(res.pages)
+            if res.ok and index is not None:
+                # copies processed side by side in the same batch
+                if index.is_duplicate(res.statement):
+                    res.status, res.statement = 'duplicate', None
+                    res.error = 'statement already ingested'
+                else:
+                    entries = res.statement.statement['entries']
+                    new = index.ingest(res.statement)
+                    if not new.all():
+                        logger.info("{}: {} entries already ingested".format(res.path, len(new) - new.sum()))
+                        res.statement.statement['entries'] = entries.take(new)
+            if res.ok:
+                for exporter in exporters:
+                    exporter.write(res.statement)
+                if chain is not None:
+                    for issue in chain.add(res.statement):
+                        logger.warning("{}: {}".format(res.path, issue))
+            elif res.status == 'duplicate':
+                logger.info("{}: {}".format(res.path, res.error))
+            else:
+                logger.warning("{}: {} {}".format(res.path, res.status, res.error))
+            # the statement is not needed past its export
+            res.statement = None
+    for exporter in exporters:
+        exporter.close()
+    if index is not None:
+        index.close()
+    if pages is not None:
+        pages.save()
+
+    counts = {}
+    for r in results:
+        counts[r.status] = counts.get(r.status, 0) + 1
+    sys.stdout.write('{} files: {}\n'.format(len(results), ', '.join('{} {}'.format(n, s) for s, n in sorted(counts.items()))))
+    if chain is not None:
+        issues = chain.issues()
+        if issues:
+            sys.stdout.write('{} balance chain issues\n{}'.format(len(issues), chain.report()))
+        chain.close()
+    if pages is not None:
+        sys.stdout.write(pages.report())
+    if capture is not None:
+        summary = outliers_table(results, args.top)
+        (pathlib.Path(args.profile_dir) / 'outliers.txt').write_text(summary, encoding='utf-8')
+        sys.stdout.write(summary)
+    return 0 if counts.get(OK, 0) + counts.get('duplicate', 0) == len(results) else 1
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING)
+    # run the imported module so that workers and results share its classes
+    from hsbcpdf.helpers.pool import main
+    sys.exit(main())
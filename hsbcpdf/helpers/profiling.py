@@ -0,0 +1,317 @@
+# -----------------------------------------------------------------------------
+# Placeholder query profiling
+#
+# Opt-in: while a QueryProfiler is started, every memoized placeholder query
+# (TextBox.query, TextLabel/HLine/VLine.querys) is recorded with its
+# parameters, call arguments, the pdfquery selectors it ran, the number of
+# candidates they selected, the number of results and its elapsed time.
+#
+#   profiler = QueryProfiler()
+#   for path in paths:
+#       with profiler.statement(path):
+#           ScraperFactory.get_scraper(path).process()
+#   profiler.write_report(path, "report.txt")
+#   profiler.write_hotspots("hotspots.txt")
+
+import argparse
+import cProfile
+import hashlib
+import json
+import logging
+import pathlib
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+from . import utils
+from .sources import source_name
+
+logger = logging.getLogger("hsbcpdf.helpers.profiling")
+
+
+def placeholder_names():
+    # "<Class>.<attribute>" of the placeholders declared on statement classes, by id
+    from .accountstatement import BaseStatement
+    from .templates import QueryPlan
+
+    names = {}
+
+    def add(value, name):
+        if isinstance(value, (list, tuple)):
+            # signatures
+            for i, v in enumerate(value):
+                add(v, '{}[{}]'.format(name, i))
+        elif isinstance(value, (utils.PdfComponent, QueryPlan)):
+            names.setdefault(id(value), name)
+            # labels anchoring a text box
+            for sub in ('above', 'bellow'):
+                add(getattr(value, sub, None), '{}.{}'.format(name, sub))
+
+    todo = [BaseStatement]
+    while todo:
+        cls = todo.pop(0)
+        todo += cls.__subclasses__()
+        for attr, value in vars(cls).items():
+            add(value, '{}.{}'.format(cls.__name__, attr))
+    return names
+
+
+def _count(res):
+    if res is None:
+        return 0
+    if isinstance(res, (list, tuple)):
+        return len(res)
+    return 1
+
+
+def _section(s):
+    return None if s is None else 'p{} {:.1f}-{:.1f}'.format(s.page, s.yup, s.ybot)
+
+
+class QueryProfiler:
+    __doc__ = "Records placeholder queries per statement and aggregates them in a hotspot table"
+
+    def __init__(self):
+        self.records = {}
+        self._current = None
+        self._stack = []
+        self._previous = None
+        self._names = None
+
+    def start(self):
+        self._previous = utils.set_query_profiler(self)
+        return self
+
+    def stop(self):
+        utils.set_query_profiler(self._previous)
+
+    @contextmanager
+    def statement(self, key):
+        # queries made in the block are reported under key (usually the pdf path)
+        key = str(key)
+        self.records.setdefault(key, [])
+        previous, self._current = self._current, key
+        self.start()
+        try:
+            yield self.records[key]
+        finally:
+            self.stop()
+            self._current = previous
+
+    def enter(self, component, query, arguments):
+        frame = {
+            'statement': self._current,
+            'component': component,
+            'query': query,
+            'page': arguments.get('page'),
+            'after': _section(arguments.get('after')),
+            'before': _section(arguments.get('before')),
+            'depth': len(self._stack),
+            'selectors': [],
+            'candidates': 0,
+            'start': time.perf_counter(),
+        }
+        self._stack.append(frame)
+        return frame
+
+    def selected(self, selector, count):
+        if self._stack:
+            self._stack[-1]['selectors'].append(selector)
+            self._stack[-1]['candidates'] += count
+
+    def exit(self, frame, res=None, cached=False, error=None):
+        frame['elapsed'] = time.perf_counter() - frame.pop('start')
+        frame['cached'] = cached
+        frame['results'] = _count(res)
+        frame['error'] = None if error is None else '{}: {}'.format(type(error).__name__, error)
+        self._stack.pop()
+        self.records.setdefault(frame['statement'], []).append(frame)
+
+    def name(self, frame):
+        if self._names is None:
+            self._names = placeholder_names()
+        component = frame['component']
+        return self._names.get(id(component), repr(component))
+
+    def report(self, key):
+        lines = ['{:<45} {:<16} {:>4} {:>4} {:>6} {:>4} {:>6} {:>9}  {}'.format(
+            'placeholder', 'query', 'page', 'sel', 'cand', 'res', 'cached', 'ms', 'parameters / selectors')]
+        for f in sorted(self.records.get(str(key), []), key=lambda f: f['elapsed'], reverse=True):
+            lines.append('{:<45} {:<16} {:>4} {:>4} {:>6} {:>4} {:>6} {:>9.3f}  {!r}{}{}{}'.format(
+                '  ' * f['depth'] + self.name(f)[:45 - 2 * f['depth']],
+                f['query'],
+                f['page'] or '-',
+                len(f['selectors']),
+                f['candidates'] if f['selectors'] else '-',
+                f['results'],
+                'yes' if f['cached'] else 'no',
+                f['elapsed'] * 1000,
+                f['component'],
+                f' after {f["after"]}' if f['after'] else '',
+                f' before {f["before"]}' if f['before'] else '',
+                f' ERROR {f["error"]}' if f['error'] else '',
+            ))
+            lines += ['{:>80}{}'.format('', s) for s in f['selectors']]
+        return '\n'.join(lines) + '\n'
+
+    def hotspots(self):
+        # (placeholder, query) -> aggregates over all statements, slowest first
+        spots = {}
+        for frames in self.records.values():
+            for f in frames:
+                spot = spots.setdefault((self.name(f), f['query']), {
+                    'calls': 0, 'cached': 0, 'errors': 0, 'selectors': 0, 'candidates': 0, 'elapsed': 0., 'max': 0.})
+                spot['calls'] += 1
+                spot['cached'] += f['cached']
+                spot['errors'] += f['error'] is not None
+                spot['selectors'] += len(f['selectors'])
+                spot['candidates'] += f['candidates']
+                spot['elapsed'] += f['elapsed']
+                spot['max'] = max(spot['max'], f['elapsed'])
+        return sorted(spots.items(), key=lambda i: i[1]['elapsed'], reverse=True)
+
+    def hotspot_table(self, limit=None):
+        lines = ['{:<45} {:<16} {:>6} {:>6} {:>6} {:>6} {:>8} {:>10} {:>9} {:>9}'.format(
+            'placeholder', 'query', 'calls', 'cached', 'errors', 'sel', 'cand', 'total ms', 'mean ms', 'max ms')]
+        for (name, query), s in self.hotspots()[:limit]:
+            lines.append('{:<45} {:<16} {:>6} {:>6} {:>6} {:>6} {:>8} {:>10.3f} {:>9.3f} {:>9.3f}'.format(
+                name[:45], query, s['calls'], s['cached'], s['errors'], s['selectors'], s['candidates'],
+                s['elapsed'] * 1000, s['elapsed'] * 1000 / s['calls'], s['max'] * 1000))
+        return '\n'.join(lines) + '\n'
+
+    def write_report(self, key, path):
+        pathlib.Path(path).write_text(self.report(key), encoding='utf-8')
+
+    def write_hotspots(self, path, limit=None):
+        pathlib.Path(path).write_text(self.hotspot_table(limit), encoding='utf-8')
+
+
+def max_rss():
+    # peak resident set size of the process in bytes, None when unknown
+    try:
+        import resource
+    except ImportError:
+        return None
+    # KiB on Linux, bytes on macOS
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == 'darwin' else 1024)
+
+
+class Capture:
+    __doc__ = "Profiling of one file, kept only when it goes over the CaptureHook thresholds"
+
+    def __init__(self, hook, pdfpath):
+        self.hook = hook
+        self.pdfpath = pathlib.Path(source_name(pdfpath))
+        self.tracing = hook.max_memory is not None
+        # tracing started by someone else is left running
+        self.started = self.tracing and not tracemalloc.is_tracing()
+        if self.started:
+            tracemalloc.start(hook.frames)
+        if self.tracing:
+            tracemalloc.reset_peak()
+        self.profile = cProfile.Profile()
+        self.profile.enable()
+
+    def stop(self, res, st=None):
+        # decides on the FileResult of the file: sets its peak_memory and captures
+        self.profile.disable()
+        res.peak_memory = tracemalloc.get_traced_memory()[1] if self.tracing else None
+        reasons = []
+        if self.hook.max_seconds is not None and res.elapsed > self.hook.max_seconds:
+            reasons.append('elapsed {:.3f}s > {}s'.format(res.elapsed, self.hook.max_seconds))
+        if self.tracing and res.peak_memory > self.hook.max_memory:
+            reasons.append('peak memory {} > {}'.format(res.peak_memory, self.hook.max_memory))
+        if reasons:
+            scraper = '{}.{}'.format(st.st_bank, type(st).__name__) if st is not None else res.status
+            # same named files of different directories or archives don't overwrite each other
+            digest = hashlib.sha1(str(self.pdfpath).encode('utf-8')).hexdigest()[:8]
+            stem = self.hook.outdir / '{}-{}-{}'.format(self.pdfpath.stem, scraper, digest)
+            self.hook.outdir.mkdir(parents=True, exist_ok=True)
+            res.captures = [str(stem) + '.prof', str(stem) + '.json']
+            self.profile.dump_stats(res.captures[0])
+            info = {
+                'path': str(self.pdfpath),
+                'scraper': res.scraper,
+                'status': res.status,
+                'elapsed': res.elapsed,
+                'peak_memory': res.peak_memory,
+                'max_rss': max_rss(),
+                'reasons': reasons,
+            }
+            if self.tracing:
+                stats = tracemalloc.take_snapshot().statistics('lineno')[:self.hook.top]
+                info['allocations'] = [{'trace': str(s.traceback), 'size': s.size, 'count': s.count} for s in stats]
+            pathlib.Path(res.captures[1]).write_text(json.dumps(info, indent=2), encoding='utf-8')
+            logger.info("{} over thresholds ({}), captured in {}".format(self.pdfpath, ', '.join(reasons), stem))
+        if self.started:
+            tracemalloc.stop()
+        return res
+
+
+class CaptureHook:
+    __doc__ = "Captures cProfile and tracemalloc dumps of files slower than max_seconds or allocating over max_memory bytes"
+
+    def __init__(self, outdir, max_seconds=None, max_memory=None, top=30, frames=10):
+        self.outdir = pathlib.Path(outdir)
+        self.max_seconds = max_seconds
+        # tracemalloc (and its overhead) only runs when a memory threshold is given
+        self.max_memory = max_memory
+        self.top = top
+        self.frames = frames
+
+    def start(self, pdfpath):
+        return Capture(self, pdfpath)
+
+
+def outliers_table(results, top=20):
+    # slowest and most allocating files of a batch, with their captures
+    results = list(results)
+    lines = []
+    for title, key in (('elapsed', lambda r: r.elapsed), ('peak memory', lambda r: r.peak_memory or 0)):
+        ranked = sorted(results, key=key, reverse=True)[:top]
+        if not ranked or not key(ranked[0]):
+            continue
+        lines.append('top {} by {}'.format(len(ranked), title))
+        lines.append('{:>9} {:>12}  {:<13} {:<40} {}'.format('seconds', 'peak MiB', 'status', 'scraper', 'file / captures'))
+        for r in ranked:
+            lines.append('{:>9.3f} {:>12} {:<13} {:<40} {}{}'.format(
+                r.elapsed,
+                '{:.1f}'.format(r.peak_memory / 2 ** 20) if r.peak_memory is not None else '-',
+                r.status,
+                (r.scraper or '-')[-40:],
+                r.path,
+                ''.join('\n{:>78}{}'.format('', c) for c in r.captures or [])
+            ))
+        lines.append('')
+    return '\n'.join(lines) + '\n'
+
+
+def main(argv=None):
+    from ..scraper import ScraperFactory
+
+    parser = argparse.ArgumentParser(prog='python -m hsbcpdf.helpers.profiling',
+                                     description='Profile placeholder queries of statements')
+    parser.add_argument('pdf', nargs='+')
+    parser.add_argument('-o', '--output', default='.', help='directory of the reports')
+    parser.add_argument('--top', type=int, default=30, help='hotspot rows printed')
+    args = parser.parse_args(argv)
+
+    outdir = pathlib.Path(args.output)
+    outdir.mkdir(parents=True, exist_ok=True)
+    profiler = QueryProfiler()
+    for path in args.pdf:
+        try:
+            with profiler.statement(path):
+                st = ScraperFactory.get_scraper(path)
+                st.process()
+        except utils.ScraperException as e:
+            logger.warning("{}: {}".format(path, e))
+        profiler.write_report(path, outdir / (pathlib.Path(path).stem + '.queries.txt'))
+    profiler.write_hotspots(outdir / 'hotspots.txt')
+    sys.stdout.write(profiler.hotspot_table(args.top))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING)
+    main()
@@ -0,0 +1,159 @@
+# -----------------------------------------------------------------------------
+# Statement template registry
+#
+# Each bank package declares its templates in a light manifest module (only
+# placeholders from helpers.utils, no table extraction code), exposed through
+# the "hsbcpdf.templates" entry point group. Probing runs on manifests only,
+# the bank module of the matching template is imported afterwards.
+
+import logging
+from importlib import metadata
+
+from .utils import *
+from . import backends
+from .sources import as_source
+
+logger = logging.getLogger("hsbcpdf.helpers.registry")
+
+ENTRY_POINT_GROUP = 'hsbcpdf.templates'
+
+# manifests shipped with the package, also used when running from a source tree
+BUILTIN_MANIFESTS = [
+    'hsbcpdf.hsbchk.manifest:TEMPLATES',
+    'hsbcpdf.societegenerale.manifest:TEMPLATES',
+    'hsbcpdf.hsbcfr.manifest:TEMPLATES',
+]
+
+
+def probe_format(pdf, statement_format):
+    if not statement_format:
+        return True
+    twidth, theight = statement_format
+    backend = backends.native_backend(pdf)
+    if backend is not None:
+        dwidth, dheight = backend.page_size(0)
+    else:
+        dwidth, dheight = pdf.get_page(0).mediabox[2:]
+    if round(dwidth, 0) != twidth or round(dheight, 0) != theight:
+        logger.debug("document size do not fit: [{},{}] vs [{}, {}]".format(
+            round(dwidth, 0),
+            round(dheight, 0),
+            twidth,
+            theight
+        ))
+        return False
+    return True
+
+
+def probe_signature(pdf, signature):
+    for elem in signature:
+        if not elem.exists(pdf):
+            return False
+    return True
+
+
+class TemplateManifest:
+    __doc__ = "Signatures and location of a statement template"
+
+    def __init__(self, name, target, bank_signature, type_signature=(), statement_format=None,
+                 backend=backends.PDFMINER, priority=100, laparams=None):
+        self.name = name
+        # "package.module:Class" of the BaseStatement implementing the template
+        self.target = target
+        self.bank_signature = bank_signature
+        self.type_signature = type_signature
+        self.statement_format = statement_format
+        self.backend = backend
+        self.priority = priority
+        # pdfminer layout parameters (LAParams keywords) the template was checked with, None: pdfquery's defaults
+        self.laparams = laparams
+
+    def probe(self, pdf, cache=None):
+        # cache holds outcomes shared between templates of a bank within one probing
+        cache = {} if cache is None else cache
+        checks = (
+            ('format', self.statement_format, probe_format),
+            ('bank', tuple(self.bank_signature), probe_signature),
+            ('type', tuple(self.type_signature), probe_signature),
+        )
+        for kind, value, check in checks:
+            key = (kind, value)
+            if key not in cache:
+                cache[key] = check(pdf, value)
+            if not cache[key]:
+                logger.debug("pdf file does not match {} of {}".format(kind, self.name))
+                return False
+        logger.debug("pdf file matches {}".format(self.name))
+        return True
+
+    def load(self):
+        return import_object(self.target)
+
+    def __repr__(self):
+        return "<TemplateManifest {} -> {}>".format(self.name, self.target)
+
+
+class TemplateRegistry:
+    __doc__ = "Ordered set of template manifests, from built-in modules and entry points"
+
+    def __init__(self, sources=None, entry_points=True):
+        self.sources = list(BUILTIN_MANIFESTS if sources is None else sources)
+        self.entry_points = entry_points
+        self._manifests = None
+
+    def register(self, manifest):
+        manifests = self.manifests()
+        manifests[:] = [m for m in manifests if m.name != manifest.name] + [manifest]
+        manifests.sort(key=lambda m: m.priority)
+
+    def _load(self):
+        found = [import_object(s) for s in self.sources]
+        if self.entry_points:
+            for ep in metadata.entry_points(group=ENTRY_POINT_GROUP):
+                try:
+                    found.append(ep.load())
+                except Exception as e:
+                    logger.warning("could not load templates from entry point '{}': {}".format(ep.name, e))
+        manifests = {}
+        for f in found:
+            for m in (f if isinstance(f, (list, tuple)) else [f]):
+                manifests.setdefault(m.name, m)
+        return sorted(manifests.values(), key=lambda m: m.priority)
+
+    def manifests(self):
+        if self._manifests is None:
+            self._manifests = self._load()
+        return self._manifests
+
+    def pdf_backend(self):
+        # probe with pdfium only when all templates opted in
+        choices = {m.backend for m in self.manifests()}
+        return choices.pop() if len(choices) == 1 else backends.PDFMINER
+
+    def laparams(self):
+        # documents are laid out while probing: with the profile of all templates, or the defaults
+        return backends.common_laparams(m.laparams for m in self.manifests())
+
+    def probe(self, pdf):
+        cache = {}
+        for m in self.manifests():
+            if m.probe(pdf, cache):
+                return m
+        return None
+
+    def get_scraper(self, pdfpath, pdf=None):
+        # file path, bytes, file-like object or sources.PdfSource
+        source = as_source(pdfpath)
+        opened = pdf is None
+        if opened:
+            pdf = backends.open_document(source, self.pdf_backend(), self.laparams())
+        m = self.probe(pdf)
+        if m is None:
+            raise UnrecognizedException(f'"{source}" unrecognized Statement format')
+        if opened and m.backend != backends.backend_name(pdf):
+            # template checked on another backend than the probing one, which stays its fallback
+            pdf = backends.open_document(source, m.backend, m.laparams, fallback=pdf)
+        return m.load()(source, pdf)
+
+
+registry = TemplateRegistry()
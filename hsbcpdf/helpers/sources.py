@@ -0,0 +1,176 @@
+# -----------------------------------------------------------------------------
+# Statement sources
+#
+# A statement can be read from a file path, from bytes or a file-like object,
+# or from a member of a zip/tar archive (read in memory, the archive is never
+# extracted). pdfminer and pdfium read the document from a stream; the tools
+# which only take a path (camelot) get a single temporary file per source,
+# written on first request and removed with the source.
+#
+#   for source in iter_archive("downloads-2019.zip"):
+#       st = ScraperFactory.get_scraper(source).process()
+
+import abc
+import io
+import logging
+import os
+import tarfile
+import tempfile
+import weakref
+import zipfile
+
+logger = logging.getLogger("hsbcpdf.helpers.sources")
+
+ARCHIVE_SUFFIXES = ('.zip', '.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tar.xz')
+
+
+class PdfSource(abc.ABC):
+    __doc__ = "Where a statement is read from: a name for reports, a stream for parsers, a path when needed"
+
+    name = None
+
+    @abc.abstractmethod
+    def open(self):
+        """New binary stream over the document, closed by the caller"""
+
+    @abc.abstractmethod
+    def path(self):
+        """Path of the document on disk, for the tools which only read files"""
+
+    def close(self):
+        pass
+
+    def __str__(self):
+        return self.name
+
+    def __repr__(self):
+        return "<{} {}>".format(type(self).__name__, self.name)
+
+
+class FileSource(PdfSource):
+    __doc__ = "PDF file on disk"
+
+    def __init__(self, path):
+        # utils imports backends, which imports this module
+        from .utils import ScraperException
+
+        path = os.fspath(path)
+        if not os.path.exists(path):
+            raise ScraperException(f'"{path}" file not found')
+        if not os.path.isfile(path):
+            raise ScraperException(f'"{path}" not a file')
+        self.name = str(path)
+        self._path = path
+
+    def open(self):
+        return open(self._path, 'rb')
+
+    def path(self):
+        return self._path
+
+
+class BytesSource(PdfSource):
+    __doc__ = "PDF document held in memory, spooled to a temporary file when a path is required"
+
+    def __init__(self, data, name='<bytes>'):
+        self.name = name
+        self._data = bytes(data) if data is not None else None
+        self._spooled = None
+        self._finalizer = None
+
+    def data(self):
+        return self._data
+
+    def open(self):
+        return io.BytesIO(self.data())
+
+    def path(self):
+        if self._spooled is None:
+            fd, self._spooled = tempfile.mkstemp(suffix='.pdf', prefix='hsbcpdf-')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(self.data())
+            # removed with the source at the latest
+            self._finalizer = weakref.finalize(self, _unlink, self._spooled)
+            logger.debug("{} spooled to {}".format(self.name, self._spooled))
+        return self._spooled
+
+    def close(self):
+        if self._finalizer is not None:
+            self._finalizer()
+        self._spooled = self._finalizer = None
+
+    def __getstate__(self):
+        # content crosses process boundaries, the temporary file doesn't
+        return {'name': self.name, '_data': self._data, '_spooled': None, '_finalizer': None}
+
+
+def _unlink(path):
+    try:
+        os.unlink(path)
+    except OSError:
+        pass
+
+
+class ArchiveMember(BytesSource):
+    __doc__ = "PDF member of a zip or tar archive, read in memory on first use"
+
+    def __init__(self, archive, member):
+        super().__init__(None, '{}!{}'.format(archive, member))
+        self.archive = os.fspath(archive)
+        self.member = member
+
+    def data(self):
+        if self._data is None:
+            if zipfile.is_zipfile(self.archive):
+                with zipfile.ZipFile(self.archive) as z:
+                    self._data = z.read(self.member)
+            else:
+                with tarfile.open(self.archive) as t:
+                    self._data = t.extractfile(self.member).read()
+        return self._data
+
+    def __getstate__(self):
+        # only the reference is sent: the member is read by the receiving process
+        return dict(super().__getstate__(), _data=None, archive=self.archive, member=self.member)
+
+
+def is_archive(path):
+    return str(path).lower().endswith(ARCHIVE_SUFFIXES) and os.path.isfile(path)
+
+
+def iter_archive(path):
+    # one ArchiveMember per PDF of the archive, in archive order
+    path = os.fspath(path)
+    if zipfile.is_zipfile(path):
+        with zipfile.ZipFile(path) as z:
+            members = [i.filename for i in z.infolist() if not i.is_dir()]
+    else:
+        with tarfile.open(path) as t:
+            members = [m.name for m in t.getmembers() if m.isfile()]
+    for m in members:
+        if m.lower().endswith('.pdf'):
+            yield ArchiveMember(path, m)
+
+
+def source_name(obj):
+    # name of a path or source without reading it
+    if isinstance(obj, PdfSource):
+        return obj.name
+    if isinstance(obj, (bytes, bytearray, memoryview)):
+        return '<bytes>'
+    if isinstance(obj, (str, os.PathLike)):
+        return os.fspath(obj)
+    return str(getattr(obj, 'name', obj))
+
+
+def as_source(obj):
+    if isinstance(obj, PdfSource):
+        return obj
+    if isinstance(obj, (bytes, bytearray, memoryview)):
+        return BytesSource(obj)
+    if hasattr(obj, 'read'):
+        name = getattr(obj, 'name', None)
+        return BytesSource(obj.read(), str(name) if name is not None else '<stream>')
+    if isinstance(obj, (str, os.PathLike)):
+        return FileSource(obj)
+    raise TypeError('cannot read a statement from {}'.format(type(obj).__name__))
@@ -0,0 +1,89 @@
+# -----------------------------------------------------------------------------
+# camelot table extraction jobs
+#
+# Templates describe the table areas to extract as jobs (one page each, or a
+# page range when they don't need per-page results) and run them all at once
+# with read_tables. Jobs of a statement are spread on a process pool when
+# there are enough of them, results come back in job order.
+
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from .utils import LazyModule
+
+logger = logging.getLogger("hsbcpdf.helpers.tables")
+
+camelot = LazyModule('camelot')
+
+# processes used to extract the pages of one statement (HSBCPDF_TABLE_WORKERS), 1 disables it
+TABLE_WORKERS = int(os.environ.get('HSBCPDF_TABLE_WORKERS', min(4, os.cpu_count() or 1)))
+# under this number of jobs the pool round trips cost more than they save
+MIN_PARALLEL_JOBS = 3
+
+_executor = None
+
+
+def table_job(pages, **kwargs):
+    # keyword arguments of camelot.read_pdf for one area on pages ("3", "2-5", ...)
+    return dict(kwargs, pages=str(pages), flavor=kwargs.get('flavor', 'stream'))
+
+
+def page_jobs(first, last, **kwargs):
+    # one job per page so that pages can be extracted in parallel
+    return [table_job(p, **kwargs) for p in range(first, last + 1)]
+
+
+def _read(pdfpath, job):
+    return [t.df for t in camelot.read_pdf(pdfpath, **job)]
+
+
+def _warm():
+    # preload: pay the camelot import once per worker instead of in its first job
+    import camelot
+
+
+def _get_executor(workers):
+    global _executor
+    if _executor is None or _executor._max_workers != workers:
+        if _executor is not None:
+            _executor.shutdown(wait=False)
+        method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+        _executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context(method),
+            initializer=_warm
+        )
+    return _executor
+
+
+def skipped_jobs(jobs, skip_pages):
+    # flags of the single page jobs on skip_pages
+    return [j['pages'].isdigit() and int(j['pages']) in skip_pages for j in jobs]
+
+
+def read_tables(pdfpath, jobs, workers=None, skip_pages=()):
+    """
+    Run camelot on each job and give back, in job order, the list of table
+    DataFrames found by each of them.
+    Single page jobs on skip_pages (boilerplate pages) find no table without
+    running camelot.
+    Sequential when parallelism is disabled, for small statements and inside
+    daemonic processes (WorkerPool workers can't start children).
+    """
+    workers = TABLE_WORKERS if workers is None else workers
+    jobs = list(jobs)
+    skipped = skipped_jobs(jobs, skip_pages)
+    todo = [j for j, skip in zip(jobs, skipped) if not skip]
+    if len(todo) < len(jobs):
+        logger.debug("{} table jobs on skipped pages".format(len(jobs) - len(todo)))
+    if workers <= 1 or len(todo) < MIN_PARALLEL_JOBS or multiprocessing.current_process().daemon:
+        results = [_read(pdfpath, job) for job in todo]
+    else:
+        logger.debug("extract {} table jobs on {} processes".format(len(todo), workers))
+        executor = _get_executor(workers)
+        futures = [executor.submit(_read, str(pdfpath), job) for job in todo]
+        results = [f.result() for f in futures]
+    done = iter(results)
+    return [[] if skip else next(done) for skip in skipped]
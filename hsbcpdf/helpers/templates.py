@@ -0,0 +1,163 @@
+# -----------------------------------------------------------------------------
+# Declarative templates and query plans
+#
+# A template can be written as data (JSON, or YAML when PyYAML is installed):
+# an existing statement class as base plus the class attributes to override,
+# placeholders given as {"TextBox": {...}}, {"HLine": {...}}, ...
+#
+#   {"templates": [{
+#       "class": "AccountV2",
+#       "base": "hsbcpdf.societegenerale.statements:Account",
+#       "attributes": {
+#           "_STATEMENT_FORMAT": [595, 842],
+#           "ph_acc_number": {"TextBox": {"page": 1, "bbox": "410,758,570,777"}}
+#       }
+#   }]}
+#
+# Whatever their origin, the placeholders of a statement class are compiled
+# into a QueryPlan: fixed page text boxes grouped per page and text labels
+# are resolved in one sweep over each page's text lines, filling the
+# document query cache before the template queries them one by one. With
+# pdfminer, the boxes (header fields) are read from the text of their own
+# pages first: only the label sweep lays out the document.
+
+import logging
+import json
+import pathlib
+from collections import defaultdict
+
+from .utils import *
+from . import utils
+
+logger = logging.getLogger("hsbcpdf.helpers.templates")
+
+PLACEHOLDERS = {c.__name__: c for c in (TextBox, TextLabel, HLine, VLine, Bbox)}
+
+
+def build_value(value):
+    if isinstance(value, dict) and len(value) == 1 and next(iter(value)) in PLACEHOLDERS:
+        kind, params = next(iter(value.items()))
+        return PLACEHOLDERS[kind](**{k: build_value(v) for k, v in params.items()})
+    if isinstance(value, list):
+        return [build_value(v) for v in value]
+    if isinstance(value, dict):
+        return {k: build_value(v) for k, v in value.items()}
+    return value
+
+
+def load_definition(path):
+    path = pathlib.Path(path)
+    with open(path, encoding='utf-8') as f:
+        if path.suffix in ('.yaml', '.yml'):
+            import yaml
+            return yaml.safe_load(f)
+        return json.load(f)
+
+
+def compile_template(definition, module=None, shared=None):
+    base = import_object(definition['base'])
+    attrs = {k: build_value(v) for k, v in dict(shared or {}, **definition.get('attributes', {})).items()}
+    if attrs.get('_STATEMENT_FORMAT') is not None:
+        attrs['_STATEMENT_FORMAT'] = tuple(attrs['_STATEMENT_FORMAT'])
+    attrs['__module__'] = module or base.__module__
+    attrs['__doc__'] = definition.get('doc', base.__doc__)
+    cls = type(definition['class'], (base,), attrs)
+    logger.debug("compiled template {} from {} ({} attributes)".format(cls.__name__, definition['base'], len(attrs)))
+    return cls
+
+
+def compile_templates(path, module=None):
+    """
+    Statement classes of a definition file, by class name. Attributes under
+    the top level "attributes" key are shared by all its templates.
+    """
+    definition = load_definition(path)
+    return {
+        d['class']: compile_template(d, module, definition.get('attributes'))
+        for d in definition['templates']
+    }
+
+
+class QueryPlan:
+    __doc__ = "Placeholders of a statement class resolved per page in a single sweep"
+
+    def __init__(self, placeholders):
+        # fixed page text boxes by page, other text boxes depend on labels and stay lazy
+        self.boxes = defaultdict(list)
+        self.labels = []
+        for ph in placeholders:
+            if isinstance(ph, TextBox) and ph.page is not None and not ph.above and not ph.bellow:
+                self.boxes[ph.page].append(ph)
+            elif isinstance(ph, TextLabel) and ph not in self.labels:
+                self.labels.append(ph)
+
+    @classmethod
+    def of(cls, st_class):
+        # placeholder attributes as seen from the class, overrides included
+        return cls([
+            getattr(st_class, n) for n in sorted(dir(st_class))
+            if isinstance(getattr(st_class, n, None), (TextBox, TextLabel))
+        ])
+
+    def __len__(self):
+        return sum(len(b) for b in self.boxes.values()) + len(self.labels)
+
+    def __repr__(self):
+        return "<QueryPlan {} pages, {} labels>".format(len(self.boxes), len(self.labels))
+
+    def resolve(self, pdf, labels=True):
+        # labels=False: fixed page boxes only, the document is never laid out for them
+        profiler = utils._profiler
+        if profiler is not None:
+            frame = profiler.enter(self, 'QueryPlan.resolve', {})
+        self._resolve(pdf, labels)
+        if profiler is not None:
+            profiler.exit(frame, None)
+
+    def _resolve(self, pdf, labels):
+        cache = query_cache(pdf)
+        backend = native_backend(pdf)
+        labels = self.labels if labels else []
+        found = {id(l): [] for l in labels}
+        if backend is not None:
+            for p in backend.pages():
+                lines = backend.text_lines(p)
+                self._store_boxes(cache, pdf, p + 1, lines, lambda l, b: l.in_bbox(*b))
+                for label in labels:
+                    found[id(label)] += [l for l in lines if label.text in l.text]
+            matches = found
+        else:
+            # header boxes from the text lines of their page, before anything lays out the document
+            for page in self.boxes:
+                self._store_boxes(cache, pdf, page, bbox_text_lines(pdf, page, ALL_PAGE), _in_rounded_bbox)
+            if labels:
+                # labels are searched document wide: needs the full layout, swept page by page
+                for page in pdf.tree.getroot():
+                    elements = list(page.iter('LTTextLineHorizontal'))
+                    texts = [''.join(e.itertext()) for e in elements]
+                    for label in labels:
+                        found[id(label)] += [e for e, t in zip(elements, texts) if label.text in t]
+            matches = {i: pdf.pq(res) for i, res in found.items()}
+        for label in labels:
+            key = TextLabel.querys.memo_key(label, pdf)
+            if key not in cache.results:
+                cache.results[key] = label._sections(label._select(matches[id(label)]), None, None)
+        cache.misses['QueryPlan.resolve'] += 1
+        logger.debug("query plan resolved {} placeholders".format(len(self)))
+
+    def _store_boxes(self, cache, pdf, page, lines, inside):
+        for ph in self.boxes.get(page, []):
+            key = TextBox.query.memo_key(ph, pdf)
+            if key in cache.results:
+                continue
+            bbox = (ph.bbox.xleft, ph.bbox.ybot, ph.bbox.xright, ph.bbox.ytop)
+            res = [l for l in lines if inside(l, bbox)]
+            # anything but a single match is left to TextBox.query to report
+            if len(res) == 1:
+                cache.results[key] = res[0].get_text().strip()
+
+
+def _in_rounded_bbox(l, bbox):
+    # same comparison as pdfquery's in_bbox selector
+    xleft, ybot, xright, ytop = bbox
+    return round(l.x0, 3) >= xleft and round(l.y0, 3) >= ybot and round(l.x1, 3) <= xright and round(l.y1, 3) <= ytop
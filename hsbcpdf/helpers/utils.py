@@ -1,10 +1,21 @@
 import logging
+import importlib
+import functools
+import inspect
+import copy
+from collections import Counter
 
 import pdfquery
 import pdfminer
+from pyquery import PyQuery
+
+from .backends import native_backend, bbox_text_lines, layout_loaded, page_count, page_format
 
 logger = logging.getLogger('hsbcpdf.helpers.utils')
 
+# bbox (xleft, ybot, xright, ytop) holding a whole page
+ALL_PAGE = (float('-inf'), float('-inf'), float('inf'), float('inf'))
+
 # -----------------------------------------------------------------------------
 # Exceptions
 class ScraperException(Exception):
@@ -22,25 +33,230 @@ class TemplateException(ScraperException):
 class ConsistencyException(ScraperException):
     pass
 
+
+class DuplicateException(ScraperException):
+    pass
+
+# -----------------------------------------------------------------------------
+# Lazy imports
+
+class LazyModule:
+    __doc__ = "Stand-in for a heavy module (camelot, pandas, ...) imported on first use"
+
+    def __init__(self, name, extra=None):
+        self.__dict__['_name'] = name
+        self.__dict__['_module'] = None
+        # setup.py extra installing an optional module
+        self.__dict__['_extra'] = extra
+
+    def __getattr__(self, attr):
+        module = self.__dict__['_module']
+        if module is None:
+            logger.debug("import {}".format(self._name))
+            try:
+                module = self.__dict__['_module'] = importlib.import_module(self._name)
+            except ImportError as e:
+                if self._extra is None:
+                    raise
+                raise ImportError("{} is not installed, it comes with the '{}' extra: pip install hsbcpdf-sinopsys[{}]".format(
+                    self._name, self._extra, self._extra), name=self._name) from e
+        return getattr(module, attr)
+
+    def __repr__(self):
+        return "<lazy module '{}'{}>".format(self._name, '' if self._module is None else ' (loaded)')
+
+
+def import_object(path):
+    # "package.module:attribute" -> attribute
+    module, _, attr = path.partition(':')
+    return getattr(importlib.import_module(module), attr)
+
+# -----------------------------------------------------------------------------
+# Query memoization
+
+class QueryCache:
+    __doc__ = "Placeholder query results of one document, with hit counts per query type"
+
+    def __init__(self):
+        self.results = {}
+        self.hits = Counter()
+        self.misses = Counter()
+        self.page_size = None
+        self.tree = None
+
+    def clear(self):
+        self.results = {}
+        self.page_size = None
+
+    def stats(self):
+        return {k: (self.hits[k], self.misses[k]) for k in sorted(set(self.hits) | set(self.misses))}
+
+
+def query_cache(pdf):
+    cache = pdf.__dict__.get('_hsbcpdf_query_cache')
+    if cache is None:
+        cache = pdf._hsbcpdf_query_cache = QueryCache()
+    if native_backend(pdf) is None and layout_loaded(pdf):
+        # results only depend on the document: they are dropped if its layout gets rebuilt
+        if cache.tree is not None and cache.tree is not pdf.tree:
+            logger.debug("document layout changed, query cache cleared")
+            cache.clear()
+        cache.tree = pdf.tree
+    return cache
+
+
+def page_size(pdf):
+    # (width, height) of the first page
+    cache = query_cache(pdf)
+    if cache.page_size is None:
+        cache.page_size = page_format(pdf)[:2]
+    return cache.page_size
+
+
+class _Unkeyed(Exception):
+    pass
+
+
+def _memo_key(value):
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    if isinstance(value, (list, tuple)):
+        return tuple(_memo_key(v) for v in value)
+    if isinstance(value, dict):
+        return tuple(sorted((k, _memo_key(v)) for k, v in value.items()))
+    if isinstance(value, Section):
+        return ('Section', value.page, value.yup, value.ybot)
+    if isinstance(value, (Bbox, PdfComponent)):
+        return (type(value).__name__, _memo_key(vars(value)))
+    # no stable key: an id() could be reused by a later object
+    raise _Unkeyed(type(value).__name__)
+
+
+def _memo_copy(res):
+    # callers link sections together (Section.next): never hand out the cached instances
+    if isinstance(res, Section):
+        return copy.copy(res)
+    if isinstance(res, PyQuery):
+        return res.__class__(list(res), parent=res)
+    if isinstance(res, list):
+        return [_memo_copy(r) for r in res]
+    return res
+
+
+def memoized(method):
+    """
+    Cache a placeholder query method per document, keyed on the placeholder
+    parameters and the call arguments (page, after, before, ...)
+    """
+    signature = inspect.signature(method)
+    label = method.__qualname__
+
+    def arguments(self, pdf, *args, **kwargs):
+        bound = signature.bind(self, pdf, *args, **kwargs)
+        bound.apply_defaults()
+        return list(bound.arguments.items())[2:]
+
+    def memo_key(self, pdf, *args, **kwargs):
+        # None when an argument has no stable key, the call is not memoized then
+        try:
+            return (label, _memo_key(self), _memo_key(arguments(self, pdf, *args, **kwargs)))
+        except _Unkeyed:
+            return None
+
+    @functools.wraps(method)
+    def wrapper(self, pdf, *args, **kwargs):
+        cache = query_cache(pdf)
+        key = memo_key(self, pdf, *args, **kwargs)
+        profiler = _profiler
+        if profiler is not None:
+            frame = profiler.enter(self, label, dict(arguments(self, pdf, *args, **kwargs)))
+        cached = key is not None and key in cache.results
+        try:
+            if cached:
+                cache.hits[label] += 1
+                res = cache.results[key]
+            else:
+                cache.misses[label] += 1
+                res = method(self, pdf, *args, **kwargs)
+                if key is not None:
+                    cache.results[key] = res
+            res = _memo_copy(res)
+        except Exception as e:
+            if profiler is not None:
+                profiler.exit(frame, cached=cached, error=e)
+            raise
+        if profiler is not None:
+            profiler.exit(frame, res, cached=cached)
+        return res
+
+    # lets a query plan store results resolved in bulk
+    wrapper.memo_key = memo_key
+    return wrapper
+
+
+# QueryProfiler (helpers.profiling) recording placeholder queries, None when not profiling
+_profiler = None
+
+
+def set_query_profiler(profiler):
+    global _profiler
+    previous, _profiler = _profiler, profiler
+    return previous
+
+
+def _pq(pdf, selector):
+    res = pdf.pq(selector)
+    if _profiler is not None:
+        _profiler.selected(selector, len(res))
+    return res
+
 # -----------------------------------------------------------------------------
 # PdfQuery helpers
 
 
 def get_page(obj):
+    if _is_backend_element(obj):
+        return obj.page_number
     if isinstance(obj.layout, pdfminer.layout.LTPage):
           return obj.layout.pageid
     else:
           return get_page(obj.getparent())
 
 
+def _is_backend_element(obj):
+    return getattr(obj, 'page_number', None) is not None
+
+
+def _layout(obj):
+    # pdfquery elements wrap their pdfminer object, raw layout objects are their own
+    return getattr(obj, 'layout', obj)
+
+
+def _line_thickness(e):
+    return e.height if e.height > 0.0 else e.linewidth
+
+
+def _line_breadth(e):
+    return e.width if e.width > 0.0 else e.linewidth
+
+
 class PdfComponent:
     __doc__ = "Generic query holder"
     def __init__(self):
         pass
 
+    def __repr__(self):
+        return "{}({})".format(type(self).__name__, ', '.join(
+            f'{k}={v!r}' for k, v in vars(self).items() if v is not None and v is not False
+        ))
+
     def query(self, pdf, page=None):
         pass
 
+    def exists(self, pdf):
+        # found anywhere in the document (template signatures)
+        return len(self.querys(pdf)) > 0
+
 
 class TextBox(PdfComponent):
     __doc__ = "query for text in specific area given by bbox"
@@ -54,32 +270,41 @@ class TextBox(PdfComponent):
         self.bellow = bellow
         self.above = above
 
+    @memoized
     def query(self, pdf, page=None):
         page = page or self.page
+        # placeholders are shared between documents: adjust a copy of the area
+        area = Bbox(orig=self.bbox)
         if self.above:
-            above = self.above.query(pdf).yup if self.above else self.bbox.ybot
-            self.bbox.ybot = above - 3
+            area.ybot = self.above.query(pdf).yup - 3
         if self.bellow:
-            bellow = self.bellow.query(pdf).ybot if self.bellow else self.bbox.ytop
-            self.bbox.ytop = bellow + 3
+            area.ytop = self.bellow.query(pdf).ybot + 3
 
         q = ""
         if page is not None:
             q = f'LTPage[page_index="{page - 1 }"] '
-        q += f'LTTextLineHorizontal:in_bbox("{self.bbox.to_pdfq_bbox()}")'
-        res = pdf.pq(q)
+        q += f'LTTextLineHorizontal:in_bbox("{area.to_pdfq_bbox()}")'
+        bbox = (area.xleft, area.ybot, area.xright, area.ytop)
+        backend = native_backend(pdf)
+        if page is not None:
+            # fixed page: fetch only that page's lines in bbox, no document wide selector
+            res = bbox_text_lines(pdf, page, bbox)
+        elif backend is not None:
+            res = [l for p in backend.pages() for l in backend.text_lines(p) if l.in_bbox(*bbox)]
+        else:
+            res = _pq(pdf, q)
         if len(res) > 1:
             logger.debug(f"non unique query: '{q}':")
             for v in res:
-                logger.debug(v.layout)
-            raise TemplateException(f'Several ({len(res)}) text boxes in "{self.bbox}"" place holder'
+                logger.debug(_layout(v))
+            raise TemplateException(f'Several ({len(res)}) text boxes in "{area}"" place holder'
                                     + (f' in page {page}' if page else ''))
         elif len(res) == 0:
             logger.debug(f"unmatched query: '{q}'")
-            raise TemplateException(f'No text boxes in "{self.bbox}"" place holder'
+            raise TemplateException(f'No text boxes in "{area}"" place holder'
                                     + f' in page {page}' if page else '')
         logger.debug(res)
-        return res[0].layout.get_text().strip()
+        return _layout(res[0]).get_text().strip()
 
 
 class TextLabel(PdfComponent):
@@ -90,18 +315,45 @@ class TextLabel(PdfComponent):
         self.height = height
         self.first = first
 
+    @memoized
     def querys(self, pdf, after=None, before=None, page=None):
-        res = pdf.pq(f'LTTextLineHorizontal:contains("{self.text}")')
-        if self.height is not None:
+        backend = native_backend(pdf)
+        if backend is not None:
+            res = [l for p in backend.pages() for l in backend.text_lines(p) if self.text in l.text]
+        else:
+            res = _pq(pdf, f'LTTextLineHorizontal:contains("{self.text}")')
+        return self._sections(self._select(res), after, before)
+
+    def exists(self, pdf):
+        # probing: pages are searched in turn from their text lines, the document is not laid out
+        if native_backend(pdf) is not None or layout_loaded(pdf):
+            return super().exists(pdf)
+        for page in range(1, page_count(pdf) + 1):
+            lines = [l for l in bbox_text_lines(pdf, page, ALL_PAGE) if self.text in l.get_text()]
+            if len(self._select(lines)):
+                return True
+        return False
+
+    def _select(self, res):
+        # res: native text lines or pyquery selection of the lines containing the text
+        if self.height is None:
+            return res
+        if isinstance(res, PyQuery):
             nwres = res.filter(lambda i: self.height + 1 > float(this.get('height', 0)) > self.height - 1)
-            if not len(nwres) and len(res):
-                logger.debug('no candidate for [{}] with provided {} while {} candidates available with height={}'.format(
-                    self.text,
-                    self.height,
-                    len(res),
-                    res[0].attrib['height']
-                ))
-            res = nwres
+            height = res[0].attrib['height'] if len(res) else None
+        else:
+            nwres = [l for l in res if self.height + 1 > l.height > self.height - 1]
+            height = res[0].height if len(res) else None
+        if not len(nwres) and len(res):
+            logger.debug('no candidate for [{}] with provided {} while {} candidates available with height={}'.format(
+                self.text,
+                self.height,
+                len(res),
+                height
+            ))
+        return nwres
+
+    def _sections(self, res, after, before):
         res = [Section(s) for s in res]
         if before is not None:
             res = [s for s in res if s < before]
@@ -133,10 +385,36 @@ class HLine(PdfComponent):
         self.ymax = ymax
         self.first = first
 
+    def _native_querys(self, backend, page):
+        bbox = (self.xleft, self.ymin or 0, self.xright, self.ymax or page_size(backend)[1])
+        res = []
+        for e in (e for p in backend.pages(page) for e in backend.graphics(p) if e.in_bbox(*bbox)):
+            if e.kind == 'line':
+                keep = (self.hmin is None or _line_thickness(e) >= self.hmin) \
+                       and (self.hmax is None or _line_thickness(e) <= self.hmax) \
+                       and (self.wmin is None or e.width >= self.wmin) \
+                       and (self.wmax is None or e.width <= self.wmax)
+            else:
+                keep = (self.hmin is None or _line_thickness(e) > self.hmin) \
+                       and (self.hmax is None or _line_thickness(e) < self.hmax) \
+                       and (self.wmin is None or e.width > self.wmin) \
+                       and (self.wmax is None or e.width < self.wmax) \
+                       and (self.ymin is None or e.y0 > self.ymin) \
+                       and (self.ymax is None or e.y0 < self.ymax)
+            if keep:
+                res.append(e)
+        return res
+
+    @memoized
     def querys(self, pdf, after=None, before=None, page=None):
-        res = pdf.pq(
+        backend = native_backend(pdf)
+        if backend is not None:
+            return self._sections(self._native_querys(backend, page), after, before)
+
+        res = _pq(
+            pdf,
             (f'LTPage[page_index="{page-1}"] ' if page else '') \
-            + f'LTLine:in_bbox("{self.xleft}, {self.ymin or 0}, {self.xright}, {self.ymax or pdf.get_layout(0).height}")'
+            + f'LTLine:in_bbox("{self.xleft}, {self.ymin or 0}, {self.xright}, {self.ymax or page_size(pdf)[1]}")'
         )
 
         res = res.filter(lambda i:
@@ -148,9 +426,10 @@ class HLine(PdfComponent):
                                and (self.wmin is None or float(this.get('width')) >= self.wmin)
                                and (self.wmax is None or float(this.get('width')) <= self.wmax)
                  )
-        resb = pdf.pq(
+        resb = _pq(
+            pdf,
             (f'LTPage[page_index="{page-1}"] ' if page else '') \
-            + f'LTRect:in_bbox("{self.xleft}, {self.ymin or 0}, {self.xright}, {self.ymax or pdf.get_layout(0).height}")'
+            + f'LTRect:in_bbox("{self.xleft}, {self.ymin or 0}, {self.xright}, {self.ymax or page_size(pdf)[1]}")'
         )
         resb = resb.filter(lambda i:
                                (self.hmin is None or float(this.get('height') if float(this.get('height')) > 0.0 else this.get('linewidth')) > self.hmin)
@@ -161,9 +440,10 @@ class HLine(PdfComponent):
                                and (self.ymax is None or float(this.get('y0')) < self.ymax)
                  )
         res += resb
-        resc = pdf.pq(
+        resc = _pq(
+            pdf,
             (f'LTPage[page_index="{page-1}"] ' if page else '') \
-            + f'LTCurve:in_bbox("{self.xleft}, {self.ymin or 0}, {self.xright}, {self.ymax or pdf.get_layout(0).height}")'
+            + f'LTCurve:in_bbox("{self.xleft}, {self.ymin or 0}, {self.xright}, {self.ymax or page_size(pdf)[1]}")'
         )
         resc = resc.filter(lambda i:
                                (self.hmin is None or float(this.get('height') if float(this.get('height')) > 0.0 else this.get('linewidth')) > self.hmin)
@@ -174,7 +454,9 @@ class HLine(PdfComponent):
                                and (self.ymax is None or float(this.get('y0')) < self.ymax)
                  )
         res += resc
+        return self._sections(res, after, before)
 
+    def _sections(self, res, after, before):
         res = sorted([Section(s) for s in res], key=lambda section: section.yup, reverse=True)
         if before is not None:
             res = [s for s in res if s < before]
@@ -206,10 +488,28 @@ class VLine(PdfComponent):
         self.wmax = wmax
         self.first = first
 
+    def _native_querys(self, backend, page):
+        bbox = (0, self.ybot, page_size(backend)[0], self.yup)
+        res = []
+        for e in (e for p in backend.pages(page) for e in backend.graphics(p) if e.in_bbox(*bbox)):
+            height = e.height if e.kind != 'curve' else _line_thickness(e)
+            if (self.hmin is None or height >= self.hmin) \
+                    and (self.hmax is None or height <= self.hmax) \
+                    and (self.wmin is None or _line_breadth(e) >= self.wmin) \
+                    and (self.wmax is None or _line_breadth(e) <= self.wmax):
+                res.append(e)
+        return res
+
+    @memoized
     def querys(self, pdf, after=None, before=None, page=None):
-        res = pdf.pq(
+        backend = native_backend(pdf)
+        if backend is not None:
+            return self._native_querys(backend, page)
+
+        res = _pq(
+            pdf,
             (f'LTPage[page_index="{page-1}"] ' if page else '') \
-            + f'LTLine:in_bbox("0, {self.ybot}, {pdf.get_layout(0).width}, {self.yup} ")'
+            + f'LTLine:in_bbox("0, {self.ybot}, {page_size(pdf)[0]}, {self.yup} ")'
         )
         res = res.filter(lambda i:
                                (self.hmin is None or float(this.get('height')) >= self.hmin)
@@ -217,9 +517,10 @@ class VLine(PdfComponent):
                                and (self.wmin is None or float(this.get('width') if float(this.get('width')) > 0.0 else this.get('linewidth')) >= self.wmin)
                                and (self.wmax is None or float(this.get('width') if float(this.get('width')) > 0.0 else this.get('linewidth')) <= self.wmax)
                  )
-        res += pdf.pq(
+        res += _pq(
+            pdf,
             (f'LTPage[page_index="{page-1}"] ' if page else '') \
-            + f'LTRect:in_bbox("0, {self.ybot}, {pdf.get_layout(0).width}, {self.yup} ")'
+            + f'LTRect:in_bbox("0, {self.ybot}, {page_size(pdf)[0]}, {self.yup} ")'
         )
         res = res.filter(lambda i:
                                (self.hmin is None or float(this.get('height')) >= self.hmin)
@@ -227,9 +528,10 @@ class VLine(PdfComponent):
                                and (self.wmin is None or float(this.get('width') if float(this.get('width')) > 0.0 else this.get('linewidth')) >= self.wmin)
                                and (self.wmax is None or float(this.get('width') if float(this.get('width')) > 0.0 else this.get('linewidth')) <= self.wmax)
                  )
-        res += pdf.pq(
+        res += _pq(
+            pdf,
             (f'LTPage[page_index="{page-1}"] ' if page else '') \
-            + f'LTCurve:in_bbox("0, {self.ybot}, {pdf.get_layout(0).width}, {self.yup} ")'
+            + f'LTCurve:in_bbox("0, {self.ybot}, {page_size(pdf)[0]}, {self.yup} ")'
         )
         res = res.filter(lambda i:
                                (self.hmin is None or float(this.get('height') if float(this.get('height')) > 0.0 else this.get('linewidth')) >= self.hmin)
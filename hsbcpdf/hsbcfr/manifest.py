@@ -0,0 +1,32 @@
+#-------------------------------------------------------------------------------------------
+# HSBC FR statement templates manifest
+#-------------------------------------------------------------------------------------------
+from hsbcpdf.helpers.utils import TextLabel
+from hsbcpdf.helpers.registry import TemplateManifest
+from hsbcpdf.helpers.backends import LINES_LAPARAMS
+
+BANK_SIGNATURE = [
+    TextLabel("www.hsbc.fr")
+]
+# placeholders only query text lines and graphics
+LAPARAMS = LINES_LAPARAMS
+
+ACCOUNT = TemplateManifest(
+    'hsbcfr.BANK',
+    'hsbcpdf.hsbcfr.statements:Account',
+    bank_signature=BANK_SIGNATURE,
+    type_signature=[ TextLabel("Votre Relevé de Compte") ],
+    priority=40,
+    laparams=LAPARAMS
+)
+
+CARD = TemplateManifest(
+    'hsbcfr.CARD',
+    'hsbcpdf.hsbcfr.statements:Card',
+    bank_signature=BANK_SIGNATURE,
+    type_signature=[ TextLabel("Votre Relevé de Carte", first=True) ],
+    priority=41,
+    laparams=LAPARAMS
+)
+
+TEMPLATES = [ACCOUNT, CARD]
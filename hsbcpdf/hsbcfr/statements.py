@@ -10,17 +10,12 @@ import pathlib
 import math
 
 #import matplotlib.pyplot as plt
-import pandas as pd
-from pdfquery.cache import FileCache
-import pdfquery
-import pdfminer
-from PyPDF2.errors import PdfReadError
-import camelot
-import numpy as np
 import re
 
 from hsbcpdf.helpers.utils import *
 from hsbcpdf.helpers.accountstatement import *
+from hsbcpdf.helpers.sources import FileSource
+from . import manifest
 
 logger = logging.getLogger("hsbcpdf.hsbcfr.statements")
 
@@ -31,9 +26,8 @@ class HsbcFrStatement(BaseStatement):
 
     st_bank = 'hsbcfr'
 
-    _BANK_SIGNATURE = [
-        TextLabel("www.hsbc.fr")
-    ]
+    _BANK_SIGNATURE = manifest.BANK_SIGNATURE
+    _LAPARAMS = manifest.LAPARAMS
 
     st_type = None
     _TYPE_SIGNATURE = []
@@ -69,6 +63,14 @@ class HsbcFrStatement(BaseStatement):
     rows_to_remove=[]
 
     def _find_columns(self):
+        geometry = self.resolve_geometry('columns', self._discover_columns)
+        xcols = geometry['xcols']
+        self.page1_tabbox.xleft = self.pagex_tabbox.xleft = xcols[0]
+        self.page1_tabbox.xright = self.pagex_tabbox.xright = xcols[-1]
+        self.page1_tabbox.ybot = geometry['ybot']
+        self.columns = ",".join(map(str, xcols[1:-1]))
+
+    def _discover_columns(self):
         footer = self.ph_tab_footer.querys(self.pdf, page=1)
         footer = footer[-1]
         ph_head_sect = self.ph_head_sect.query(self.pdf, page=1)
@@ -77,14 +79,14 @@ class HsbcFrStatement(BaseStatement):
         yl = sorted(list(dict.fromkeys([e.yup for e in tab_vl])), reverse=True)
         cols = VLine(yup=yl[0] + 1, ybot=yl[1] - 1, hmin=10, wmin=0, wmax=0.8).querys(self.pdf, page=1)
         xcols = sorted(list(dict.fromkeys([e.layout.x0 for e in cols])))
-        self.page1_tabbox.xleft = self.pagex_tabbox.xleft = xcols[0]
-        self.page1_tabbox.xright = self.pagex_tabbox.xright = xcols[-1]
-        self.page1_tabbox.ybot = ybot = tab_vl[1].yup
-        self.columns = ",".join(map(str, xcols[1:-1]))
+        return {'xcols': xcols, 'ybot': tab_vl[1].yup}, tab_vl[:2] + list(cols)
 
     def __init__(self, pdfpath, pdf=None):
         BaseStatement.__init__(self, pdfpath, pdf)
         self.logger = logging.getLogger('hsbcpdf.hsbcfr.statements.base')
+        # table boxes are adjusted per statement: the class ones stay as defined
+        self.page1_tabbox = Bbox(orig=self.page1_tabbox)
+        self.pagex_tabbox = Bbox(orig=self.pagex_tabbox)
         self.accounts = []
         self.old_balance = {}
         self.new_balance = {}
@@ -96,7 +98,7 @@ class HsbcFrStatement(BaseStatement):
         self.tmpdir = tempfile.TemporaryDirectory()
         self.cleanpdfpath= pathlib.Path(self.tmpdir.name) / 'currentpdf.pdf'
         with self.cleanpdfpath.open('wb') as target:
-            with open(self.pdfpath, 'rb') as src:
+            with self.source.open() as src:
                 inc = 0
                 self.logger.debug("patch pdf file")
                 ref = '%%EOF'
@@ -115,13 +117,15 @@ class HsbcFrStatement(BaseStatement):
                     target.write(ccar)
                     if idx + 1 == len(ref):
                         break
-        self.intialpath=self.pdfpath
-        self.pdfpath=str(self.cleanpdfpath)
+        self.source = FileSource(self.cleanpdfpath)
 
     def _find_top(self):
         # called only if pages>1
+        self.pagex_tabbox.ytop = self.resolve_geometry('top', self._discover_top)
+
+    def _discover_top(self):
         lines = HLine(0, 595, 0, 1, 20).querys(self.pdf, page=2)
-        self.pagex_tabbox.ytop = lines[0].yup
+        return lines[0].yup, lines[:1]
 
     def _extract_amount(self, debit, credit):
         if not debit and not credit:
@@ -174,59 +178,45 @@ class HsbcFrStatement(BaseStatement):
         if end_section.page == begin_section.page:
             first_bbox.ybot = end_section.yup - 1 if self.fl_end_sec_excluded else end_section.ybot -2
         self.logger.debug("extract first tab in {}".format(first_bbox))
-        tp = None
-        try:
-            tp = camelot.read_pdf(
-                self.pdfpath,
-                pages="1",
-                flavor="stream",
-                table_areas=[first_bbox.to_camellot_bbox()],
-                columns=[self.columns],
-                strip_text='*' #,
-                #row_tol=5
-            )
-        except PdfReadError:
-            self.logger.debug("dirty PDF: try hack")
-            self._hackdirtypdf()
-            tp = camelot.read_pdf(
-                self.pdfpath,
-                pages="1",
-                flavor="stream",
-                table_areas=[first_bbox.to_camellot_bbox()],
-                columns=[self.columns],
-                strip_text='*'  # ,
-                # row_tol=5
-            )
-        tp = tp[0].df[1 if self.fl_skip_first_tab_raw else 0:]
-        self.logger.debug(f'First trunck of table: \n{tp.to_string()}')
-
+        jobs = [table_job(1, table_areas=[first_bbox.to_camellot_bbox()], columns=[self.columns], strip_text='*')]
         if end_section.page > begin_section.page:
             self._find_top()
             if end_section.page > begin_section.page + 1:
-                others = camelot.read_pdf(
-                    self.pdfpath,
-                    pages="2-{}".format(end_section.page - 1),
-                    flavor="stream",
+                jobs += page_jobs(
+                    2,
+                    end_section.page - 1,
                     table_areas=[self.pagex_tabbox.to_camellot_bbox()],
                     columns=[self.columns],
                     strip_text='*',
                     row_tol=5
                 )
-                for i in others:
-                    tp = pd.concat([tp, i.df[1 if self.fl_skip_first_tab_raw else 0:]])
-                    self.logger.debug(
-                        f'Next trunck of table [{self.pagex_tabbox.ytop} - {self.pagex_tabbox.ybot}]: \n{i.df.to_string()}')
-
             last_tab_bbox = Bbox(orig=self.pagex_tabbox, ybot=end_section.yup - 1 if self.fl_end_sec_excluded else end_section.ybot -2)
-            last_tab = camelot.read_pdf(
-                self.pdfpath,
-                pages=str(end_section.page),
-                flavor="stream",
+            jobs.append(table_job(
+                end_section.page,
                 table_areas=[last_tab_bbox.to_camellot_bbox()],
                 columns=[self.columns],
                 strip_text='*',
                 row_tol=5
-            )[0].df
+            ))
+        from PyPDF2.errors import PdfReadError
+
+        try:
+            first, *others = self.read_tables(jobs)
+        except PdfReadError:
+            self.logger.debug("dirty PDF: try hack")
+            self._hackdirtypdf()
+            first, *others = self.read_tables(jobs)
+        tp = first[0][1 if self.fl_skip_first_tab_raw else 0:]
+        self.logger.debug(f'First trunck of table: \n{tp.to_string()}')
+
+        if others:
+            *middle, last = others
+            for i in [t for tables in middle for t in tables]:
+                tp = pd.concat([tp, i[1 if self.fl_skip_first_tab_raw else 0:]])
+                self.logger.debug(
+                    f'Next trunck of table [{self.pagex_tabbox.ytop} - {self.pagex_tabbox.ybot}]: \n{i.to_string()}')
+
+            last_tab = last[0]
             last_tab = last_tab[1 if self.fl_skip_first_tab_raw and len(last_tab) > 1  else 0:]
             self.logger.debug(
                 f'Last trunck of table (page:{end_section.page} in {last_tab_bbox.to_camellot_bbox()}): \n{last_tab.to_string()}')
@@ -323,12 +313,12 @@ class HsbcFrStatement(BaseStatement):
         for acc in self.accounts:
             self.statement['previous_balance'][acc] = {self.currency: self.old_balance[acc]}
             self.statement['new_balance'][acc] = {self.currency: self.new_balance[acc]}
-        self.statement['entries'] = self.entries.to_dict('record')
+        self.statement['entries'] = Entries.from_df(self.entries)
 
 class Account(HsbcFrStatement):
 
     st_type = "BANK"
-    _TYPE_SIGNATURE = [ TextLabel("Votre Relevé de Compte") ]
+    _TYPE_SIGNATURE = manifest.ACCOUNT.type_signature
 
     PREVIOUS_BAL = "SOLDE DE DEBUT DE PERIODE"
     NEW_BAL = "SOLDE DE FIN DE PERIODE"
@@ -423,7 +413,7 @@ class Account(HsbcFrStatement):
 class Card(HsbcFrStatement):
 
     st_type = "CARD"
-    _TYPE_SIGNATURE = [ TextLabel("Votre Relevé de Carte", first=True) ]
+    _TYPE_SIGNATURE = manifest.CARD.type_signature
 
     PREVIOUS_BAL = None
     NEW_BAL = "TOTAL FACTURE"
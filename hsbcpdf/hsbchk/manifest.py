@@ -0,0 +1,32 @@
+#-------------------------------------------------------------------------------------------
+# HSBC HK statement templates manifest
+#-------------------------------------------------------------------------------------------
+from hsbcpdf.helpers.utils import TextLabel
+from hsbcpdf.helpers.registry import TemplateManifest
+from hsbcpdf.helpers.backends import LINES_LAPARAMS
+
+BANK_SIGNATURE = [
+    TextLabel("The Hongkong and Shanghai Banking Corporation Limited")
+]
+# placeholders only query text lines and graphics
+LAPARAMS = LINES_LAPARAMS
+
+ACCOUNT = TemplateManifest(
+    'hsbchk.BANK',
+    'hsbcpdf.hsbchk.statements:Account',
+    bank_signature=BANK_SIGNATURE,
+    type_signature=[ TextLabel("Financial Overview") ],
+    priority=10,
+    laparams=LAPARAMS
+)
+
+CARD = TemplateManifest(
+    'hsbchk.CARD',
+    'hsbcpdf.hsbchk.statements:Card',
+    bank_signature=BANK_SIGNATURE,
+    type_signature=[ TextLabel("Card type", first=True) ],
+    priority=11,
+    laparams=LAPARAMS
+)
+
+TEMPLATES = [ACCOUNT, CARD]
@@ -6,16 +6,11 @@ import logging
 import datetime
 import json
 #import matplotlib.pyplot as plt
-import pandas as pd
-from pdfquery.cache import FileCache
-import pdfquery
-import pdfminer
-import camelot
-import numpy as np
 import re
 
 from hsbcpdf.helpers.utils import *
 from hsbcpdf.helpers.accountstatement import *
+from . import manifest
 
 logger = logging.getLogger("hsbcpdf.hsbchk.statements")
 
@@ -26,15 +21,14 @@ class HsbcStatement(BaseStatement):
 
     st_bank = 'hsbchk'
 
-    _BANK_SIGNATURE = [
-        TextLabel("The Hongkong and Shanghai Banking Corporation Limited")
-    ]
+    _BANK_SIGNATURE = manifest.BANK_SIGNATURE
+    _LAPARAMS = manifest.LAPARAMS
 
 
 class Account(HsbcStatement):
 
     st_type = "BANK"
-    _TYPE_SIGNATURE = [ TextLabel("Financial Overview") ]
+    _TYPE_SIGNATURE = manifest.ACCOUNT.type_signature
 
     ph_acc_number = TextBox(page=1, bbox="486,700,538,712")
     ph_st_date = TextBox(page=1, bbox="394,651,538,660")
@@ -109,20 +103,27 @@ class Account(HsbcStatement):
         ptfsum_section.next = top_section
         self.logger.debug(f'section Summary:{ptfsum_section}')
         self.ptfsum_zone = TableZoneSum(self.page_height, self.page_width, ptfsum_section, 'summary', self.st_date)
-        self.ptfsum_zone.get_tables_format(self.pdf)
+        self.ptfsum_zone.get_tables_format(self.pdf, self.resolve_geometry)
         self.logger.debug("proceed accounts sections...")
         for k, v in sections.items():
             next = v.get_next(available_sections)
             available_sections.remove(next)
             self.logger.debug(f'section {k}:{v} followed by {next}')
             self.zones[k] = Account.zone_types[k](self.page_height, self.page_width, v, k, self.st_date)
-            self.zones[k].get_tables_format(self.pdf)
+            self.zones[k].get_tables_format(self.pdf, self.resolve_geometry)
 
     def extract_tables(self):
-        self.ptfsum_zone.extract_tables(self.pdfpath)
-        for k, v in self.zones.items():
-            if v is not None:
-                v.extract_tables(self.pdfpath)
+        # chunks of all zones are extracted together, then handed back zone by zone
+        zones = [self.ptfsum_zone] + [v for v in self.zones.values() if v is not None]
+        jobs = [z.table_jobs() for z in zones]
+        summary, first = [], 0
+        for z, zj in zip(zones, jobs):
+            summary += range(first, first + min(len(zj), z.summary_chunks or len(zj)))
+            first += len(zj)
+        results = self.read_tables([j for zj in jobs for j in zj], summary)
+        for z, zj in zip(zones, jobs):
+            z.load_tables(results[:len(zj)])
+            results = results[len(zj):]
 
     def check_consistency(self):
         self.ptfsum_zone.check_consistency(None)
@@ -143,13 +144,13 @@ class Account(HsbcStatement):
         for v in self.zones.values():
             for k in v.statement['previous_balance'].keys():
                 self.statement['previous_balance'][k] = v.statement['previous_balance'][k]
-            self.statement['entries'] = self.statement['entries'] + v.statement['entries']
+        self.statement['entries'] = Entries.concat([v.statement['entries'] for v in self.zones.values()])
 
 
 class Card(HsbcStatement):
 
     st_type = "CARD"
-    _TYPE_SIGNATURE = [ TextLabel("Card type", first=True) ]
+    _TYPE_SIGNATURE = manifest.CARD.type_signature
 
     OPENING_BAL = "OPENING BALANCE"
     PREVIOUS_BAL = "PREVIOUS BALANCE"
@@ -194,23 +195,23 @@ class Card(HsbcStatement):
         self.currency = re.search('Amount +\((?P<currency>[A-Z]{3})\)$', self.ph_st_currency.query(self.pdf).strip()).group('currency')
         self.logger.info("process card statement of {} on {}".format(self.account_number, self.st_date))
 
+    def _has_amounts(self, tables):
+        return any(t[3].str.strip().ne("").any() for t in tables)
+
     def extract_tables(self):
-        tp = camelot.read_pdf(
-            self.pdfpath,
-            pages="1",
-            flavor="stream",
-            table_areas=[self.page1_tabbox],
-            columns=[self.columns]
-        )[0].df[1:]
-        others = camelot.read_pdf(
-            self.pdfpath,
-            pages="2-end",
-            flavor="stream",
-            table_areas=[self.pagex_tabbox],
-            columns=[self.columns]
-        )
-        for i in others:
-            tp = pd.concat([tp, i.df[1:]])
+        jobs = [table_job(1, table_areas=[self.page1_tabbox], columns=[self.columns])] \
+            + page_jobs(2, self.nb_pages, table_areas=[self.pagex_tabbox], columns=[self.columns])
+        results = self.read_tables(jobs)
+        if self.summary_only:
+            # the statement balance row is on the last page with amounts, trailing pages can be notices
+            last = len(jobs) - 1
+            while last > 1 and not self._has_amounts(results[last]):
+                last -= 1
+                results[last] = self.read_tables(jobs[last:last + 1])[0]
+        first, *others = results
+        tp = first[0][1:]
+        for i in [t for tables in others for t in tables]:
+            tp = pd.concat([tp, i[1:]])
         self.logger.debug(f'full table: {tp.to_string()}')
         tp = tp.apply(lambda x: x.str.strip())
         tp = pd.concat([tp, tp.iloc[:, [0, 2, 3]].shift(-1)], axis=1)[tp[3] != ""]
@@ -260,7 +261,7 @@ class Card(HsbcStatement):
         super().merge_all()
         self.statement['previous_balance'] = {'default': {self.currency: self.old_balance}}
         self.statement['new_balance'] = {'default': {self.currency: self.new_balance}}
-        self.statement['entries'] = self.entries.to_dict('record')
+        self.statement['entries'] = Entries.from_df(self.entries)
 
 
 class HsbcFactory(BaseFactory):
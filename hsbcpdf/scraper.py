@@ -4,21 +4,15 @@ from pathlib import Path
 
 from .helpers import utils
 from .helpers import accountstatement
-from .hsbchk.statements import HsbcFactory
-from .societegenerale.statements import SocgenFactory
-from .societegenerale.statementsv2 import SocgenV2Factory
-from .hsbcfr.statements import HsbcFrFactory
+from .helpers.registry import registry
 
 class ScraperFactory(accountstatement.BaseFactory):
-    _factories = [ HsbcFactory, SocgenFactory, SocgenV2Factory, HsbcFrFactory ]
+    # templates are probed from their manifests, the matching bank module is imported on demand
+    _registry = registry
 
     @classmethod
-    def get_scraper(cls, pdfpath):
-        for f in cls._factories:
-            s = f.get_scraper(pdfpath)
-            if s:
-                return s
-        raise utils.UnrecognizedException(f'"{pdfpath}" unrecognized Statement format')
+    def get_scraper(cls, pdfpath, pdf=None):
+        return cls._registry.get_scraper(pdfpath, pdf)
 
 
 if __name__ == "__main__":
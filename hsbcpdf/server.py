@@ -0,0 +1,187 @@
+# -----------------------------------------------------------------------------
+# Local scraping daemon
+#
+# Serves POST /scrape on localhost: the body is either the PDF itself
+# (Content-Type: application/pdf) or a JSON object {"path": "..."} naming a
+# file readable by the server. Statements are processed in a WorkerPool of
+# processes forked from a server which imported the table extraction stack and
+# bank modules once, the response is BaseStatement.get_json() output. A worker
+# going over the time budget of a request is killed and replaced.
+#
+#   python -m hsbcpdf.server --port 8765 --workers 2
+#   curl --data-binary @statement.pdf -H "Content-Type: application/pdf" localhost:8765/scrape
+
+import argparse
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from .helpers.utils import *
+from .helpers.pool import BUDGET, OK, WorkerPool
+from .helpers.sources import BytesSource
+
+logger = logging.getLogger("hsbcpdf.server")
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+MAX_UPLOAD = 64 * 1024 * 1024
+
+
+class Metrics:
+    __doc__ = "Request counters and timings exposed on /metrics"
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.in_flight = 0
+        self.requests = {}
+        self.seconds = 0.
+        self.processed = 0
+
+    def count(self, status, elapsed=None):
+        with self.lock:
+            self.requests[status] = self.requests.get(status, 0) + 1
+            if elapsed is not None:
+                self.seconds += elapsed
+                self.processed += 1
+
+    def render(self):
+        with self.lock:
+            lines = [
+                '# TYPE hsbcpdf_uptime_seconds gauge',
+                'hsbcpdf_uptime_seconds {:.3f}'.format(time.time() - self.started),
+                '# TYPE hsbcpdf_in_flight gauge',
+                'hsbcpdf_in_flight {}'.format(self.in_flight),
+                '# TYPE hsbcpdf_requests_total counter',
+            ]
+            lines += ['hsbcpdf_requests_total{{status="{}"}} {}'.format(s, n) for s, n in sorted(self.requests.items())]
+            lines += [
+                '# TYPE hsbcpdf_processing_seconds summary',
+                'hsbcpdf_processing_seconds_sum {:.3f}'.format(self.seconds),
+                'hsbcpdf_processing_seconds_count {}'.format(self.processed),
+            ]
+        return '\n'.join(lines) + '\n'
+
+
+class ScraperServer(ThreadingHTTPServer):
+    __doc__ = "HTTP server dispatching statements on a pool of warm scraping processes"
+
+    daemon_threads = True
+
+    def __init__(self, address, workers=2, max_pending=None, time_budget=60., pool=None):
+        super().__init__(address, ScraperHandler)
+        self.workers = workers
+        # seconds after which the worker processing a request is killed
+        self.time_budget = time_budget
+        # requests beyond the limit are refused instead of queued
+        self.slots = threading.BoundedSemaphore(max_pending or workers)
+        self.metrics = Metrics()
+        # workers are started now rather than on the first request
+        self.pool = pool if pool is not None else WorkerPool(workers, time_budget=time_budget, prestart=True)
+
+    def scrape(self, pdfpath):
+        if not self.slots.acquire(blocking=False):
+            self.metrics.count('busy')
+            return 503, {'error': 'too many requests in progress'}
+        with self.metrics.lock:
+            self.metrics.in_flight += 1
+        try:
+            res = self.pool.submit(pdfpath).result()
+            if res.status == BUDGET:
+                self.metrics.count('timeout')
+                return 504, {'error': res.error}
+            self.metrics.count(res.status, res.elapsed)
+            if res.status == OK:
+                return 200, res.statement.get_json()
+            return 422, {'error': res.error, 'category': res.status}
+        finally:
+            with self.metrics.lock:
+                self.metrics.in_flight -= 1
+            self.slots.release()
+
+    def server_close(self):
+        super().server_close()
+        self.pool.shutdown(wait=False)
+
+
+class ScraperHandler(BaseHTTPRequestHandler):
+
+    def log_message(self, format, *args):
+        logger.info("%s - %s", self.address_string(), format % args)
+
+    def _reply(self, code, body, content_type='application/json'):
+        if not isinstance(body, str):
+            body = json.dumps(body)
+        data = body.encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path == '/health':
+            self._reply(200, {'status': 'ok', 'workers': self.server.workers})
+        elif self.path == '/metrics':
+            self._reply(200, self.server.metrics.render(), 'text/plain; version=0.0.4')
+        else:
+            self._reply(404, {'error': 'not found'})
+
+    def do_POST(self):
+        if self.path != '/scrape':
+            self._reply(404, {'error': 'not found'})
+            return
+        length = int(self.headers.get('Content-Length') or 0)
+        if length <= 0 or length > MAX_UPLOAD:
+            self.server.metrics.count('bad_request')
+            self._reply(400 if length <= 0 else 413, {'error': 'invalid content length'})
+            return
+        body = self.rfile.read(length)
+        ctype = self.headers.get('Content-Type', '').split(';')[0].strip()
+
+        if ctype == 'application/json':
+            try:
+                pdfpath = json.loads(body)['path']
+            except (ValueError, KeyError, TypeError):
+                self.server.metrics.count('bad_request')
+                self._reply(400, {'error': 'expected {"path": ...}'})
+                return
+            if not os.path.isfile(pdfpath):
+                self.server.metrics.count('bad_request')
+                self._reply(404, {'error': f'"{pdfpath}" file not found'})
+                return
+            self._reply(*self.server.scrape(pdfpath))
+            return
+
+        # uploaded document is parsed from memory, spooled to disk by the worker only for camelot
+        self._reply(*self.server.scrape(BytesSource(body, 'upload.pdf')))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m hsbcpdf.server', description='Local statement scraping daemon')
+    parser.add_argument('--host', default=DEFAULT_HOST)
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--max-pending', type=int, default=None,
+                        help='concurrent requests accepted before answering 503 (default: workers)')
+    parser.add_argument('--time-budget', '--timeout', type=float, default=60.,
+                        help='seconds after which the worker processing a request is killed')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    server = ScraperServer((args.host, args.port), args.workers, args.max_pending, args.time_budget)
+    logger.info("listening on http://{}:{}".format(*server.server_address[:2]))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,59 @@
+#-------------------------------------------------------------------------------------------
+# SocieteGenerale statement templates manifest
+#-------------------------------------------------------------------------------------------
+from hsbcpdf.helpers.utils import TextLabel
+from hsbcpdf.helpers.registry import TemplateManifest
+from hsbcpdf.helpers.backends import LINES_LAPARAMS
+
+BANK_SIGNATURE = [
+    TextLabel("Société Générale")
+]
+STATEMENT_FORMAT = (595, 864)
+STATEMENT_FORMAT_V2 = (595, 842)
+# placeholders only query text lines and graphics
+LAPARAMS = LINES_LAPARAMS
+
+ACCOUNT_SIGNATURE = [ TextLabel("RELEVÉ DE COMPTE") ]
+CARD_SIGNATURE = [ TextLabel("RELEVÉ CARTE", first=True) ]
+
+ACCOUNT = TemplateManifest(
+    'societegenrale.BANK',
+    'hsbcpdf.societegenerale.statements:Account',
+    bank_signature=BANK_SIGNATURE,
+    type_signature=ACCOUNT_SIGNATURE,
+    statement_format=STATEMENT_FORMAT,
+    priority=20,
+    laparams=LAPARAMS
+)
+
+CARD = TemplateManifest(
+    'societegenrale.CARD',
+    'hsbcpdf.societegenerale.statements:Card',
+    bank_signature=BANK_SIGNATURE,
+    type_signature=CARD_SIGNATURE,
+    statement_format=STATEMENT_FORMAT,
+    priority=21,
+    laparams=LAPARAMS
+)
+
+ACCOUNT_V2 = TemplateManifest(
+    'societegenrale.v2.BANK',
+    'hsbcpdf.societegenerale.statementsv2:AccountV2',
+    bank_signature=BANK_SIGNATURE,
+    type_signature=ACCOUNT_SIGNATURE,
+    statement_format=STATEMENT_FORMAT_V2,
+    priority=30,
+    laparams=LAPARAMS
+)
+
+CARD_V2 = TemplateManifest(
+    'societegenrale.v2.CARD',
+    'hsbcpdf.societegenerale.statementsv2:CardV2',
+    bank_signature=BANK_SIGNATURE,
+    type_signature=CARD_SIGNATURE,
+    statement_format=STATEMENT_FORMAT_V2,
+    priority=31,
+    laparams=LAPARAMS
+)
+
+TEMPLATES = [ACCOUNT, CARD, ACCOUNT_V2, CARD_V2]
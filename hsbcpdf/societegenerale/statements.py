@@ -6,16 +6,11 @@ import logging
 import datetime
 import json
 #import matplotlib.pyplot as plt
-import pandas as pd
-from pdfquery.cache import FileCache
-import pdfquery
-import pdfminer
-import camelot
-import numpy as np
 import re
 
 from hsbcpdf.helpers.utils import *
 from hsbcpdf.helpers.accountstatement import *
+from . import manifest
 
 logger = logging.getLogger("hsbcpdf.societegenerale.statements")
 
@@ -26,11 +21,10 @@ class SocgenStatement(BaseStatement):
 
     st_bank = 'societegenrale'
 
-    _STATEMENT_FORMAT = (595, 864)
+    _STATEMENT_FORMAT = manifest.STATEMENT_FORMAT
     
-    _BANK_SIGNATURE = [
-        TextLabel("Société Générale")
-    ]
+    _BANK_SIGNATURE = manifest.BANK_SIGNATURE
+    _LAPARAMS = manifest.LAPARAMS
 
     st_type = None
     _TYPE_SIGNATURE = []
@@ -69,6 +63,14 @@ class SocgenStatement(BaseStatement):
     rows_to_remove=[]
 
     def _find_columns(self):
+        geometry = self.resolve_geometry('columns', self._discover_columns)
+        xcols = geometry['xcols']
+        self.page1_tabbox.xleft = self.pagex_tabbox.xleft = xcols[0]
+        self.page1_tabbox.xright = self.pagex_tabbox.xright = xcols[-1]
+        self.page1_tabbox.ybot = geometry['ybot']
+        self.columns = ",".join(map(str, xcols[1:-1]))
+
+    def _discover_columns(self):
         footer = self.pf_footer.querys(self.pdf, page=1)
         footer = footer[-1]
         ph_begin_sect = self.ph_begin_sect.query(self.pdf, page=1)
@@ -76,14 +78,14 @@ class SocgenStatement(BaseStatement):
         tab_vl = HLine(0, 595, 0, 0.8, 500).querys(self.pdf, page=1, before=footer, after=ph_begin_sect)
         cols = VLine(yup=tab_vl[0].yup + 1, ybot=tab_vl[1].ybot - 1, hmin=10, wmin=0, wmax=0.8).querys(self.pdf, page=1)
         xcols = sorted(list(dict.fromkeys([e.layout.x0 for e in cols])))
-        self.page1_tabbox.xleft = self.pagex_tabbox.xleft = xcols[0]
-        self.page1_tabbox.xright = self.pagex_tabbox.xright = xcols[-1]
-        self.page1_tabbox.ybot = ybot = tab_vl[1].yup
-        self.columns = ",".join(map(str, xcols[1:-1]))
+        return {'xcols': xcols, 'ybot': tab_vl[1].yup}, tab_vl[:2] + list(cols)
 
     def __init__(self, pdfpath, pdf=None):
         BaseStatement.__init__(self, pdfpath, pdf)
         self.logger = logging.getLogger('hsbcpdf.societegenrale.statements.base')
+        # table boxes are adjusted per statement: the class ones stay as defined
+        self.page1_tabbox = Bbox(orig=self.page1_tabbox)
+        self.pagex_tabbox = Bbox(orig=self.pagex_tabbox)
         self.old_balance = None
         self.new_balance = None
         self.entries = None
@@ -91,8 +93,11 @@ class SocgenStatement(BaseStatement):
 
     def _find_top(self):
         # called only if pages>1
+        self.pagex_tabbox.ytop = self.resolve_geometry('top', self._discover_top)
+
+    def _discover_top(self):
         lines = self.ph_topline.querys(self.pdf, page=2)
-        self.pagex_tabbox.ytop = lines[0].yup
+        return lines[0].yup, lines[:1]
 
     def _extract_amount(self, debit, credit):
         if not debit and not credit:
@@ -131,49 +136,44 @@ class SocgenStatement(BaseStatement):
         if end_section.page == 1:
             p1_bbox.ybot = end_section.yup - 1 if self.fl_end_sec_excluded else end_section.ybot -2
         self.logger.debug("extract first tab in {}".format(p1_bbox))
-        tp = camelot.read_pdf(
-            self.pdfpath,
-            pages="1",
-            flavor="stream",
-            table_areas=[p1_bbox.to_camellot_bbox()],
-            columns=[self.columns],
-            strip_text='*',
-            row_tol=5
-        )[0].df[1:]
-        if self.fl_skip_first_tab_raw:
-            tp = tp[1:]
-        self.logger.debug(f'First trunck of table: \n{tp.to_string()}')
-
+        jobs = [table_job(1, table_areas=[p1_bbox.to_camellot_bbox()], columns=[self.columns], strip_text='*', row_tol=5)]
         if end_section.page > 1:
             self._find_top()
-            if end_section.page > 2:
-                others = camelot.read_pdf(
-                    self.pdfpath,
-                    pages="2-{}".format(end_section.page - 1),
-                    flavor="stream",
-                    table_areas=[self.pagex_tabbox.to_camellot_bbox()],
-                    columns=[self.columns],
-                    strip_text='*',
-                    row_tol=5
-                )
-                for i in others:
-                    tp = pd.concat([tp, i.df[1 if self.fl_skip_first_tab_raw else 0:]])
-                    self.logger.debug(
-                        f'Next trunck of table [{self.pagex_tabbox.ytop} - {self.pagex_tabbox.ybot}]: \n{i.df.to_string()}')
-
             last_tab_bbox = Bbox(orig=self.pagex_tabbox, ybot=end_section.yup - 1 if self.fl_end_sec_excluded else end_section.ybot -2)
-            last_tab = camelot.read_pdf(
-                self.pdfpath,
-                pages=str(end_section.page),
-                flavor="stream",
+            jobs += page_jobs(
+                2,
+                end_section.page - 1,
+                table_areas=[self.pagex_tabbox.to_camellot_bbox()],
+                columns=[self.columns],
+                strip_text='*',
+                row_tol=5
+            )
+            jobs.append(table_job(
+                end_section.page,
                 table_areas=[last_tab_bbox.to_camellot_bbox()],
                 columns=[self.columns],
                 strip_text='*',
                 row_tol=5
-            )[0].df[1 if self.fl_skip_first_tab_raw else 0:]
-            tp = pd.concat([tp, last_tab])
-            self.logger.debug(
-                f'Last trunck of table (page:{end_section.page} in {last_tab_bbox.to_camellot_bbox()}): \n{last_tab.to_string()}')
+            ))
+        # summary only: the new balance of accounts is boxed, read by match_template
+        first, *others = self.read_tables(jobs, None if self.fl_end_new_balance else [0])
+        tp = first[0][1:]
+        if self.fl_skip_first_tab_raw:
+            tp = tp[1:]
+        self.logger.debug(f'First trunck of table: \n{tp.to_string()}')
+
+        if others:
+            *middle, last = others
+            for i in [t for tables in middle for t in tables]:
+                tp = pd.concat([tp, i[1 if self.fl_skip_first_tab_raw else 0:]])
+                self.logger.debug(
+                    f'Next trunck of table [{self.pagex_tabbox.ytop} - {self.pagex_tabbox.ybot}]: \n{i.to_string()}')
+
+            if last:
+                last_tab = last[0][1 if self.fl_skip_first_tab_raw else 0:]
+                tp = pd.concat([tp, last_tab])
+                self.logger.debug(
+                    f'Last trunck of table (page:{end_section.page} in {last_tab_bbox.to_camellot_bbox()}): \n{last_tab.to_string()}')
             self.logger.debug(tp.columns)
             self.logger.debug(tp.axes)
 
@@ -258,12 +258,12 @@ class SocgenStatement(BaseStatement):
         super().merge_all()
         self.statement['previous_balance'] = {'default': {self.currency: self.old_balance}}
         self.statement['new_balance'] = {'default': {self.currency: self.new_balance}}
-        self.statement['entries'] = self.entries.to_dict('records')
+        self.statement['entries'] = Entries.from_df(self.entries)
 
 class Account(SocgenStatement):
 
     st_type = "BANK"
-    _TYPE_SIGNATURE = [ TextLabel("RELEVÉ DE COMPTE") ]
+    _TYPE_SIGNATURE = manifest.ACCOUNT_SIGNATURE
     
     TAB_UPPER = SocgenStatement.PREVIOUS_BAL
     
@@ -311,7 +311,7 @@ class Account(SocgenStatement):
 class Card(SocgenStatement):
 
     st_type = "CARD"
-    _TYPE_SIGNATURE = [ TextLabel("RELEVÉ CARTE", first=True) ]
+    _TYPE_SIGNATURE = manifest.CARD_SIGNATURE
 
     NEW_BAL = "TOTAL NET DES OPÉRATIONS"
     
@@ -14,15 +14,31 @@ setuptools.setup(
     long_description_content_type="text/markdown",
     url="https://github.com/sinopsysHK/HsbcHkPdfScraper",
     packages=setuptools.find_packages(),
+    package_data={
+        # declarative templates
+        "hsbcpdf.societegenerale": ["*.json"],
+    },
     classifiers=[
         "Programming Language :: Python :: 3",
         "License :: OSI Approved :: MIT License",
         "Operating System :: OS Independent",
     ],
+    entry_points={
+        # additional templates register their TemplateManifest (or list of) here
+        "hsbcpdf.templates": [
+            "hsbchk = hsbcpdf.hsbchk.manifest:TEMPLATES",
+            "societegenerale = hsbcpdf.societegenerale.manifest:TEMPLATES",
+            "hsbcfr = hsbcpdf.hsbcfr.manifest:TEMPLATES",
+        ],
+    },
     install_requires=[
         "camelot-py==1.0.0",
         "six==1.17.0",
         "PyPDF2==3.0.1",
         "pyquery==2.0.1",
     ],
+    extras_require={
+        # Parquet export, Arrow transport of the pool and Entries.to_arrow/from_arrow
+        "parquet": ["pyarrow>=14.0"],
+    },
 )
\ No newline at end of file
@@ -0,0 +1,77 @@
+import pytest
+
+from pdfs import make_pdf
+
+BANK = "The Hongkong and Shanghai Banking Corporation Limited"
+
+
+@pytest.fixture
+def account_pdf(tmp_path):
+    # HSBC HK account statement header: fixed page 1 boxes and section labels over two pages
+    path = tmp_path / 'account.pdf'
+    path.write_bytes(make_pdf([
+        [
+            ('text', 60, 800, BANK),
+            ('text', 60, 760, "Financial Overview"),
+            ('text', 488, 702, "123-456789-833", 6),
+            ('text', 396, 653, "25 May 2019", 6),
+            ('text', 60, 600, "Portfolio Summary", 8),
+            ('text', 60, 400, "HSBC Premier Account Transaction History", 8),
+            ('text', 60, 380, "HKD Savings", 7.5),
+            ('line', 60, 370, 560, 370),
+        ],
+        [
+            ('text', 60, 800, BANK),
+            ('text', 60, 700, "HKD Current", 7.5),
+            ('text', 60, 300, "Total Relationship Balance", 8),
+        ],
+        [
+            ('text', 60, 700, "Important Notice", 8),
+        ],
+    ]))
+    return path
+
+
+def card_pages(amounts, month="25 May 2019", extra_pages=1, notice=True):
+    # HSBC HK credit card statement: five rows on page 1, the others and the statement balance after
+    header = [('text', 60, 800, BANK)]
+    rows = [("", "", "PREVIOUS BALANCE", "1,000.00")] \
+        + [("02MAY", "01MAY", "SHOP {}".format(i), "{:,.2f}".format(a)) for i, a in enumerate(amounts)]
+    total = 1000. + sum(amounts)
+
+    def table(rows, y):
+        items = []
+        for post, trans, desc, amount in rows:
+            items += [('text', 62, y, post), ('text', 100, y, trans), ('text', 140, y, desc), ('text', 500, y, amount)]
+            y -= 14
+        return items
+
+    pages = [header + [
+        ('text', 60, 760, "Card type"),
+        ('text', 330, 684, "4000-1234-5678-9012"),
+        ('text', 330, 638, month),
+        ('text', 480, 604, "Amount (HKD)"),
+    ] + table(rows[:5], 586)]
+    for page in range(extra_pages):
+        last = page == extra_pages - 1
+        pages.append(header + table(
+            [("Post", "Trans", "Description", "Amount")]
+            + (rows[5:] + [("", "", "STATEMENT BALANCE", "{:,.2f}".format(total))] if last else []),
+            650
+        ))
+    if notice:
+        # without the bank header: nothing on it is ever queried
+        pages.append([
+            ('text', 60, 500, "Important Notice"),
+            ('text', 60, 480, "Lorem ipsum legal text"),
+            ('line', 60, 600, 500, 600),
+        ])
+    return pages
+
+
+@pytest.fixture
+def card_pdf(tmp_path):
+    # 8 transactions over two pages, then a notice page
+    path = tmp_path / 'card.pdf'
+    path.write_bytes(make_pdf(card_pages([10.5 + i for i in range(8)])))
+    return path
@@ -0,0 +1,48 @@
+# Minimal PDF writer for synthetic statements: Helvetica text and stroked lines
+
+
+def _escape(text):
+    return text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+
+def _content(items):
+    ops = []
+    for item in items:
+        if item[0] == 'text':
+            _, x, y, text, *size = item
+            ops.append('BT /F1 {} Tf {} {} Td ({}) Tj ET'.format(size[0] if size else 8, x, y, _escape(text)))
+        elif item[0] == 'line':
+            _, x0, y0, x1, y1 = item
+            ops.append('0.5 w {} {} m {} {} l S'.format(x0, y0, x1, y1))
+    return '\n'.join(ops).encode('latin-1')
+
+
+def make_pdf(pages, size=(595, 842)):
+    """
+    PDF bytes of pages given as lists of ('text', x, y, string[, font size])
+    and ('line', x0, y0, x1, y1) items.
+    """
+    objects = [
+        b'<< /Type /Catalog /Pages 2 0 R >>',
+        None,
+        b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>',
+    ]
+    kids = []
+    for items in pages:
+        content = _content(items)
+        objects.append(b'<< /Length %d >>\nstream\n' % len(content) + content + b'\nendstream')
+        objects.append(('<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {} {}] /Resources << /Font << /F1 3 0 R >> >> '
+                        '/Contents {} 0 R >>').format(size[0], size[1], len(objects)).encode('latin-1'))
+        kids.append(len(objects))
+    objects[1] = ('<< /Type /Pages /Kids [{}] /Count {} >>'.format(
+        ' '.join('{} 0 R'.format(k) for k in kids), len(kids))).encode('latin-1')
+    out = bytearray(b'%PDF-1.4\n')
+    offsets = []
+    for i, obj in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += b'%d 0 obj\n' % i + obj + b'\nendobj\n'
+    xref = len(out)
+    out += b'xref\n0 %d\n0000000000 65535 f \n' % (len(objects) + 1)
+    out += b''.join(b'%010d 00000 n \n' % o for o in offsets)
+    out += b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (len(objects) + 1, xref)
+    return bytes(out)
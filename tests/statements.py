@@ -0,0 +1,28 @@
+import types
+
+from hsbcpdf.helpers.entries import Entries
+
+
+def make_statement(main_account, st_date, amounts, previous=0., currency='HKD', path=None, descriptions=None):
+    # stands for a processed BaseStatement: what exporters and indexes read of it
+    # entries are posted on the first of the month of the statement
+    date = st_date.replace(day=1)
+    entries = Entries()
+    for i, amount in enumerate(amounts):
+        description = descriptions[i] if descriptions else 'PAYMENT {}'.format(i)
+        entries.append('default', date, date, description, currency, amount)
+    return types.SimpleNamespace(
+        st_bank='hsbchk',
+        st_type='CARD',
+        account_number=main_account,
+        st_date=st_date,
+        pdfpath=path or '{}-{:%Y%m}.pdf'.format(main_account, st_date),
+        statement={
+            'main_account': main_account,
+            'type': 'CARD',
+            'statement_date': st_date,
+            'previous_balance': {'default': {currency: previous}},
+            'new_balance': {'default': {currency: round(previous + sum(amounts), 2)}},
+            'entries': entries,
+        }
+    )
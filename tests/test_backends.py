@@ -0,0 +1,21 @@
+import pytest
+
+from hsbcpdf.helpers import backends
+
+
+def test_backend_overrides_required():
+    class Partial(backends.PdfBackend):
+        def page_count(self):
+            return 1
+
+    with pytest.raises(TypeError):
+        Partial()
+
+
+def test_pdfium_graphics(account_pdf):
+    # the ruling of the page: pdfium gives the path points, as pdfminer
+    pdf = backends.open_document(account_pdf, backends.PDFIUM)
+    line, = pdf.graphics(0)
+    assert line.kind == 'line'
+    assert (line.x0, line.y0, line.x1, line.y1) == pytest.approx((60, 370, 560, 370))
+    assert line.linewidth == pytest.approx(0.5)
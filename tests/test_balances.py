@@ -0,0 +1,85 @@
+import datetime
+
+from hsbcpdf.helpers.balances import BalanceChain, GAP, MISMATCH
+from statements import make_statement
+
+
+def month(m, previous, amounts):
+    return make_statement('123', datetime.datetime(2019, m, 25), amounts, previous=previous)
+
+
+def kinds(issues):
+    return [(i.kind, i.before, i.after) for i in issues]
+
+
+def test_chained_statements():
+    with BalanceChain() as chain:
+        assert chain.add(month(3, 100., [10.])) == []
+        assert chain.add(month(4, 110., [-20.5])) == []
+        assert chain.add(month(5, 89.5, [0.5])) == []
+        assert chain.issues() == []
+
+
+def test_spliced_out_of_order():
+    with BalanceChain() as chain:
+        chain.add(month(3, 100., [10.]))
+        # balances don't follow over the missing month either
+        assert kinds(chain.add(month(5, 90., [1.]))) == [(MISMATCH, '2019-03-25', '2019-05-25'), (GAP, '2019-03-25', '2019-05-25')]
+        # the missing month closes the gap from both sides
+        assert chain.add(month(4, 110., [-20.])) == []
+        assert chain.issues() == []
+
+
+def test_mismatch_with_neighbours():
+    with BalanceChain() as chain:
+        chain.add(month(3, 100., [10.]))
+        chain.add(month(5, 90., [1.]))
+        issues = chain.add(month(4, 111., [-20.]))
+        assert kinds(issues) == [(MISMATCH, '2019-03-25', '2019-04-25'), (MISMATCH, '2019-04-25', '2019-05-25')]
+        assert (issues[0].expected, issues[0].found) == (110000000, 111000000)
+        assert (issues[1].expected, issues[1].found) == (91000000, 90000000)
+        assert 'expected 110.00 found 111.00' in repr(issues[0])
+        assert kinds(chain.issues()) == kinds(issues)
+        assert 'mismatch' in chain.report()
+
+
+def test_statement_added_again():
+    with BalanceChain() as chain:
+        chain.add(month(3, 100., [10.]))
+        chain.add(month(4, 110., [-20.]))
+        assert chain.add(month(4, 110., [-20.])) == []
+        assert len(chain.connection.execute('SELECT * FROM balances').fetchall()) == 2
+
+
+def test_quarterly_period(tmp_path):
+    with BalanceChain(tmp_path / 'balances.db', period_months=3) as chain:
+        chain.add(month(3, 100., [10.]))
+        assert chain.add(month(6, 110., [1.])) == []
+        assert kinds(chain.add(month(11, 111., [1.]))) == [(GAP, '2019-06-25', '2019-11-25')]
+    with BalanceChain(tmp_path / 'balances.db', period_months=3) as chain:
+        assert kinds(chain.issues('123')) == [(GAP, '2019-06-25', '2019-11-25')]
+        assert chain.issues('456') == []
+
+
+def test_three_decimal_currency():
+    with BalanceChain() as chain:
+        march = make_statement('123', datetime.datetime(2019, 3, 25), [1.005], previous=100., currency='KWD')
+        march.statement['new_balance'] = {'default': {'KWD': 101.005}}
+        chain.add(march)
+        # a fils apart: not rounded to the same cent
+        april = make_statement('123', datetime.datetime(2019, 4, 25), [], previous=101.004, currency='KWD')
+        issue, = chain.add(april)
+        assert (issue.kind, issue.expected, issue.found) == (MISMATCH, 101005000, 101004000)
+        assert '101.005' in chain.report()
+
+
+def test_incomplete_statements_skipped():
+    with BalanceChain() as chain:
+        undated = month(3, 100., [10.])
+        undated.statement['statement_date'] = None
+        unknown = month(4, 110., [1.])
+        unknown.statement['main_account'] = None
+        assert chain.add(undated) == []
+        assert chain.add(unknown) == []
+        assert chain.add(month(5, 111., [1.])) == []
+        assert len(chain.connection.execute('SELECT * FROM balances').fetchall()) == 1
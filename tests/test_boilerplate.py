@@ -0,0 +1,46 @@
+from conftest import card_pages
+from pdfs import make_pdf
+
+from hsbcpdf.helpers.boilerplate import BoilerplateFilter, page_fingerprints
+from hsbcpdf.scraper import ScraperFactory
+
+MONTHS = ["25 Mar 2019", "25 Apr 2019", "25 May 2019", "25 Jun 2019"]
+
+
+def statements(tmp_path):
+    paths = []
+    for i, month in enumerate(MONTHS):
+        path = tmp_path / '{}.pdf'.format(month[3:6])
+        path.write_bytes(make_pdf(card_pages([1.5, 2.5 + i], month=month)))
+        paths.append(path)
+    return paths
+
+
+def test_page_fingerprints(tmp_path):
+    march, april = (page_fingerprints(ScraperFactory.get_scraper(p).pdf) for p in statements(tmp_path)[:2])
+    assert len(march) == 3
+    # the notice page is the same every month
+    assert [a == b for a, b in zip(march, april)] == [False, False, True]
+
+
+def test_skip_learned_pages(tmp_path):
+    bp = BoilerplateFilter(tmp_path / 'boilerplate.json', min_count=3)
+    *learning, june = statements(tmp_path)
+    for path in learning:
+        st = ScraperFactory.get_scraper(path)
+        assert bp.prepare(st) == frozenset()
+        st.process()
+        bp.learn(bp.observe(st))
+    bp.save()
+
+    # learned by the filter of the next run
+    bp = BoilerplateFilter(tmp_path / 'boilerplate.json', min_count=3)
+    st = ScraperFactory.get_scraper(june)
+    assert bp.prepare(st) == {3}
+    st.process()
+    observation = bp.observe(st)
+    assert (observation['skipped'], observation['layout_pages'], observation['tables_skipped']) == ([3], 2, 1)
+    assert len(st.statement['entries']) == 2
+    assert st.statement['new_balance'] == {'default': {'HKD': -1007.0}}
+    bp.learn(observation)
+    assert bp.report().startswith('1 statements, 3 pages: 1 boilerplate pages skipped, 1 table jobs skipped')
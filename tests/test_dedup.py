@@ -0,0 +1,51 @@
+import datetime
+
+from hsbcpdf.helpers.dedup import DedupIndex
+from statements import make_statement
+
+MAY = datetime.datetime(2019, 5, 25)
+
+
+def test_overlapping_statements(tmp_path):
+    with DedupIndex(tmp_path / 'dedup.db') as index:
+        first = make_statement('123', MAY, [1., 2., 3.])
+        assert index.ingest(first).tolist() == [True, True, True]
+        # same entries fetched again with one more
+        again = make_statement('123', datetime.datetime(2019, 5, 26), [1., 2., 3., 4.])
+        assert index.new_entries(again).tolist() == [False, False, False, True]
+        assert index.ingest(again).tolist() == [False, False, False, True]
+    # persisted
+    with DedupIndex(tmp_path / 'dedup.db') as index:
+        assert not index.new_entries(again).any()
+
+
+def test_same_day_repeats_kept():
+    with DedupIndex() as index:
+        st = make_statement('123', MAY, [5., 5.], descriptions=['COFFEE', 'COFFEE'])
+        assert index.ingest(st).tolist() == [True, True]
+        st = make_statement('123', MAY, [5., 5., 5.], descriptions=['COFFEE', ' coffee', 'COFFEE'])
+        assert index.new_entries(st).tolist() == [False, False, True]
+
+
+def test_corrected_reissue():
+    with DedupIndex() as index:
+        st = make_statement('123', MAY, [1., 2.], previous=10.)
+        assert not index.has_statement(st)
+        index.ingest(st)
+        assert index.has_statement(st)
+        assert index.is_duplicate(make_statement('123', MAY, [1., 2.], previous=10.))
+        # same account and date, corrected balances: not a duplicate, though known from its header
+        fixed = make_statement('123', MAY, [1., 2.5], previous=10.)
+        assert index.has_statement(fixed)
+        assert not index.is_duplicate(fixed)
+        assert index.ingest(fixed).tolist() == [False, True]
+        assert not index.is_duplicate(make_statement('456', MAY, [1., 2.], previous=10.))
+
+
+def test_many_fingerprints():
+    # more fingerprints than one lookup query takes
+    with DedupIndex() as index:
+        amounts = [float(i) for i in range(DedupIndex.CHUNK * 2 + 10)]
+        index.ingest(make_statement('123', MAY, amounts[:DedupIndex.CHUNK + 5]))
+        mask = index.new_entries(make_statement('123', MAY, amounts))
+        assert mask.sum() == len(amounts) - DedupIndex.CHUNK - 5
@@ -0,0 +1,114 @@
+import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from hsbcpdf.helpers.entries import Entries
+
+
+def make_df(amounts, descriptions=None):
+    n = len(amounts)
+    return pd.DataFrame({
+        'post_date': [datetime.datetime(2019, 5, 1 + i) for i in range(n)],
+        'transaction_date': [datetime.datetime(2019, 4, 28 + i % 3) for i in range(n)],
+        'description': descriptions or ['PAYMENT {}'.format(i) for i in range(n)],
+        'amount': amounts,
+        'currency': ['HKD'] * (n - 1) + ['USD'],
+        'account': 'default',
+    })
+
+
+def test_from_df_to_df():
+    df = make_df([12.34, -0.1, 1000000.99])
+    entries = Entries.from_df(df)
+    assert len(entries) == 3
+    assert entries.scale == 100
+    assert entries.minor_amounts.tolist() == [1234, -10, 100000099]
+    res = entries.to_df()
+    assert list(res.columns) == Entries.COLUMNS
+    assert res['amount'].tolist() == [12.34, -0.1, 1000000.99]
+    assert res['currency'].tolist() == ['HKD', 'HKD', 'USD']
+    assert res['description'].tolist() == df['description'].tolist()
+    assert res['post_date'].tolist() == df['post_date'].tolist()
+
+
+def test_to_df_records_dtypes():
+    entries = Entries.from_df(make_df([1., 2.]))
+    df = entries.to_df(compact=False)
+    for c in ('account', 'description', 'currency'):
+        assert df[c].dtype == object
+    for c in Entries.DATES:
+        assert df[c].dtype == 'datetime64[ns]'
+    assert isinstance(entries.to_df()['currency'].dtype, pd.CategoricalDtype)
+
+
+def test_more_decimals():
+    entries = Entries.from_df(make_df([1.5, 7.8125, -0.001]))
+    assert entries.scale == 10000
+    assert entries.minor_amounts.tolist() == [15000, 78125, -10]
+    assert entries.column('amount').tolist() == [1.5, 7.8125, -0.001]
+
+
+def test_append_rescales():
+    entries = Entries()
+    entries.append('default', datetime.datetime(2019, 5, 1), None, 'A', 'HKD', 12.34)
+    assert entries.minor_amounts.tolist() == [1234]
+    entries.append('default', datetime.datetime(2019, 5, 2), None, 'B', 'KWD', 0.125)
+    assert entries.minor_amounts.tolist() == [12340, 125]
+    assert entries.scale == 1000
+    assert [r['amount'] for r in entries.records()] == [12.34, 0.125]
+
+
+def test_too_many_decimals():
+    with pytest.raises(ValueError):
+        Entries.from_df(make_df([1 / 3]))
+
+
+def test_concat_take():
+    a = Entries.from_df(make_df([1.25, 2.5]))
+    b = Entries.from_df(make_df([0.125]))
+    res = Entries.concat([a, b])
+    assert res.scale == 1000
+    assert res.column('amount').tolist() == [1.25, 2.5, 0.125]
+    assert res.strings('currency').tolist() == ['HKD', 'USD', 'USD']
+    part = res.take(np.array([False, True, True]))
+    assert part.column('amount').tolist() == [2.5, 0.125]
+    assert part.column('description').tolist() == ['PAYMENT 1', 'PAYMENT 0']
+
+
+def test_arrow_round_trip():
+    entries = Entries.from_df(make_df([12.34, -0.005, 3.]))
+    entries._codes['account'][1] = -1
+    table = entries.to_arrow()
+    res = Entries.from_arrow(table)
+    assert res.scale == entries.scale
+    assert res.minor_amounts.tolist() == entries.minor_amounts.tolist()
+    assert list(res.records()) == list(entries.records())
+    assert res.to_arrow() is table
+
+
+def test_raw_arrow_round_trip():
+    entries = Entries.from_df(make_df([12.34, -0.005, 3.]))
+    entries._codes['account'][1] = -1
+    entries._dates['transaction_date'][2] = np.datetime64('NaT')
+    table = entries.to_arrow(raw=True)
+    assert table.column('amount').type == 'int64'
+    res = Entries.from_arrow(table)
+    assert res.scale == entries.scale
+    # minor units are wrapped as they are, not converted
+    assert np.shares_memory(res.minor_amounts, table.column('amount').chunk(0).to_numpy())
+    assert list(res.records()) == list(entries.records())
+    assert res.to_arrow(raw=True) is table
+    assert res.to_arrow().column('amount').to_pylist() == [12.34, -0.005, 3.]
+
+
+def test_iterate_statement_entries(card_pdf):
+    from hsbcpdf.scraper import ScraperFactory
+
+    st = ScraperFactory.get_scraper(card_pdf).process()
+    rows = [e for e in st.statement['entries']]
+    assert [e['description'] for e in rows] == ['SHOP {}'.format(i) for i in range(8)]
+    assert [e['amount'] for e in rows] == [-(10.5 + i) for i in range(8)]
+    assert rows[0]['post_date'] == datetime.datetime(2019, 5, 2)
+    assert list(st.statement['entries']) == list(st.statement['entries'].records())
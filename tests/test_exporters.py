@@ -0,0 +1,87 @@
+import datetime
+import pickle
+import sqlite3
+
+import pytest
+
+from hsbcpdf.helpers import pool
+from hsbcpdf.helpers.exporters import SqliteExporter
+from hsbcpdf.scraper import ScraperFactory
+from statements import make_statement
+
+DATE = datetime.datetime(2019, 5, 25)
+
+
+def rows(connection):
+    return connection.execute("SELECT row, amount FROM entries ORDER BY row").fetchall()
+
+
+def test_sqlite_rewrite_with_fewer_entries(tmp_path):
+    with SqliteExporter.open(tmp_path / 'st.db') as exporter:
+        exporter.write(make_statement('123', DATE, [1., 2., 3.]))
+        exporter.flush()
+        exporter.write(make_statement('123', DATE, [4., 5.]))
+    connection = sqlite3.connect(str(tmp_path / 'st.db'))
+    assert rows(connection) == [(0, 4.), (1, 5.)]
+    assert connection.execute("SELECT entries FROM statements").fetchall() == [(2,)]
+
+
+def test_sqlite_same_statement_twice_in_batch(tmp_path):
+    with SqliteExporter.open(tmp_path / 'st.db') as exporter:
+        exporter.write(make_statement('123', DATE, [1., 2., 3.]))
+        exporter.write(make_statement('123', DATE, [4., 5.]))
+        exporter.write(make_statement('456', DATE, [6.]))
+    connection = sqlite3.connect(str(tmp_path / 'st.db'))
+    assert connection.execute(
+        "SELECT main_account, row, amount FROM entries ORDER BY main_account, row").fetchall() \
+        == [('123', 0, 4.), ('123', 1, 5.), ('456', 0, 6.)]
+    assert connection.execute("SELECT main_account, new_balance FROM balances ORDER BY 1").fetchall() \
+        == [('123', 9.), ('456', 6.)]
+
+
+def test_sqlite_statement_without_date(tmp_path):
+    with SqliteExporter.open(tmp_path / 'st.db') as exporter:
+        st = make_statement('123', DATE, [1.])
+        st.statement['statement_date'] = None
+        assert exporter.write(st) == 0
+        exporter.write(make_statement('456', DATE, [2.]))
+    connection = sqlite3.connect(str(tmp_path / 'st.db'))
+    assert connection.execute("SELECT main_account FROM statements").fetchall() == [('456',)]
+
+
+def test_sqlite_caller_connection(tmp_path):
+    # the caller's transaction mode is kept, batches nest in its open transaction
+    connection = sqlite3.connect(str(tmp_path / 'st.db'))
+    connection.execute("CREATE TABLE log (msg TEXT)")
+    exporter = SqliteExporter(connection)
+    connection.execute("INSERT INTO log VALUES ('import')")
+    exporter.write(make_statement('123', DATE, [1., 2.]))
+    exporter.close()
+    assert connection.isolation_level == ''
+    assert connection.in_transaction
+    connection.rollback()
+    assert connection.execute("SELECT count(*) FROM entries").fetchone() == (0,)
+    exporter.write(make_statement('123', DATE, [1., 2.]))
+    exporter.flush()
+    assert not connection.in_transaction
+    assert rows(connection) == [(0, 1.), (1, 2.)]
+
+
+def test_sqlite_summary_only_keeps_entries(tmp_path, card_pdf):
+    with SqliteExporter.open(tmp_path / 'st.db') as exporter:
+        exporter.write(ScraperFactory.get_scraper(card_pdf).process())
+        exporter.flush()
+        # as it comes back from a pool worker
+        st = pickle.loads(pickle.dumps(ScraperFactory.get_scraper(card_pdf).process(summary_only=True)))
+        assert st.summary_only and len(st.statement['entries']) == 0
+        exporter.write(st)
+    connection = sqlite3.connect(str(tmp_path / 'st.db'))
+    assert len(rows(connection)) == 8
+    assert connection.execute("SELECT entries FROM statements").fetchall() == [(8,)]
+    assert connection.execute("SELECT previous_balance, new_balance FROM balances").fetchall() == [(-1000., -1112.)]
+
+
+def test_summary_only_rejected_with_sqlite(tmp_path, card_pdf):
+    with pytest.raises(SystemExit):
+        pool.main(['--summary-only', '--sqlite', str(tmp_path / 'st.db'), str(card_pdf)])
+    assert not (tmp_path / 'st.db').exists()
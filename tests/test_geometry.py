@@ -0,0 +1,36 @@
+from hsbcpdf.helpers.geometry import GeometryCache, geometry_cache, set_geometry_cache
+from hsbcpdf.hsbcfr import statements as hsbcfr
+from hsbcpdf.societegenerale import statements as socgen
+
+
+def test_no_cache_by_default(account_pdf):
+    assert geometry_cache() is None
+    st = socgen.Account(account_pdf)
+    calls = []
+
+    def discover():
+        calls.append(1)
+        return {'ybot': 100}, []
+    assert st.resolve_geometry('columns', discover) == {'ybot': 100}
+    assert st.resolve_geometry('columns', discover) == {'ybot': 100}
+    assert len(calls) == 2
+    assert geometry_cache() is None
+
+
+def test_set_cache(account_pdf):
+    previous = set_geometry_cache(GeometryCache())
+    try:
+        st = socgen.Account(account_pdf)
+        assert st.resolve_geometry('columns', lambda: ({'ybot': 100}, [])) == {'ybot': 100}
+        assert geometry_cache().stats()['miss'] == 1
+    finally:
+        set_geometry_cache(previous)
+
+
+def test_table_boxes_per_statement(account_pdf):
+    for cls in (socgen.Account, hsbcfr.Account):
+        default = cls.page1_tabbox.xleft, cls.pagex_tabbox.ytop
+        st = cls(account_pdf)
+        st.page1_tabbox.xleft = st.pagex_tabbox.ytop = 1
+        assert (cls.page1_tabbox.xleft, cls.pagex_tabbox.ytop) == default
+        assert cls(account_pdf).page1_tabbox.xleft == default[0]
@@ -0,0 +1,68 @@
+import os
+import time
+
+import pytest
+
+from hsbcpdf.helpers import pool
+from hsbcpdf.helpers.pool import ARROW, BUDGET, OK, WorkerPool, process_file
+
+
+def test_submit_sources(tmp_path, card_pdf):
+    with WorkerPool(1) as workers:
+        with open(card_pdf, 'rb') as f:
+            stream = workers.submit(f)
+        results = [workers.submit(card_pdf).result(), workers.submit(card_pdf.read_bytes()).result(), stream.result()]
+        missing = workers.submit(tmp_path / 'missing.pdf').result()
+        with pytest.raises(TypeError):
+            workers.submit(object())
+    assert [r.status for r in results] == [OK] * 3
+    assert [r.path for r in results] == [str(card_pdf), '<bytes>', str(card_pdf)]
+    assert {r.statement.account_number for r in results} == {'4000-1234-5678-9012'}
+    assert missing.status == 'error' and 'not found' in missing.error
+
+
+def slow_process_file(pdfpath, capture=None, known=None, progress=None, *args):
+    # stands for a file on which pdfminer spins and balloons: runs forked, patched in the parent
+    if str(pdfpath).endswith('slow.pdf'):
+        progress(None, 'layout')
+        ballast = b'x' * (512 << 20)
+        time.sleep(60)
+    return process_file(pdfpath, capture, known, progress, *args)
+
+
+@pytest.mark.parametrize('budget', ['time_budget', 'memory_budget'])
+def test_budget_kill(monkeypatch, tmp_path, card_pdf, budget):
+    slow = tmp_path / 'slow.pdf'
+    slow.write_bytes(card_pdf.read_bytes())
+    monkeypatch.setattr(pool, 'process_file', slow_process_file)
+    # forked workers start with the pages of this process
+    limit = 2. if budget == 'time_budget' else pool.rss() + (256 << 20)
+    with WorkerPool(1, start_method='fork', **{budget: limit}) as workers:
+        killed = workers.submit(slow).result()
+        res = workers.submit(card_pdf).result()
+    assert (killed.status, killed.stage) == (BUDGET, 'layout')
+    assert killed.error.startswith(budget.replace('_', ' '))
+    # the rest of the batch goes on in a new worker
+    assert workers.killed == 1
+    assert res.ok and res.pid != killed.pid
+
+
+def hsbcpdf_blocks():
+    return {n for n in os.listdir('/dev/shm') if n.startswith('hsbcpdf-')}
+
+
+@pytest.mark.skipif(not os.path.isdir('/dev/shm'), reason='no shared memory file system')
+def test_killed_after_sharing_entries(monkeypatch, card_pdf):
+    share_entries = pool.share_entries
+
+    def stalled(res, announce=None):
+        # the block is created and announced, the result never sent
+        share_entries(res, announce)
+        time.sleep(60)
+
+    before = hsbcpdf_blocks()
+    monkeypatch.setattr(pool, 'share_entries', stalled)
+    with WorkerPool(1, start_method='fork', transport=ARROW, time_budget=5.) as workers:
+        res = workers.submit(card_pdf).result()
+    assert res.status == BUDGET
+    assert hsbcpdf_blocks() == before
@@ -0,0 +1,81 @@
+import json
+import pathlib
+import pstats
+import tracemalloc
+
+from hsbcpdf.helpers import backends, utils
+from hsbcpdf.helpers.pool import process_file
+from hsbcpdf.helpers.profiling import CaptureHook, QueryProfiler, outliers_table
+from hsbcpdf.helpers.registry import registry
+from hsbcpdf.scraper import ScraperFactory
+
+
+def test_statement_queries(tmp_path, account_pdf):
+    pdf = backends.open_document(account_pdf, backends.PDFMINER, backends.LINES_LAPARAMS)
+    st = registry.get_scraper(account_pdf, pdf)
+    label = type(st).ph_sections['HKDCurrent']
+    profiler = QueryProfiler()
+    with profiler.statement(account_pdf) as frames:
+        label.querys(st.pdf)
+        label.querys(st.pdf)
+        assert st.ph_acc_number.query(st.pdf) == '123-456789-833'
+    # recording stops with the statement
+    assert utils._profiler is None
+    st.ph_st_date.query(st.pdf)
+    assert [(f['query'], f['cached'], f['results']) for f in frames] == [
+        ('TextLabel.querys', False, 1), ('TextLabel.querys', True, 1), ('TextBox.query', False, 1)]
+    assert frames[0]['selectors'] == ['LTTextLineHorizontal:contains("HKD Current")']
+    assert frames[0]['candidates'] == 1
+    assert profiler.name(frames[2]) == 'Account.ph_acc_number'
+    profiler.write_report(account_pdf, tmp_path / 'report.txt')
+    report = (tmp_path / 'report.txt').read_text().splitlines()
+    assert len(report) == 5
+    assert any(l.strip() == 'LTTextLineHorizontal:contains("HKD Current")' for l in report)
+
+
+def test_hotspots_across_statements(tmp_path, card_pdf):
+    profiler = QueryProfiler()
+    for key in ('may', 'june'):
+        with profiler.statement(key):
+            ScraperFactory.get_scraper(card_pdf).process()
+    spots = dict(profiler.hotspots())
+    assert spots[('Card.ph_acc_number', 'TextBox.query')]['calls'] == 2
+    assert spots[('Card._query_plan', 'QueryPlan.resolve')]['calls'] == 2
+    profiler.write_hotspots(tmp_path / 'hotspots.txt')
+    assert 'Card.ph_acc_number' in (tmp_path / 'hotspots.txt').read_text()
+
+
+def test_capture_outliers(tmp_path, card_pdf):
+    hook = CaptureHook(tmp_path / 'captures', max_seconds=0.)
+    other = tmp_path / 'other' / 'card.pdf'
+    other.parent.mkdir()
+    other.write_bytes(card_pdf.read_bytes())
+    results = [process_file(p, capture=hook) for p in (card_pdf, other)]
+    assert all(r.ok for r in results)
+    # same named files don't overwrite each other
+    captures = [c for r in results for c in r.captures]
+    assert len(set(captures)) == 4
+    prof, info = results[0].captures
+    assert pathlib.Path(prof).name.startswith('card-hsbchk.Card-')
+    pstats.Stats(prof)
+    info = json.loads(pathlib.Path(info).read_text())
+    assert (info['path'], info['status']) == (str(card_pdf), 'ok')
+    assert info['peak_memory'] is None and 'allocations' not in info
+    assert results[0].path in outliers_table(results)
+
+
+def test_capture_memory(tmp_path, card_pdf):
+    hook = CaptureHook(tmp_path, max_memory=10 ** 12)
+    res = process_file(card_pdf, capture=hook)
+    assert res.peak_memory > 0 and res.captures is None
+    assert not tracemalloc.is_tracing()
+    # tracing started by someone else is left running
+    tracemalloc.start()
+    try:
+        hook.max_memory = 0
+        res = process_file(card_pdf, capture=hook)
+        assert tracemalloc.is_tracing()
+    finally:
+        tracemalloc.stop()
+    info = json.loads(pathlib.Path(res.captures[1]).read_text())
+    assert info['peak_memory'] == res.peak_memory and info['allocations']
@@ -0,0 +1,133 @@
+import json
+import threading
+import types
+import urllib.error
+import urllib.request
+from concurrent.futures import Future
+
+import pytest
+
+from hsbcpdf.helpers.pool import BUDGET, OK, FileResult
+from hsbcpdf.helpers.sources import BytesSource
+from hsbcpdf.server import ScraperServer
+
+
+class StubPool:
+    # stands for a WorkerPool: the result of each request is given by outcome(pdfpath)
+    def __init__(self, outcome):
+        self.outcome = outcome
+        self.submitted = []
+
+    def submit(self, pdfpath):
+        self.submitted.append(pdfpath)
+        future = Future()
+        future.set_result(self.outcome(pdfpath))
+        return future
+
+    def shutdown(self, wait=True):
+        pass
+
+
+def processed(pdfpath):
+    st = types.SimpleNamespace(get_json=lambda: json.dumps({'main_account': '4000-1234-5678-9012'}))
+    return FileResult(str(pdfpath), OK, statement=st, elapsed=0.5)
+
+
+@pytest.fixture
+def serve():
+    servers = []
+
+    def serve(outcome, max_pending=None):
+        pool = StubPool(outcome)
+        server = ScraperServer(('127.0.0.1', 0), workers=1, max_pending=max_pending, pool=pool)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return 'http://127.0.0.1:{}'.format(server.server_address[1]), pool
+
+    yield serve
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def request(url, data=None, content_type='application/pdf'):
+    req = urllib.request.Request(url, data, {'Content-Type': content_type} if data is not None else {})
+    try:
+        with urllib.request.urlopen(req, timeout=10) as res:
+            return res.status, res.read().decode()
+    except urllib.error.HTTPError as e:
+        return e.code, e.read().decode()
+
+
+def test_scrape_upload_and_path(serve, card_pdf):
+    url, pool = serve(processed)
+    code, body = request(url + '/scrape', card_pdf.read_bytes())
+    assert (code, json.loads(body)) == (200, {'main_account': '4000-1234-5678-9012'})
+    upload = pool.submitted[-1]
+    assert isinstance(upload, BytesSource) and upload.data() == card_pdf.read_bytes()
+    code, body = request(url + '/scrape', json.dumps({'path': str(card_pdf)}).encode(), 'application/json')
+    assert code == 200
+    assert pool.submitted[-1] == str(card_pdf)
+    code, body = request(url + '/scrape', json.dumps({'path': str(card_pdf) + '.missing'}).encode(), 'application/json')
+    assert code == 404
+    assert len(pool.submitted) == 2
+
+
+def test_scrape_failures(serve):
+    url, _ = serve(lambda p: FileResult(str(p), BUDGET, error='time budget of 60.0s exceeded in tables'))
+    code, body = request(url + '/scrape', b'%PDF')
+    assert (code, json.loads(body)) == (504, {'error': 'time budget of 60.0s exceeded in tables'})
+    url, _ = serve(lambda p: FileResult(str(p), 'template', error='TemplateException: no account number'))
+    code, body = request(url + '/scrape', b'%PDF')
+    assert (code, json.loads(body)) == (422, {'error': 'TemplateException: no account number', 'category': 'template'})
+
+
+def test_busy(serve):
+    started, release = threading.Event(), threading.Event()
+
+    def blocking(pdfpath):
+        started.set()
+        release.wait(10)
+        return processed(pdfpath)
+
+    url, _ = serve(blocking, max_pending=1)
+    first = []
+    thread = threading.Thread(target=lambda: first.append(request(url + '/scrape', b'%PDF')))
+    thread.start()
+    assert started.wait(10)
+    # the only slot is taken by the first request
+    assert request(url + '/scrape', b'%PDF')[0] == 503
+    release.set()
+    thread.join(10)
+    assert first[0][0] == 200
+    assert request(url + '/scrape', b'%PDF')[0] == 200
+
+
+def test_health_and_metrics(serve):
+    url, _ = serve(processed)
+    code, body = request(url + '/health')
+    assert (code, json.loads(body)) == (200, {'status': 'ok', 'workers': 1})
+    request(url + '/scrape', b'%PDF')
+    request(url + '/scrape', b'')
+    code, body = request(url + '/metrics')
+    assert code == 200
+    lines = body.splitlines()
+    assert 'hsbcpdf_in_flight 0' in lines
+    assert 'hsbcpdf_requests_total{status="ok"} 1' in lines
+    assert 'hsbcpdf_requests_total{status="bad_request"} 1' in lines
+    assert 'hsbcpdf_processing_seconds_sum 0.500' in lines
+    assert 'hsbcpdf_processing_seconds_count 1' in lines
+
+
+def test_scrape_with_workers(card_pdf):
+    server = ScraperServer(('127.0.0.1', 0), workers=1)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        code, body = request('http://127.0.0.1:{}/scrape'.format(server.server_address[1]), card_pdf.read_bytes())
+    finally:
+        server.shutdown()
+        server.server_close()
+    assert code == 200
+    st = json.loads(body)
+    assert (st['main_account'], st['statement_date']) == ('4000-1234-5678-9012', '25/05/2019')
+    assert len(st['entries']) == 8
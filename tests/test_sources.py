@@ -0,0 +1,103 @@
+import io
+import os
+import pickle
+import tarfile
+import zipfile
+
+import pytest
+
+from hsbcpdf.helpers.registry import registry
+from hsbcpdf.helpers.sources import ArchiveMember, BytesSource, FileSource, PdfSource, as_source, is_archive, iter_archive, source_name
+
+DATA = b'%PDF-1.4 not really a document'
+
+
+def test_source_overrides_required():
+    class Named(PdfSource):
+        name = 'named.pdf'
+
+        def open(self):
+            return io.BytesIO(DATA)
+
+    with pytest.raises(TypeError):
+        Named()
+
+
+def test_bytes_source_spool():
+    source = BytesSource(DATA, 'upload.pdf')
+    assert source.open().read() == DATA
+    path = source.path()
+    assert source.path() == path
+    with open(path, 'rb') as f:
+        assert f.read() == DATA
+    source.close()
+    assert not os.path.exists(path)
+    # spooled again on request
+    path = source.path()
+    del source
+    assert not os.path.exists(path)
+
+
+def test_bytes_source_pickle():
+    source = BytesSource(DATA, 'upload.pdf')
+    source.path()
+    res = pickle.loads(pickle.dumps(source))
+    assert (res.name, res.data()) == ('upload.pdf', DATA)
+    # the temporary file stays with the original
+    assert res.path() != source.path()
+    source.close()
+    assert os.path.exists(res.path())
+    res.close()
+
+
+@pytest.mark.parametrize('suffix', ['.zip', '.tar.gz'])
+def test_archive_members(tmp_path, suffix):
+    path = tmp_path / ('statements' + suffix)
+    files = {'2019/a.pdf': DATA, '2019/b.PDF': DATA + b'b', 'notes.txt': b'skipped'}
+    if suffix == '.zip':
+        with zipfile.ZipFile(path, 'w') as z:
+            z.writestr('2019/', '')
+            for name, data in files.items():
+                z.writestr(name, data)
+    else:
+        with tarfile.open(path, 'w:gz') as t:
+            for name, data in files.items():
+                info = tarfile.TarInfo(name)
+                info.size = len(data)
+                t.addfile(info, io.BytesIO(data))
+    assert is_archive(path)
+    members = list(iter_archive(path))
+    assert [m.member for m in members] == ['2019/a.pdf', '2019/b.PDF']
+    assert source_name(members[0]) == '{}!2019/a.pdf'.format(path)
+    # only the reference crosses process boundaries, the member is read again
+    res = pickle.loads(pickle.dumps(members[1]))
+    assert res._data is None
+    assert res.data() == DATA + b'b'
+    assert res.open().read() == DATA + b'b'
+    assert members[0].data() == DATA
+
+
+def test_as_source(tmp_path):
+    path = tmp_path / 'a.pdf'
+    path.write_bytes(DATA)
+    assert isinstance(as_source(str(path)), FileSource)
+    assert as_source(path).open().read() == DATA
+    with open(path, 'rb') as f:
+        source = as_source(f)
+    assert (source.name, source.data()) == (str(path), DATA)
+    assert source_name(DATA) == '<bytes>'
+    assert as_source(memoryview(DATA)).data() == DATA
+    member = ArchiveMember(path, 'x.pdf')
+    assert as_source(member) is member
+    with pytest.raises(TypeError):
+        as_source(1)
+
+
+def test_template_from_archive(tmp_path, account_pdf):
+    path = tmp_path / 'statements.zip'
+    with zipfile.ZipFile(path, 'w') as z:
+        z.write(account_pdf, 'may.pdf')
+    member, = iter_archive(path)
+    st = registry.get_scraper(member)
+    assert type(st).__name__ == 'Account'
+    assert st.ph_acc_number.query(st.pdf) == '123-456789-833'
@@ -0,0 +1,17 @@
+from conftest import card_pages
+from pdfs import make_pdf
+
+from hsbcpdf.scraper import ScraperFactory
+
+
+def test_summary_only_process(tmp_path):
+    # page 1, two pages of column headers, the remaining transactions, then the notice page
+    path = tmp_path / 'card.pdf'
+    path.write_bytes(make_pdf(card_pages([10.5 + i for i in range(8)], extra_pages=3)))
+    full = ScraperFactory.get_scraper(path).process()
+    summary = ScraperFactory.get_scraper(path).process(summary_only=True)
+    assert len(full.statement['entries']) == 8 and len(summary.statement['entries']) == 0
+    for key in ('main_account', 'statement_date', 'previous_balance', 'new_balance'):
+        assert summary.statement[key] == full.statement[key]
+    # first page, the notice page and the last one with amounts
+    assert (full.table_jobs, summary.table_jobs) == (5, 3)
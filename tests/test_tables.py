@@ -0,0 +1,45 @@
+import types
+
+import pytest
+
+from hsbcpdf.helpers import tables
+from hsbcpdf.helpers.tables import MIN_PARALLEL_JOBS, page_jobs, read_tables
+
+AREA = dict(table_areas=['40,700,560,400'], columns=['90,130,450'])
+
+
+def frames(results):
+    return [[t.values.tolist() for t in page] for page in results]
+
+
+@pytest.fixture
+def sequential_only(monkeypatch):
+    def no_pool(workers):
+        raise AssertionError('jobs dispatched to processes')
+    monkeypatch.setattr(tables, '_get_executor', no_pool)
+
+
+def test_parallel_in_page_order(card_pdf):
+    jobs = page_jobs(1, 3, **AREA)
+    expected = read_tables(card_pdf, jobs, workers=1)
+    assert len(jobs) >= MIN_PARALLEL_JOBS
+    assert frames(read_tables(card_pdf, jobs, workers=2)) == frames(expected)
+    assert tables._executor is not None
+    assert [len(page) for page in expected] == [1, 1, 1]
+    assert expected[1][0].iloc[-1, 2] == 'STATEMENT BALANCE'
+
+
+def test_few_jobs_sequential(card_pdf, sequential_only):
+    jobs = page_jobs(1, MIN_PARALLEL_JOBS - 1, **AREA)
+    assert [len(page) for page in read_tables(card_pdf, jobs, workers=4)] == [1, 1]
+
+
+def test_sequential_in_daemon_process(monkeypatch, card_pdf, sequential_only):
+    # WorkerPool workers are daemons, which can't have children
+    monkeypatch.setattr(tables.multiprocessing, 'current_process', lambda: types.SimpleNamespace(daemon=True))
+    assert [len(page) for page in read_tables(card_pdf, page_jobs(1, 3, **AREA), workers=4)] == [1, 1, 1]
+
+
+def test_skipped_pages(card_pdf, sequential_only):
+    # no camelot run for boilerplate pages, nor process pool under the threshold
+    assert [len(page) for page in read_tables(card_pdf, page_jobs(1, 3, **AREA), workers=4, skip_pages={3})] == [1, 1, 0]
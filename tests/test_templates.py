@@ -0,0 +1,89 @@
+import datetime
+
+from pyquery import PyQuery
+
+from hsbcpdf.helpers import backends
+from hsbcpdf.helpers.registry import registry
+from hsbcpdf.helpers.utils import TextLabel, VLine, query_cache
+from hsbcpdf.hsbchk.statements import Card
+
+
+def open_pdfminer(path):
+    return backends.open_document(path, backends.PDFMINER, backends.LINES_LAPARAMS)
+
+
+def test_header_without_layout(account_pdf):
+    pdf = open_pdfminer(account_pdf)
+    st = registry.get_scraper(account_pdf, pdf)
+    assert type(st).__name__ == 'Account'
+    # probing and header boxes read the text of single pages only
+    st.query_plan().resolve(st.pdf, labels=False)
+    assert st.ph_acc_number.query(st.pdf) == '123-456789-833'
+    assert st.ph_st_date.query(st.pdf) == '25 May 2019'
+    assert not backends.layout_loaded(st.pdf)
+    st.query_plan().resolve(st.pdf)
+    assert backends.layout_loaded(st.pdf)
+
+
+def _values(res):
+    if isinstance(res, list):
+        return [(s.page, round(s.yup, 3), round(s.ybot, 3)) for s in res]
+    return res
+
+
+def test_query_plan_matches_queries(account_pdf):
+    cls = type(registry.get_scraper(account_pdf))
+    plan = cls.query_plan()
+    assert len(plan.boxes[1]) == 2
+    assert len(plan.labels) == 4
+
+    planned = open_pdfminer(account_pdf)
+    plan.resolve(planned)
+    direct = open_pdfminer(account_pdf)
+    for ph in plan.boxes[1]:
+        assert ph.query(planned) == ph.query(direct)
+    for label in plan.labels:
+        assert _values(label.querys(planned)) == _values(label.querys(direct))
+    # every placeholder came from the plan sweep
+    stats = query_cache(planned).stats()
+    assert stats['TextBox.query'] == (2, 0)
+    assert stats['TextLabel.querys'] == (4, 0)
+    assert [s.page for s in cls.ph_sections['HKDCurrent'].querys(planned)] == [2]
+    assert cls.ph_fend_section.query(planned).page == 3
+
+
+def test_signature_probe_without_layout(account_pdf):
+    pdf = open_pdfminer(account_pdf)
+    assert TextLabel("Important Notice").exists(pdf)
+    assert not TextLabel("Important Notice", height=20).exists(pdf)
+    assert not TextLabel("Card type").exists(pdf)
+    assert not backends.layout_loaded(pdf)
+
+
+def test_card_header_backends(card_pdf):
+    # header boxes, labels and currency of the card template read the same on both backends
+    headers = []
+    for backend in (backends.PDFMINER, backends.PDFIUM):
+        st = Card(card_pdf, backends.open_document(card_pdf, backend, backends.LINES_LAPARAMS))
+        st.match_template()
+        headers.append((st.account_number, st.st_date, st.currency, st.nb_pages))
+    assert headers[0] == headers[1]
+    assert headers[0][:3] == ('4000-1234-5678-9012', datetime.datetime(2019, 5, 25), 'HKD')
+
+
+def test_memoized_vline_keeps_pyquery(account_pdf):
+    pdf = open_pdfminer(account_pdf)
+    line = VLine(700, 600)
+    assert isinstance(line.querys(pdf, page=1), PyQuery)
+    # cache hit
+    assert isinstance(line.querys(pdf, page=1), PyQuery)
+    assert query_cache(pdf).stats()['VLine.querys'] == (1, 1)
+
+
+def test_unkeyed_arguments_not_memoized(account_pdf):
+    pdf = open_pdfminer(account_pdf)
+    label = TextLabel("Important Notice")
+    assert len(label.querys(pdf, page=object())) == 1
+    assert len(label.querys(pdf, page=object())) == 1
+    assert query_cache(pdf).stats()['TextLabel.querys'] == (0, 2)
+    assert TextLabel.querys.memo_key(label, pdf, page=object()) is None